@@ -0,0 +1,490 @@
+"""Benchmarks for Tanish's Camera App.
+
+Everything runs on a synthetic frame source and generated photo libraries
+in a temp folder, so no camera and no existing photos are needed.
+
+Run:
+    python benchmarks.py processing
+    python benchmarks.py encoding
+    python benchmarks.py suite --sizes 1000 10000 50000 --output results.json
+    python benchmarks.py suite --baseline results.json   # flag regressions
+    python benchmarks.py suite --repeat 5                # best of 5 runs
+
+All recorded numbers are "lower is better" (milliseconds or bytes). Each
+benchmark runs --repeat times and keeps the best value per number, and a
+change only counts as a regression past both the relative threshold and
+an absolute floor, so scheduler noise on sub-millisecond numbers doesn't
+fail a run.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cv2
+from PIL import Image
+
+from cameraa_app import (
+    CameraCore, ENCODE_PROFILES, FrameProcessor, SyntheticSource, VirtualGallery, build_exif,
+    group_duplicates, signed_hash
+)
+
+
+def pil_bytes(img):
+    # Pillow keeps pixels in its own memory (4 bytes per RGB pixel) that
+    # tracemalloc can't see, so PIL images are counted by their buffer size
+    return img.width * img.height * 4
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    # Samples the resident set size on a thread while the block runs, so
+    # memory that is freed again before the end still counts
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.before = 0
+        self.peak = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.stopping.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self.before = self.peak = rss_bytes()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+    @property
+    def growth(self):
+        return self.peak - self.before
+
+
+def summarize(prefix, samples_ms):
+    samples = sorted(samples_ms)
+    return {
+        f"{prefix}.mean_ms": statistics.fmean(samples),
+        f"{prefix}.p50_ms": samples[len(samples) // 2],
+        f"{prefix}.p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+# --- Frame processing: old PIL path vs the NumPy path ---
+
+def legacy_process(frame):
+    # The original path: convert, copy into PIL, then resize with LANCZOS
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    img = Image.fromarray(frame_rgb)
+    resized = img.resize((800, 600), Image.Resampling.LANCZOS)
+    return resized, pil_bytes(img) + pil_bytes(resized)
+
+
+def numpy_process(processor, frame):
+    rgbx = processor.process(frame)
+    # The zero-copy view handed to the encoder owns no pixels of its own
+    return FrameProcessor.to_image(rgbx), 0
+
+
+def run(name, process, frames):
+    # Warm up once so one-time buffer allocations don't count
+    process(frames[0])
+
+    total_ms = 0.0
+    total_bytes = 0
+    tracemalloc.start()
+    for frame in frames:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result, untracked = process(frame)
+        total_ms += (time.perf_counter() - start) * 1000
+        total_bytes += tracemalloc.get_traced_memory()[1] - before + untracked
+        del result
+    tracemalloc.stop()
+
+    print(f"{name:<16} {total_ms / len(frames):8.2f} ms/frame {total_bytes / len(frames) / 1024:10.1f} KB/frame")
+    return total_ms / len(frames), total_bytes / len(frames)
+
+
+def bench_processing(count=100, width=1280, height=720):
+    source = SyntheticSource(width, height, fps=0)
+    frames = [source.read()[1] for _ in range(count)]
+    processor = FrameProcessor()
+
+    print(f"Frame processing, {count} frames of {width}x{height} -> 800x600")
+    legacy_ms, legacy_bytes = run("legacy (PIL)", legacy_process, frames)
+    numpy_ms, numpy_bytes = run("numpy", lambda frame: numpy_process(processor, frame), frames)
+    return {
+        "processing.legacy.ms_per_frame": legacy_ms,
+        "processing.legacy.bytes_per_frame": legacy_bytes,
+        "processing.numpy.ms_per_frame": numpy_ms,
+        "processing.numpy.bytes_per_frame": numpy_bytes,
+    }
+
+
+# --- Encode profiles: time and size per photo ---
+
+def bench_encoding(count=20):
+    source = SyntheticSource(fps=0)
+    frames = [source.read()[1] for _ in range(count)]
+    processor = FrameProcessor()
+    exif = build_exif(datetime.datetime.now(), 400, 2.8, 250)
+
+    print(f"Encoding, {count} frames per profile")
+    results = {}
+    for name, profile in ENCODE_PROFILES.items():
+        if profile.full_resolution:
+            images = [Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) for frame in frames]
+        else:
+            images = [FrameProcessor.to_image(processor.process(frame).copy()) for frame in frames]
+        profile.encode(images[0], exif)
+
+        samples = []
+        sizes = []
+        for image in images:
+            start = time.perf_counter()
+            sizes.append(len(profile.encode(image, exif)))
+            samples.append((time.perf_counter() - start) * 1000)
+        results.update(summarize(f"encoding.{name}", samples))
+        results[f"encoding.{name}.bytes"] = statistics.fmean(sizes)
+        print(f"{name:<10} {statistics.fmean(samples):8.2f} ms {statistics.fmean(sizes) / 1024:10.1f} KB")
+    return results
+
+
+# --- Capture: end to end and per stage ---
+
+def bench_capture(root, shots=50):
+    # A 30 fps source, like a webcam; an unpaced one would hog a core
+    core = CameraCore(
+        SyntheticSource(),
+        os.path.join(root, "photos"),
+        os.path.join(root, "recycle_bin"),
+        os.path.join(root, "thumbnails"),
+        log=lambda message: None
+    )
+    core.start()
+
+    end_to_end = []
+    stages = {}
+    for _ in range(shots):
+        start = time.perf_counter()
+        core.capture(400, 2.8, 250)
+        jobs = []
+        while not jobs:
+            jobs = core.poll_results()
+            time.sleep(0.0005)
+        end_to_end.append((time.perf_counter() - start) * 1000)
+        for stage, ms in jobs[0].timings.items():
+            stages.setdefault(stage, []).append(ms)
+    core.close()
+
+    results = summarize("capture.end_to_end", end_to_end)
+    for stage, samples in stages.items():
+        results.update(summarize(f"capture.stage.{stage}", samples))
+    print(f"Capture, {shots} shots: {results['capture.end_to_end.p50_ms']:.1f} ms p50 end to end")
+    return results
+
+
+# --- Photo libraries ---
+
+def make_library(root, size):
+    # One real JPEG, hard-linked `size` times: every path is its own photo
+    # for the app, but the disk only holds it once
+    core = CameraCore(
+        SyntheticSource(fps=0),
+        os.path.join(root, "photos"),
+        os.path.join(root, "recycle_bin"),
+        os.path.join(root, "thumbnails"),
+        log=lambda message: None
+    )
+    frame = SyntheticSource(fps=0).read()[1]
+    template = os.path.join(root, "template.jpg")
+    image = FrameProcessor.to_image(FrameProcessor().process(frame)).convert("RGB")
+    image.save(template, format="JPEG", exif=build_exif(datetime.datetime.now(), 400, 2.8, 250))
+
+    # A shot a minute, so the library spreads over days like a real one
+    start_time = datetime.datetime(2020, 1, 1)
+    for i in range(size):
+        taken = start_time + datetime.timedelta(minutes=i)
+        name = f"IMG_{taken.strftime('%Y-%m-%d_%H-%M-%S')}-000_{i % 10000:04d}.jpg"
+        path = os.path.join(core.photo_dir, name)
+        try:
+            os.link(template, path)
+        except OSError:
+            shutil.copyfile(template, path)
+    return core
+
+
+def bench_library(root, size, columns=3, visible_rows=2, bulk=500):
+    results = {}
+    core = make_library(root, size)
+
+    start = time.perf_counter()
+    core.maintenance()
+    results[f"library.{size}.reconcile_ms"] = (time.perf_counter() - start) * 1000
+
+    # Next launch: nothing changed, only the folder listings are compared
+    start = time.perf_counter()
+    core.maintenance()
+    results[f"library.{size}.reconcile_warm_ms"] = (time.perf_counter() - start) * 1000
+
+    # The flat folder moved into YYYY/MM/DD folders, then a launch after that
+    start = time.perf_counter()
+    core.migrate_layout()
+    results[f"library.{size}.migrate_layout_ms"] = (time.perf_counter() - start) * 1000
+    core.maintenance()
+    start = time.perf_counter()
+    core.maintenance()
+    results[f"library.{size}.reconcile_sharded_warm_ms"] = (time.perf_counter() - start) * 1000
+
+    # Perceptual hashes for every photo, then a run with nothing new to hash
+    start = time.perf_counter()
+    core.index_hashes()
+    results[f"library.{size}.index_hashes_ms"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    core.index_hashes()
+    results[f"library.{size}.index_hashes_warm_ms"] = (time.perf_counter() - start) * 1000
+
+    # Time to first paint: what the gallery does before the first rows show up
+    visible = columns * (visible_rows + 2 * VirtualGallery.OVERSCAN_ROWS)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        total = core.count()
+        paths = core.page(False, 0, VirtualGallery.PAGE_SIZE)
+        first_thumbs = [core.thumbnails.get(path) for path in paths[:visible]]
+        results[f"library.{size}.gallery_first_paint_ms"] = (time.perf_counter() - start) * 1000
+
+        # Time to full load: every thumbnail decoded and held, like the old gallery did
+        start = time.perf_counter()
+        all_thumbs = []
+        for offset in range(0, total, VirtualGallery.PAGE_SIZE):
+            for path in core.page(False, offset, VirtualGallery.PAGE_SIZE):
+                all_thumbs.append(core.thumbnails.get(path))
+        results[f"library.{size}.gallery_full_load_ms"] = (time.perf_counter() - start) * 1000
+        del first_thumbs, all_thumbs
+    results[f"library.{size}.thumbnail_refs_peak_rss_bytes"] = max(0, rss.growth)
+
+    # Warm cache: the second opening only reads small cached thumbnails
+    start = time.perf_counter()
+    for path in core.page(False, 0, visible):
+        core.thumbnails.get(path)
+    results[f"library.{size}.gallery_first_paint_warm_ms"] = (time.perf_counter() - start) * 1000
+
+    # Bulk trash operations. These purge photos for good, so the one-by-one
+    # and the batch timings each get their own half of the library
+    paths = core.page(False, 0, min(bulk, max(1, total // 2)))
+    if paths:
+        start = time.perf_counter()
+        trashed = [core.delete_photo(path) for path in paths]
+        results[f"library.{size}.delete_photo_ms_each"] = (time.perf_counter() - start) * 1000 / len(paths)
+
+        start = time.perf_counter()
+        restored = [core.restore_photo(path) for path in trashed]
+        results[f"library.{size}.restore_photo_ms_each"] = (time.perf_counter() - start) * 1000 / len(paths)
+
+        trashed = [core.delete_photo(path) for path in restored]
+        start = time.perf_counter()
+        for path in trashed:
+            core.delete_permanently(path)
+        results[f"library.{size}.delete_permanently_ms_each"] = (time.perf_counter() - start) * 1000 / len(paths)
+
+    # The same three operations as one batch job each
+    def timed_batch(name, start_operation):
+        start = time.perf_counter()
+        start_operation().done.wait()
+        results[f"library.{size}.batch_{name}_ms_each"] = (time.perf_counter() - start) * 1000 / len(paths)
+
+    paths = core.page(False, 0, min(bulk, core.count()))
+    if paths:
+        timed_batch("delete_photo", lambda: core.delete_photos(paths))
+        timed_batch("restore_photo", core.restore_all)
+        core.delete_photos(paths).done.wait()
+        timed_batch("delete_permanently", core.empty_recycle_bin)
+
+    core.close()
+    print(
+        f"Library of {size}: first paint {results[f'library.{size}.gallery_first_paint_ms']:.0f} ms, "
+        f"full load {results[f'library.{size}.gallery_full_load_ms']:.0f} ms, "
+        f"delete {results.get(f'library.{size}.delete_photo_ms_each', 0):.2f} ms/photo"
+    )
+    return results
+
+
+def bench_reencode(root, size=200, profile="webp", max_size=640):
+    # Whole library through the process pool; per core is per CPU-second of the workers
+    core = make_library(root, size)
+    core.maintenance()
+    summary, errors = core.reencode(profile, max_size)
+    core.close()
+    results = {
+        "reencode.wall_ms_per_photo": summary["seconds"] * 1000 / size,
+        "reencode.cpu_ms_per_photo": summary["cpu_seconds"] * 1000 / size,
+        "reencode.new_bytes_per_photo": summary["new_bytes"] / size,
+    }
+    print(
+        f"Re-encode of {size} photos to {profile}: {size / summary['seconds']:.1f} photos/s on "
+        f"{summary['workers']} processes, {size / summary['cpu_seconds']:.1f} photos/s per core, "
+        f"{summary['old_bytes'] / size / 1024:.1f} -> {summary['new_bytes'] / size / 1024:.1f} KB, "
+        f"{len(errors)} errors"
+    )
+    return results
+
+
+def bench_duplicates(size, max_distance=6):
+    # The generated library is one photo many times over, so grouping runs
+    # on made-up hashes instead: mostly unique photos plus small bursts,
+    # every copy a few bits off
+    rng = random.Random(size)
+    rows = []
+    while len(rows) < size:
+        ahash, dhash = rng.getrandbits(64), rng.getrandbits(64)
+        for _ in range(rng.choice((1, 1, 1, 2, 5))):
+            rows.append({
+                "ahash": signed_hash(ahash ^ (1 << rng.randrange(64))),
+                "dhash": signed_hash(dhash ^ (1 << rng.randrange(64))),
+                "size": rng.randrange(10000, 100000),
+                "taken_at": rng.random(),
+            })
+    start = time.perf_counter()
+    groups = group_duplicates(rows[:size], max_distance)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Duplicate grouping of {size} photos: {elapsed_ms:.0f} ms, {len(groups)} groups")
+
+    # Worst case for the index: one long burst of a single scene, every
+    # shot at most three bits off, so all of them share chunk keys
+    ahash, dhash = rng.getrandbits(64), rng.getrandbits(64)
+    rows = [
+        {
+            "ahash": signed_hash(ahash ^ sum(1 << rng.randrange(64) for _ in range(rng.randrange(4)))),
+            "dhash": signed_hash(dhash ^ sum(1 << rng.randrange(64) for _ in range(rng.randrange(4)))),
+            "size": rng.randrange(10000, 100000),
+            "taken_at": rng.random(),
+        }
+        for _ in range(size)
+    ]
+    start = time.perf_counter()
+    groups = group_duplicates(rows, max_distance)
+    clustered_ms = (time.perf_counter() - start) * 1000
+    print(f"Duplicate grouping of a {size} photo burst: {clustered_ms:.0f} ms, {len(groups)} groups")
+    return {f"duplicates.{size}.group_ms": elapsed_ms, f"duplicates.{size}.burst_group_ms": clustered_ms}
+
+
+def bench_suite(sizes):
+    results = bench_processing()
+    results.update(bench_encoding())
+    with tempfile.TemporaryDirectory() as root:
+        results.update(bench_capture(root))
+    with tempfile.TemporaryDirectory() as root:
+        results.update(bench_reencode(root))
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            results.update(bench_library(root, size))
+        results.update(bench_duplicates(size))
+    return results
+
+
+# --- Saving and comparing runs ---
+
+def best_of(runs):
+    # Lower is better everywhere, so the minimum is the run least disturbed by noise
+    best = {}
+    for results in runs:
+        for key, value in results.items():
+            best[key] = min(value, best.get(key, value))
+    return best
+
+
+def compare(results, baseline, threshold, min_delta_ms=1.0, min_delta_bytes=64 * 1024):
+    # A regression is growth past the threshold that is also bigger than
+    # the absolute floor for its unit
+    regressions = []
+    for key, value in sorted(results.items()):
+        old = baseline.get(key)
+        if not old or old <= 0:
+            continue
+        floor = min_delta_bytes if "bytes" in key else min_delta_ms
+        if value - old < floor:
+            continue
+        change = (value - old) / old
+        if change > threshold:
+            regressions.append((key, old, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=("processing", "encoding", "suite"), nargs="?", default="suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="photo library sizes to generate")
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="flag anything slower/bigger than the baseline by this fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    parser.add_argument("--min-delta-bytes", type=int, default=64 * 1024,
+                        help="ignore growth smaller than this many bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="run everything this often and keep the best")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(max(1, args.repeat)):
+        if args.benchmark == "processing":
+            runs.append(bench_processing())
+        elif args.benchmark == "encoding":
+            runs.append(bench_encoding())
+        else:
+            runs.append(bench_suite(args.sizes))
+    results = best_of(runs)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": len(runs),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms, args.min_delta_bytes)
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old:.2f} -> {new:.2f} (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
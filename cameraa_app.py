@@ -1,34 +1,3666 @@
-import tkinter as tk
-from tkinter import ttk, scrolledtext, Toplevel
 import os
 import datetime
 import math
 import shutil  # --- NEW: Import shutil for moving files ---
+import threading  # --- NEW: Background frame grabber ---
+import time
+import queue  # --- NEW: Hands capture jobs between threads ---
+import io
+import re
+import errno
+import hashlib
+import json
+import sqlite3  # --- NEW: Photo catalog ---
+import struct
+import sys
+import argparse  # --- NEW: Headless command line ---
+import cProfile  # --- NEW: Profiling toggle ---
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from bisect import bisect_left
+import itertools
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+try:
+    import fcntl  # --- NEW: Journal lock shared between processes (not on Windows) ---
+except ImportError:
+    fcntl = None
+
+# --- NEW: Import the Pillow library ---
+# You must install this first: pip install Pillow
+try:
+    from PIL import Image, ImageDraw, ImageFont
+    from PIL.TiffImagePlugin import IFDRational
+except ImportError:
+    print("Error: The 'Pillow' library is required to run this app.")
+    print("Please install it by running: pip install Pillow")
+    exit()
+
+# --- NEW: Import the OpenCV library ---
+# You must install this first: pip install opencv-python
+try:
+    import cv2
+except ImportError:
+    print("Error: The 'opencv-python' library is required to run this app.")
+    print("Please install it by running: pip install opencv-python")
+    exit()
+
+# NumPy ships with opencv-python
+import numpy as np
+
+# --- NEW: Tk is only needed for the window, headless capture works without it ---
+try:
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, Toplevel, messagebox
+    from PIL import ImageTk
+except ImportError:
+    tk = None
+
+
+# --- NEW: Metrics ---
+# Counters and latency histograms for the hot paths. Histograms count every
+# sample into fixed buckets (exported as a Prometheus histogram, so scrapes
+# can be aggregated and turned into quantiles server-side) and also keep the
+# last few thousand samples for the live p50/p95/p99 in the stats panel.
+class Histogram:
+    # Upper bounds in seconds, 0.5 ms up to 30 s; anything slower lands in +Inf
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.buckets[bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def cumulative(self):
+        # (le, count) pairs as Prometheus wants them, ending with +Inf
+        running = 0
+        for bound, count in zip(self.BUCKETS + ("+Inf",), self.buckets):
+            running += count
+            yield bound, running
+
+    def quantile(self, q):
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Metrics:
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self, name):
+        # (p50, p95, p99) in milliseconds, for the stats panel
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                return None
+            return tuple(histogram.quantile(q) * 1000 for q in self.QUANTILES)
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f"{name}_sum {histogram.total:.6f}")
+                lines.append(f"{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Written to a temp file first so a scraper never reads half of it
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+# --- NEW: On-demand profiling ---
+# Toggles cProfile and tracemalloc together. Up to Python 3.11 cProfile
+# only sees the thread it is enabled on, so every thread that wraps its
+# work in section() gets its own profile and stop() merges them into one
+# report, together with the biggest allocation sites. From 3.12 cProfile
+# sits on sys.monitoring instead: one profile started with start() sees
+# every thread, and a second one can't be enabled at all.
+class Profiler:
+    PROCESS_WIDE = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.profiles = []
+        self.local = threading.local()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.profiles = []
+            if self.PROCESS_WIDE:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                    self.profiles.append(profile)
+                except ValueError:
+                    pass  # some other profiler is active, tracemalloc still runs
+            self.running = True
+        tracemalloc.start()
+
+    @contextmanager
+    def section(self):
+        if not self.running or self.PROCESS_WIDE:
+            yield
+            return
+        profile = getattr(self.local, "profile", None)
+        if profile is None or profile not in self.profiles:
+            profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool holds the hook: run this part unprofiled
+            yield
+            return
+        if profile is not getattr(self.local, "profile", None):
+            self.local.profile = profile
+            with self.lock:
+                self.profiles.append(profile)
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def stop(self, report_path):
+        with self.lock:
+            if not self.running:
+                return None
+            self.running = False
+            profiles, self.profiles = self.profiles, []
+            if self.PROCESS_WIDE:
+                for profile in profiles:
+                    profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        stream = io.StringIO()
+        threads = "all threads" if self.PROCESS_WIDE else f"{len(profiles)} threads"
+        stream.write(f"=== cProfile: top 30 by cumulative time ({threads}) ===\n")
+        if profiles:
+            stats = pstats.Stats(profiles[0], stream=stream)
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats("cumulative").print_stats(30)
+        stream.write("\n=== tracemalloc: top 20 allocation sites ===\n")
+        for stat in snapshot.statistics("lineno")[:20]:
+            stream.write(f"{stat}\n")
+        with open(report_path, "w") as f:
+            f.write(stream.getvalue())
+        return report_path
+
+
+profiler = Profiler()
+
+
+# --- NEW: Frame sources ---
+# Every source looks like a cv2.VideoCapture: isOpened(), read() and release().
+# That way the capture session can run on a real webcam, a video file,
+# a folder of images or a synthetic generator (handy with no camera attached).
+
+class SyntheticSource:
+    def __init__(self, width=1280, height=720, fps=30):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_index = 0
+        self.next_time = time.perf_counter()
+        # A static colour gradient, a moving bar is drawn on top of it per frame
+        xs = np.linspace(0, 255, width, dtype=np.uint8)
+        ys = np.linspace(0, 255, height, dtype=np.uint8)
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[:, :, 0] = xs[np.newaxis, :]
+        self.background[:, :, 1] = ys[:, np.newaxis]
+        self.background[:, :, 2] = 128
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        # Pace ourselves like a real camera would
+        if self.fps:
+            delay = self.next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + 1 / self.fps, time.perf_counter())
+
+        frame = self.background.copy()
+        bar_x = (self.frame_index * 8) % self.width
+        frame[:, bar_x:bar_x + 16] = 255
+        self.frame_index += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class ImageDirectorySource:
+    def __init__(self, directory, fps=30):
+        self.fps = fps
+        self.next_time = time.perf_counter()
+        self.paths = sorted(
+            os.path.join(directory, f) for f in os.listdir(directory)
+            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))
+        )
+        self.index = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if not self.paths:
+            return False, None
+        if self.fps:
+            delay = self.next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + 1 / self.fps, time.perf_counter())
+
+        # Loop over the folder forever, like a camera that never stops
+        frame = cv2.imread(self.paths[self.index % len(self.paths)])
+        self.index += 1
+        return frame is not None, frame
+
+    def release(self):
+        pass
+
+
+class VideoFileSource:
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30
+        self.next_time = time.perf_counter()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + 1 / self.fps, time.perf_counter())
+
+        ret, frame = self.cap.read()
+        if not ret:
+            # Rewind at the end of the file
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+def make_frame_source(spec):
+    # "0", "1", ... -> webcam index, "synthetic" -> generator,
+    # a folder -> image directory, anything else -> video file
+    spec = str(spec)
+    if spec.isdigit():
+        return cv2.VideoCapture(int(spec))
+    if spec == "synthetic":
+        return SyntheticSource()
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec)
+    return VideoFileSource(spec)
+
+
+# --- NEW: Long-lived capture session ---
+# Opens the device once and keeps a grabber thread reading from it, so the
+# newest frame is always waiting in a small ring buffer when we want a photo.
+class CaptureSession:
+    def __init__(self, source="0", buffer_size=4):
+        self.source_spec = source
+        self.source = None
+        self.frames = deque(maxlen=buffer_size)  # (sequence, timestamp, frame)
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.error = None
+        # Pipeline workers, bursts and recordings may all try to open the device at once
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        if self.running:
+            return True
+        with self.start_lock:
+            if self.running:
+                return True
+
+            # Accept an already built source object as well as a spec string
+            if isinstance(self.source_spec, (str, int)):
+                self.source = make_frame_source(self.source_spec)
+            else:
+                self.source = self.source_spec
+
+            if not self.source.isOpened():
+                self.error = f"Could not open frame source: {self.source_spec}"
+                self.source.release()
+                self.source = None
+                return False
+
+            self.error = None
+            self.running = True
+            self.thread = threading.Thread(target=self._grab_loop, name="frame-grabber", daemon=True)
+            self.thread.start()
+            return True
+
+    def _grab_loop(self):
+        while self.running:
+            ret, frame = self.source.read()
+            if not ret:
+                self.error = "Could not read frame from source."
+                time.sleep(0.05)
+                continue
+
+            with self.condition:
+                self.sequence += 1
+                self.frames.append((self.sequence, time.time(), frame))
+                self.condition.notify_all()
+
+    def latest(self, timeout=2.0):
+        # Return the newest (sequence, timestamp, frame), waiting for the first one if needed
+        with self.condition:
+            if not self.frames:
+                self.condition.wait_for(lambda: self.frames or not self.running, timeout)
+            if not self.frames:
+                return None
+            return self.frames[-1]
+
+    def wait_for_frame(self, after_sequence, timeout=2.0):
+        # Block until a frame newer than after_sequence has been grabbed
+        with self.condition:
+            self.condition.wait_for(
+                lambda: (self.frames and self.frames[-1][0] > after_sequence) or not self.running,
+                timeout
+            )
+            if self.frames and self.frames[-1][0] > after_sequence:
+                return self.frames[-1]
+            return None
+
+    def stop(self):
+        with self.start_lock:
+            self.running = False
+            with self.condition:
+                self.condition.notify_all()
+            if self.thread is not None:
+                self.thread.join(timeout=2.0)
+                self.thread = None
+            if self.source is not None:
+                self.source.release()
+                self.source = None
+            self.frames.clear()
+
+
+# --- NEW: Crash-safe file writes ---
+# Data goes to a temp file next to the target, is fsync'ed, then renamed
+# over the target, so after a crash there is either the old file or the
+# complete new one. Leftover *.tmp files are cleaned up at startup.
+def fsync_dir(directory):
+    # Makes a rename durable; directories can't be opened on Windows
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(os.path.dirname(path))
+
+
+# --- NEW: Date-sharded storage layout ---
+# Photos live in <root>/YYYY/MM/DD/ instead of one huge flat folder, with
+# the date taken from the IMG_/VID_ file name (or the file's mtime for
+# anything else). Photos from before the sharding stay where they are
+# until `migrate-layout` moves them; everything reads both layouts.
+SHARD_DATE = re.compile(r"_(\d{4})-(\d{2})-(\d{2})_")
+
+
+def shard_for(name, path=None):
+    # ("2026", "10", "17") for IMG_2026-10-17_..., else the date of `path`
+    match = SHARD_DATE.search(name)
+    if match:
+        return match.groups()
+    try:
+        when = datetime.datetime.fromtimestamp(os.stat(path).st_mtime)
+    except (TypeError, OSError):
+        when = datetime.datetime.now()
+    return f"{when:%Y}", f"{when:%m}", f"{when:%d}"
+
+
+def storage_key(name, path=None):
+    # The same layout for remote copies, always with "/"
+    return "/".join(shard_for(name, path) + (name,))
+
+
+class PhotoStore:
+    def __init__(self, photo_dir, recycle_bin_dir):
+        self.roots = {False: photo_dir, True: recycle_bin_dir}
+        self.made = set()
+        self.lock = threading.Lock()
+
+    def path_for(self, name, trashed=False, path=None):
+        # Where `name` belongs; creates the day folder the first time
+        directory = os.path.join(self.roots[trashed], *shard_for(name, path))
+        if directory not in self.made:
+            os.makedirs(directory, exist_ok=True)
+            with self.lock:
+                self.made.add(directory)
+        return os.path.join(directory, name)
+
+
+# --- NEW: On-disk thumbnail cache ---
+# Thumbnails are small JPEGs named after a hash of path + mtime + size, so a
+# changed or replaced photo simply misses the cache. Moving a photo between
+# the gallery and the recycle bin carries its thumbnail along.
+class ThumbnailCache:
+    def __init__(self, cache_dir, size=(200, 200)):
+        self.cache_dir = cache_dir
+        self.size = size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _entry_path(self, path, stat=None):
+        stat = stat or os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def _store(self, entry_path, thumb):
+        # Write to a temp name first so a reader never sees half a file
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        thumb.convert("RGB").save(tmp_path, format="JPEG", quality=85)
+        os.replace(tmp_path, entry_path)
+
+    def get(self, path):
+        entry_path = self._entry_path(path)
+        try:
+            with metrics.timer("camera_thumbnail_decode_seconds"):
+                thumb = Image.open(entry_path)
+                thumb.load()
+            metrics.inc("camera_thumbnail_cache_hits_total")
+            return thumb
+        except (FileNotFoundError, OSError):
+            pass
+
+        # Cache miss: let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        metrics.inc("camera_thumbnail_cache_misses_total")
+        with metrics.timer("camera_thumbnail_decode_seconds"):
+            if media_kind(path) == "video":
+                img = read_poster_frame(path)
+            else:
+                img = open_image(path)
+                img.draft("RGB", self.size)
+            img.thumbnail(self.size)
+        self._store(entry_path, img)
+        return img
+
+    def put(self, path, image):
+        # Called right after a capture, while the full image is still in memory
+        thumb = image.copy()
+        thumb.thumbnail(self.size)
+        entry_path = self._entry_path(path)
+        self._store(entry_path, thumb)
+        return entry_path
+
+    def entry_for(self, path):
+        # Remember where a thumbnail lives before its photo gets moved
+        try:
+            return self._entry_path(path)
+        except FileNotFoundError:
+            return None
+
+    def moved(self, old_entry, new_path):
+        # Returns where the thumbnail lives now (None if there was none)
+        if old_entry is None or not os.path.exists(old_entry):
+            return None
+        try:
+            new_entry = self._entry_path(new_path)
+            os.replace(old_entry, new_entry)
+            return new_entry
+        except OSError:
+            self.discard_entry(old_entry)
+            return None
+
+    def discard_entry(self, entry):
+        if entry is not None and os.path.exists(entry):
+            os.remove(entry)
+
+    def remove_orphans(self, referenced, min_age=60):
+        # Deletes thumbnails no catalog row points at. Only orphans get
+        # stat'ed, and recent ones are kept: a capture may still be on its way.
+        referenced = {os.path.basename(path) for path in referenced if path}
+        cutoff = time.time() - min_age
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name in referenced:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+# --- NEW: What kind of file a library entry is ---
+# .npy files are raw frames saved by the archival encode profile
+PHOTO_EXTENSIONS = ('.jpg', '.webp', '.png', '.npy')
+VIDEO_EXTENSIONS = ('.avi', '.mp4')
+
+
+def media_kind(name):
+    lower = name.lower()
+    if lower.endswith(PHOTO_EXTENSIONS):
+        return "photo"
+    if lower.endswith(VIDEO_EXTENSIONS):
+        return "video"
+    return None
+
+
+def open_image(path):
+    # Pillow opens every photo format except the raw .npy archives
+    if path.lower().endswith(".npy"):
+        return Image.fromarray(np.load(path))
+    return Image.open(path)
+
+
+def read_poster_frame(video_path):
+    # First frame of a recording as an RGB image, for its thumbnail
+    capture = cv2.VideoCapture(video_path)
+    try:
+        ret, frame = capture.read()
+    finally:
+        capture.release()
+    if not ret:
+        raise OSError(f"Could not read a frame from {video_path}")
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+# --- NEW: Screen-sized decodes for the viewer ---
+# Kept in memory between clicks, least recently used first out, bounded by
+# the bytes the decoded pixels take rather than by a number of images.
+class DecodedImageCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.images = OrderedDict()  # (path, mtime_ns) -> PIL image
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path):
+        # A re-saved file gets a new key, so a stale decode is never shown
+        return path, os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def _size(image):
+        return image.width * image.height * len(image.getbands())
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.images
+
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        size = self._size(image)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.images.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self.images[key] = image
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.bytes -= self._size(evicted)
+
+
+def fit_size(size, max_size):
+    # Largest size with the same aspect ratio that fits, never enlarged
+    scale = min(max_size[0] / size[0], max_size[1] / size[1], 1.0)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def decode_for_screen(path, max_size):
+    # Full quality: Pillow picks a draft scale that keeps LANCZOS exact
+    if media_kind(path) == "video":
+        img = read_poster_frame(path)
+    else:
+        img = open_image(path)
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    img.load()
+    return img
+
+
+def quick_decode(path, max_size):
+    # The first paint. Returns (image, final): a JPEG at least twice the
+    # screen size is decoded at 1/2..1/4..1/8 scale by the JPEG decoder and
+    # resized with a cheap filter; a smaller one decodes as fast in full
+    # quality, so that is final. Anything else gives (None, False).
+    if not path.lower().endswith(".jpg"):
+        return None, False
+    img = Image.open(path)
+    if img.format != "JPEG":
+        return None, False
+    target = fit_size(img.size, max_size)
+    if img.size[0] < 2 * target[0]:
+        return decode_for_screen(path, max_size), True
+    img.draft("RGB", target)
+    return img.resize(target, Image.Resampling.BILINEAR), False
+
+
+# --- NEW: Perceptual hashes ---
+# Two 64-bit fingerprints per photo that survive resizing and re-encoding:
+# aHash (is each of 8x8 cells brighter than the average) and dHash (is each
+# cell of a 9x8 grid brighter than its left neighbour). Near-identical
+# frames differ in only a few bits, counted as the Hamming distance.
+# SQLite integers are signed, so hashes are stored as signed 64-bit values.
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def image_hashes(image):
+    # (ahash, dhash) of a PIL image in any mode
+    factor = min(image.width, image.height) // 64
+    if factor > 1:
+        image = image.reduce(factor)  # box average, much cheaper on the big image
+    gray = image.convert("L")
+    cells = np.asarray(gray.resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    dhash = np.packbits(cells[:, 1:] > cells[:, :-1])
+    cells = np.asarray(gray.resize((8, 8), Image.Resampling.BOX), dtype=np.float32)
+    ahash = np.packbits(cells > cells.mean())
+    return int.from_bytes(ahash.tobytes(), "big"), int.from_bytes(dhash.tobytes(), "big")
+
+
+def signed_hash(value):
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hash_files(paths):
+    # Runs in a worker process: [(path, ahash, dhash, error)]. A JPEG is
+    # decoded in grayscale at 1/8 scale, which is all the hashes look at.
+    results = []
+    for path in paths:
+        try:
+            img = open_image(path)
+            img.draft("L", (64, 64))
+            ahash, dhash = image_hashes(img)
+            results.append((path, signed_hash(ahash), signed_hash(dhash), None))
+        except Exception as e:
+            results.append((path, None, None, str(e)))
+    return results
+
+
+def popcount64(values):
+    # Set bits of each value in a uint64 array
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return np.bitwise_count(values)
+    return POPCOUNT_8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+# Multi-index hashing: each 64-bit hash is split into four 16-bit chunks,
+# with a sorted table per chunk. Two hashes within distance d differ in at
+# most d // 4 bits of some chunk (pigeonhole), so only hashes that match
+# in a chunk after flipping that many bits get compared at all. Every
+# photo is looked up at once (where each 16-bit key's run starts is a
+# table of its own) instead of one by one, and the candidate pairs are checked and joined (union-find) a block at a
+# time, so memory stays bounded however many candidates there are.
+# A burst of near-identical shots puts thousands of photos under one chunk
+# key, which would be millions of pairs. Runs longer than BUCKET_LIMIT are
+# joined group by group instead: each photo is only compared with the
+# parts of the run that aren't in its group yet, so a burst costs about
+# one comparison per shot.
+class HashIndex:
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    BLOCK = 1 << 20  # candidate pairs checked in one go
+    BUCKET_LIMIT = 64
+    SLICE = 64  # run members compared per step when looking for any match
+
+    def __init__(self, hashes):
+        # hashes: one row per photo; the first column is indexed, and two
+        # photos are close when every column is within max_distance
+        self.hashes = np.asarray(hashes, dtype=np.uint64).reshape(len(hashes), -1)
+        self.parent = np.arange(len(self.hashes))
+        self.tables = []  # per chunk: (keys, order, where each key's run starts in order)
+        for chunk in range(self.CHUNKS):
+            shift = np.uint64(chunk * self.CHUNK_BITS)
+            keys = ((self.hashes[:, 0] >> shift) & np.uint64((1 << self.CHUNK_BITS) - 1)).astype(np.int64)
+            order = np.argsort(keys, kind="stable")
+            starts = np.searchsorted(keys[order], np.arange((1 << self.CHUNK_BITS) + 1))
+            self.tables.append((keys, order, starts))
+
+    def _close(self, first, second, max_distance):
+        distance = popcount64((self.hashes[first] ^ self.hashes[second]).reshape(-1))
+        return distance.reshape(len(first), self.hashes.shape[1]).max(axis=1) <= max_distance
+
+    def _find(self, items):
+        roots = self.parent[items]
+        while True:
+            up = self.parent[roots]
+            if np.array_equal(up, roots):
+                break
+            roots = up
+        self.parent[items] = roots
+        return roots
+
+    def _link(self, item, others):
+        # Everything in `others` joins the group of `item`
+        root = self._find(np.array([item]))[0]
+        roots = self._find(others)
+        self.parent[roots[roots != root]] = root
+
+    def _union_pairs(self, first, second):
+        roots_a, roots_b = self._find(first), self._find(second)
+        differ = roots_a != roots_b
+        if not differ.any():
+            return
+        # The same two groups are often linked by many pairs
+        count = len(self.parent)
+        pairs = np.unique(roots_a[differ] * count + roots_b[differ])
+        parent = self.parent
+        for a, b in zip((pairs // count).tolist(), (pairs % count).tolist()):
+            while parent[a] != a:
+                a = parent[a]
+            while parent[b] != b:
+                b = parent[b]
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    def _join_runs(self, order, left, matches, max_distance):
+        # Every photo against its run of matching keys, BLOCK pairs at a time
+        ends = np.cumsum(matches)
+        begin = 0
+        while begin < len(matches):
+            base = int(ends[begin - 1]) if begin else 0
+            stop = max(begin + 1, int(np.searchsorted(ends, base + self.BLOCK, "right")))
+            block = matches[begin:stop]
+            total = int(block.sum())
+            if total:
+                first = np.repeat(np.arange(begin, stop), block)
+                # Walk each run of matching keys in the sorted table
+                run_start = np.repeat(left[begin:stop] - (np.cumsum(block) - block), block)
+                second = order[run_start + np.arange(total)]
+                keep = first < second
+                first, second = first[keep], second[keep]
+                close = self._close(first, second, max_distance)
+                self._union_pairs(first[close], second[close])
+            begin = stop
+
+    def _join_bucket(self, members, outsiders, max_distance):
+        # The run itself: a search that drops every photo once it is reached
+        unvisited = members
+        groups = []
+        while len(unvisited):
+            seed, unvisited = unvisited[0], unvisited[1:]
+            group = [np.array([seed])]
+            frontier = [seed]
+            while frontier and len(unvisited):
+                item = frontier.pop()
+                close = self._close(np.full(len(unvisited), item), unvisited, max_distance)
+                if close.any():
+                    reached = unvisited[close]
+                    unvisited = unvisited[~close]
+                    self._link(item, reached)
+                    group.append(reached)
+                    frontier.extend(reached.tolist())
+            groups.append(np.concatenate(group))
+
+        # Photos whose key is a few bits off the run's: compared with each
+        # group of the run a slice at a time, stopping at the first match
+        for group in groups:
+            waiting = outsiders[self._find(outsiders) != self._find(group[:1])[0]]
+            for begin in range(0, len(group), self.SLICE):
+                if not len(waiting):
+                    break
+                part = group[begin:begin + self.SLICE]
+                close = self._close(np.repeat(waiting, len(part)), np.tile(part, len(waiting)), max_distance)
+                hit = close.reshape(len(waiting), len(part)).any(axis=1)
+                if hit.any():
+                    self._link(int(part[0]), waiting[hit])
+                    waiting = waiting[~hit]
+
+    def groups(self, max_distance):
+        # Group root of every hash; hashes linked by a chain of close
+        # pairs share one
+        radius = max_distance // self.CHUNKS
+        masks = [0] + [
+            sum(1 << bit for bit in bits)
+            for flipped in range(1, radius + 1)
+            for bits in itertools.combinations(range(self.CHUNK_BITS), flipped)
+        ]
+        for keys, order, starts in self.tables:
+            heavy_keys, heavy_items = [], []
+            for mask in masks:
+                probe = keys ^ mask
+                left = starts[probe]
+                matches = starts[probe + 1] - left
+                heavy = matches > self.BUCKET_LIMIT
+                if heavy.any():
+                    heavy_keys.append(probe[heavy])
+                    heavy_items.append(np.flatnonzero(heavy))
+                    matches[heavy] = 0
+                self._join_runs(order, left, matches, max_distance)
+            if heavy_keys:
+                probes = np.concatenate(heavy_keys)
+                items = np.concatenate(heavy_items)
+                for key in np.unique(probes).tolist():
+                    members = order[starts[key]:starts[key + 1]]
+                    outsiders = items[(probes == key) & (keys[items] != key)]
+                    self._join_bucket(members, outsiders, max_distance)
+        return self._find(np.arange(len(self.hashes)))
+
+
+def group_duplicates(rows, max_distance=6):
+    # rows: catalog rows with ahash and dhash. Photos whose dHash and aHash
+    # are both within max_distance end up in one group (and so does anything
+    # close to any of them). Newest groups first; in each group the biggest
+    # file comes first, as at the same settings the sharpest frame is biggest.
+    if len(rows) < 2:
+        return []
+    hashes = np.array([(row["dhash"] & HASH_MASK, row["ahash"] & HASH_MASK) for row in rows], dtype=np.uint64)
+    unique, inverse = np.unique(hashes, axis=0, return_inverse=True)
+    roots = HashIndex(unique).groups(max_distance)
+
+    groups = {}
+    for row, index in zip(rows, inverse.reshape(-1).tolist()):
+        groups.setdefault(int(roots[index]), []).append(row)
+    result = [
+        sorted(group, key=lambda row: (-(row["size"] or 0), row["taken_at"]))
+        for group in groups.values() if len(group) > 1
+    ]
+    result.sort(key=lambda group: max(row["taken_at"] for row in group), reverse=True)
+    return result
+
+
+# --- NEW: Photo library catalog (SQLite) ---
+# One row per photo with its capture settings, size, trash state and
+# thumbnail, so the gallery can page through photos with ORDER BY/LIMIT
+# instead of listing the folder and stat'ing every file.
+class PhotoCatalog:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS photos (
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            taken_at REAL NOT NULL,
+            iso INTEGER,
+            aperture REAL,
+            shutter INTEGER,
+            ev REAL,
+            width INTEGER,
+            height INTEGER,
+            trashed INTEGER NOT NULL DEFAULT 0,
+            thumb_path TEXT,
+            mtime_ns INTEGER,
+            size INTEGER,
+            kind TEXT NOT NULL DEFAULT 'photo',
+            uploaded INTEGER NOT NULL DEFAULT 0,
+            ahash INTEGER,
+            dhash INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS photos_by_time ON photos (trashed, taken_at DESC);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+    """
+    # Columns added after the first release, created on older catalogs
+    ADDED_COLUMNS = (
+        ("kind", "TEXT NOT NULL DEFAULT 'photo'"),
+        ("uploaded", "INTEGER NOT NULL DEFAULT 0"),
+        ("ahash", "INTEGER"),
+        ("dhash", "INTEGER"),
+    )
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        # Shared by the UI and the pipeline workers, the lock keeps them apart
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.depth = 0
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(photos)")}
+        for column, definition in self.ADDED_COLUMNS:
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE photos ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def transaction(self):
+        # Commits on success, rolls back if anything inside raises.
+        # Nested calls simply join the outer transaction.
+        with self.lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield self.conn
+                finally:
+                    self.depth -= 1
+                return
+
+            self.depth = 1
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.depth = 0
+
+    def add(self, name, path, taken_at, iso=None, aperture=None, shutter=None, ev=None,
+            width=None, height=None, trashed=False, thumb_path=None, kind="photo", ahash=None, dhash=None):
+        # Hashes are signed, see signed_hash; without them the photo waits for index_hashes
+        stat = os.stat(path)
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO photos (name, path, taken_at, iso, aperture, shutter, ev, width, "
+                "height, trashed, thumb_path, mtime_ns, size, kind, ahash, dhash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, path, taken_at, iso, aperture, shutter, ev, width, height,
+                 int(trashed), thumb_path, stat.st_mtime_ns, stat.st_size, kind, ahash, dhash)
+            )
+
+    def set_location(self, name, path, trashed, thumb_path=None):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE photos SET path = ?, trashed = ?, thumb_path = ? WHERE name = ?",
+                (path, int(trashed), thumb_path, name)
+            )
+
+    def set_locations(self, moves):
+        # moves: [(name, path, trashed, thumb_path)], all in one statement
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE photos SET path = ?, trashed = ?, thumb_path = ? WHERE name = ?",
+                [(path, int(trashed), thumb_path, name) for name, path, trashed, thumb_path in moves]
+            )
+
+    def set_files(self, changes):
+        # changes: [(name, new_name, path, width, height, thumb_path)] after a
+        # re-encode; the capture settings stay, the new file needs uploading
+        rows = []
+        for name, new_name, path, width, height, thumb_path in changes:
+            stat = os.stat(path)
+            rows.append((new_name, path, width, height, thumb_path, stat.st_mtime_ns, stat.st_size, name))
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE photos SET name = ?, path = ?, width = ?, height = ?, thumb_path = ?, "
+                "mtime_ns = ?, size = ?, uploaded = 0 WHERE name = ?",
+                rows
+            )
+
+    def remove(self, name):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM photos WHERE name = ?", (name,))
+
+    def remove_many(self, names):
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM photos WHERE name = ?", [(name,) for name in names])
+
+    def location(self, name):
+        # (path, trashed) of a photo right now, or None once it is gone
+        with self.lock:
+            row = self.conn.execute("SELECT path, trashed FROM photos WHERE name = ?", (name,)).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def pending_uploads(self):
+        with self.lock:
+            return self.conn.execute("SELECT name, path FROM photos WHERE uploaded = 0").fetchall()
+
+    def mark_uploaded(self, names):
+        with self.transaction() as conn:
+            conn.executemany("UPDATE photos SET uploaded = 1 WHERE name = ?", [(name,) for name in names])
+
+    def unhashed(self):
+        # Photos without perceptual hashes yet: new, or changed on disk
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, path FROM photos WHERE dhash IS NULL AND kind = 'photo'"
+            ).fetchall()
+
+    def set_hashes(self, hashes):
+        # hashes: [(name, ahash, dhash)]
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE photos SET ahash = ?, dhash = ? WHERE name = ?",
+                [(ahash, dhash, name) for name, ahash, dhash in hashes]
+            )
+
+    def hashed(self, trashed=False):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, path, taken_at, size, ahash, dhash FROM photos "
+                "WHERE trashed = ? AND dhash IS NOT NULL ORDER BY taken_at DESC",
+                (int(trashed),)
+            ).fetchall()
+
+    def paths(self, trashed=False):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM photos WHERE trashed = ? ORDER BY taken_at DESC", (int(trashed),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, trashed=False):
+        with self.lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM photos WHERE trashed = ?", (int(trashed),)).fetchone()
+        return row[0]
+
+    def page(self, trashed=False, limit=200, offset=0):
+        # Newest first, served straight from the (trashed, taken_at) index
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM photos WHERE trashed = ? ORDER BY taken_at DESC LIMIT ? OFFSET ?",
+                (int(trashed), limit, offset)
+            ).fetchall()
+        return rows
+
+    def reconcile(self, photo_dir, recycle_bin_dir, thumbnails=None, full=False, on_other=None):
+        # Bring the catalog in line with what is really on disk. Listing the
+        # folders is enough to find new and missing photos; only files that
+        # are new or moved get stat'ed and read. Day folders whose mtime is
+        # the same as at the last scan are not even listed. full=True lists
+        # everything and stats every photo, to pick up ones edited in place.
+        # on_other(entry) is called for every non-photo file in the listed
+        # folders; returning True keeps that folder on the list for next time.
+        with self.lock:
+            known = {
+                row["name"]: row
+                for row in self.conn.execute("SELECT name, path, trashed, mtime_ns, size FROM photos")
+            }
+            scanned = dict(self.conn.execute("SELECT path, mtime_ns FROM dirs").fetchall())
+        by_dir = {}
+        for row in known.values():
+            by_dir.setdefault(os.path.dirname(row["path"]), []).append(row)
+
+        added = updated = 0
+        seen = set()
+        unchanged_dirs = []
+        for root, trashed in ((photo_dir, False), (recycle_bin_dir, True)):
+            pending_dirs = [root]
+            while pending_dirs:
+                directory = pending_dirs.pop()
+                try:
+                    dir_mtime = os.stat(directory).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if not full and scanned.get(directory) == dir_mtime:
+                    seen.update(row["name"] for row in by_dir.get(directory, ()) if row["trashed"] == int(trashed))
+                    unchanged_dirs.append((directory, dir_mtime))
+                    continue
+
+                has_subdirs = keep_listing = False
+                for entry in os.scandir(directory):
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                        has_subdirs = True
+                        continue
+                    kind = media_kind(entry.name)
+                    if kind is None or ".tmp." in entry.name or not entry.is_file():
+                        if on_other is not None and on_other(entry):
+                            keep_listing = True
+                        continue
+                    seen.add(entry.name)
+                    row = known.get(entry.name)
+                    in_place = row is not None and row["path"] == entry.path and row["trashed"] == int(trashed)
+                    if in_place and not full:
+                        continue
+                    stat = entry.stat()
+                    if in_place and row["mtime_ns"] == stat.st_mtime_ns and row["size"] == stat.st_size:
+                        continue
+
+                    # EXIF first, then a not-yet-migrated sidecar; recordings carry neither
+                    metadata = {}
+                    if kind == "photo":
+                        try:
+                            metadata = read_exif_metadata(entry.path)
+                        except (OSError, ValueError, struct.error):
+                            pass
+                        if "iso" not in metadata:
+                            metadata.update(read_metadata_file(entry.path))
+                    if "taken_at" not in metadata:
+                        metadata["taken_at"] = stat.st_mtime
+                    thumb_path = thumbnails.entry_for(entry.path) if thumbnails else None
+                    self.add(entry.name, entry.path, trashed=trashed, thumb_path=thumb_path, kind=kind, **metadata)
+                    if row is None:
+                        added += 1
+                    else:
+                        updated += 1
+
+                # Only day folders can be skipped: a parent's mtime doesn't
+                # change when files inside its subfolders do
+                if directory != root and not has_subdirs and not keep_listing:
+                    unchanged_dirs.append((directory, dir_mtime))
+
+        missing = [name for name in known if name not in seen]
+        with self.transaction() as conn:
+            self.remove_many(missing)
+            conn.execute("DELETE FROM dirs")
+            conn.executemany("INSERT INTO dirs VALUES (?, ?)", unchanged_dirs)
+        return added, updated, len(missing)
+
+    def thumb_paths(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT thumb_path FROM photos")]
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def read_metadata_file(photo_path):
+    # Read back the _METADATA.txt sidecar written next to a photo, if there is one
+    txt_path = os.path.splitext(photo_path)[0] + '_METADATA.txt'
+    values = {}
+    try:
+        with open(txt_path) as f:
+            for line in f:
+                key, sep, value = line.strip().partition(": ")
+                if sep:
+                    values[key] = value
+    except OSError:
+        return {}
+
+    metadata = {}
+    try:
+        if "Timestamp" in values:
+            metadata["taken_at"] = datetime.datetime.strptime(values["Timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        if "ISO" in values:
+            metadata["iso"] = int(float(values["ISO"]))
+        if "Aperture" in values:
+            metadata["aperture"] = float(values["Aperture"].lstrip("f/"))
+        if "Shutter Speed" in values:
+            metadata["shutter"] = int(float(values["Shutter Speed"].split("/")[1].split()[0]))
+        if "Exposure Value (EV)" in values:
+            metadata["ev"] = float(values["Exposure Value (EV)"])
+    except (ValueError, IndexError):
+        pass
+    return metadata
+
+
+# --- NEW: EXIF metadata ---
+# Capture settings travel inside the JPEG itself as standard EXIF tags.
+# EV is not stored separately: it is the sum of the APEX aperture and
+# shutter values (Av + Tv), which EXIF already has tags for.
+EXIF_IFD = 0x8769
+TAG_SOFTWARE = 0x0131
+TAG_DATETIME = 0x0132
+TAG_EXPOSURE_TIME = 0x829A
+TAG_FNUMBER = 0x829D
+TAG_ISO = 0x8827
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SHUTTER_SPEED_VALUE = 0x9201
+TAG_APERTURE_VALUE = 0x9202
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+
+
+def build_exif(taken_at, iso, aperture, shutter_speed_inv):
+    exif = Image.Exif()
+    exif[TAG_SOFTWARE] = "Tanish's Camera App"
+    exif[TAG_DATETIME] = taken_at.strftime("%Y:%m:%d %H:%M:%S")
+
+    ifd = exif.get_ifd(EXIF_IFD)
+    ifd[TAG_DATETIME_ORIGINAL] = taken_at.strftime("%Y:%m:%d %H:%M:%S")
+    ifd[TAG_SUBSEC_TIME_ORIGINAL] = f"{taken_at.microsecond // 1000:03d}"
+    ifd[TAG_ISO] = int(iso)
+    # Plain floats would be written as DOUBLEs, EXIF readers expect RATIONALs
+    ifd[TAG_FNUMBER] = IFDRational(round(aperture * 10), 10)
+    ifd[TAG_EXPOSURE_TIME] = IFDRational(1, int(shutter_speed_inv))
+    ifd[TAG_APERTURE_VALUE] = IFDRational(round(2 * math.log2(max(aperture, 0.1)) * 1000), 1000)
+    ifd[TAG_SHUTTER_SPEED_VALUE] = IFDRational(round(math.log2(shutter_speed_inv) * 1000), 1000)
+    return exif
+
+
+def read_exif_metadata(photo_path):
+    # Walks the JPEG markers and the TIFF structure by hand, so nothing but
+    # the first few KB of the file is read and no pixels are decoded.
+    metadata = {}
+    with open(photo_path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return read_image_header(photo_path)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return metadata
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                continue  # markers without a length
+            length = int.from_bytes(f.read(2), "big")
+            if marker[1] == 0xE1:
+                segment = f.read(length - 2)
+                if segment.startswith(b"Exif\x00\x00"):
+                    metadata.update(_parse_exif(segment[6:]))
+            elif marker[1] in (0xC0, 0xC1, 0xC2):
+                # Start of frame: precision, then height and width
+                segment = f.read(5)
+                metadata["height"] = int.from_bytes(segment[1:3], "big")
+                metadata["width"] = int.from_bytes(segment[3:5], "big")
+                return metadata
+            elif marker[1] == 0xDA:
+                return metadata  # image data starts, nothing more to find
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_header(photo_path):
+    # WebP, PNG and .npy: only the header is read, no pixels are decoded
+    metadata = {}
+    if photo_path.lower().endswith(".npy"):
+        metadata["height"], metadata["width"] = np.load(photo_path, mmap_mode="r").shape[:2]
+        return metadata
+    with Image.open(photo_path) as img:
+        metadata["width"], metadata["height"] = img.size
+        tiff = img.info.get("exif")
+    if tiff:
+        # PNG keeps the JPEG-style prefix, WebP doesn't
+        if tiff.startswith(b"Exif\x00\x00"):
+            tiff = tiff[6:]
+        metadata.update(_parse_exif(tiff))
+    return metadata
+
+
+def _parse_exif(tiff):
+    order = "<" if tiff[:2] == b"II" else ">"
+
+    def read_ifd(offset):
+        tags = {}
+        if offset + 2 > len(tiff):
+            return tags
+        (count,) = struct.unpack_from(order + "H", tiff, offset)
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(tiff):
+                break
+            tag, kind, n = struct.unpack_from(order + "HHI", tiff, entry)
+            size = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8, 11: 4, 12: 8}.get(kind)
+            if size is None:
+                continue
+            data_at = entry + 8
+            if size * n > 4:
+                (data_at,) = struct.unpack_from(order + "I", tiff, data_at)
+            if data_at + size * n > len(tiff):
+                continue
+
+            if kind == 2:
+                tags[tag] = tiff[data_at:data_at + n].rstrip(b"\x00").decode("ascii", "replace")
+            elif kind == 3:
+                tags[tag] = struct.unpack_from(order + "H", tiff, data_at)[0]
+            elif kind in (4, 9):
+                tags[tag] = struct.unpack_from(order + ("I" if kind == 4 else "i"), tiff, data_at)[0]
+            elif kind in (5, 10):
+                num, den = struct.unpack_from(order + ("II" if kind == 5 else "ii"), tiff, data_at)
+                tags[tag] = num / den if den else 0.0
+            elif kind in (11, 12):
+                tags[tag] = struct.unpack_from(order + ("f" if kind == 11 else "d"), tiff, data_at)[0]
+        return tags
+
+    (ifd0_offset,) = struct.unpack_from(order + "I", tiff, 4)
+    ifd0 = read_ifd(ifd0_offset)
+    exif = read_ifd(ifd0[EXIF_IFD]) if EXIF_IFD in ifd0 else {}
+
+    metadata = {}
+    taken = exif.get(TAG_DATETIME_ORIGINAL) or ifd0.get(TAG_DATETIME)
+    if taken:
+        try:
+            taken_at = datetime.datetime.strptime(taken, "%Y:%m:%d %H:%M:%S")
+            subsec = exif.get(TAG_SUBSEC_TIME_ORIGINAL, "")
+            if subsec.isdigit():
+                taken_at += datetime.timedelta(seconds=float(f"0.{subsec}"))
+            metadata["taken_at"] = taken_at.timestamp()
+        except ValueError:
+            pass
+    if TAG_ISO in exif:
+        metadata["iso"] = exif[TAG_ISO]
+    if TAG_FNUMBER in exif:
+        metadata["aperture"] = round(exif[TAG_FNUMBER], 1)
+    if TAG_EXPOSURE_TIME in exif and exif[TAG_EXPOSURE_TIME] > 0:
+        metadata["shutter"] = round(1 / exif[TAG_EXPOSURE_TIME])
+    if TAG_APERTURE_VALUE in exif and TAG_SHUTTER_SPEED_VALUE in exif:
+        metadata["ev"] = round(exif[TAG_APERTURE_VALUE] + exif[TAG_SHUTTER_SPEED_VALUE], 2)
+    return metadata
+
+
+def embed_exif(photo_path, exif):
+    # Swap the photo's EXIF block without re-encoding: the new APP1 segment
+    # goes right after the SOI marker and any old Exif APP1 is dropped.
+    with open(photo_path, "rb") as f:
+        data = f.read()
+    if data[:2] != b"\xff\xd8":
+        raise ValueError(f"{photo_path} is not a JPEG")
+
+    payload = exif.tobytes()
+    if not payload.startswith(b"Exif\x00\x00"):
+        payload = b"Exif\x00\x00" + payload
+    segments = [data[:2], b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload]
+
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF and data[pos + 1] != 0xDA:
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        segment = data[pos:pos + 2 + length]
+        if not (data[pos + 1] == 0xE1 and segment[4:10] == b"Exif\x00\x00"):
+            segments.append(segment)
+        pos += 2 + length
+    segments.append(data[pos:])
+
+    atomic_write(photo_path, b"".join(segments))
+
+
+def migrate_sidecars(directories, thumbnails=None):
+    # One-time job: fold every legacy _METADATA.txt into its photo's EXIF,
+    # then delete the text file. Returns how many photos were migrated.
+    migrated = 0
+    for directory in directories:
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('_METADATA.txt'):
+                continue
+            photo_path = entry.path[:-len('_METADATA.txt')] + '.jpg'
+            if not os.path.exists(photo_path):
+                continue  # orphaned sidecar, reconcile's remove_orphan() deletes it
+
+            metadata = read_metadata_file(photo_path)
+            if not {"taken_at", "iso", "aperture", "shutter"} <= metadata.keys():
+                continue
+            thumb_entry = thumbnails.entry_for(photo_path) if thumbnails else None
+            embed_exif(photo_path, build_exif(
+                datetime.datetime.fromtimestamp(metadata["taken_at"]),
+                metadata["iso"], metadata["aperture"], metadata["shutter"]
+            ))
+            if thumbnails:
+                thumbnails.moved(thumb_entry, photo_path)
+            os.remove(entry.path)
+            migrated += 1
+    return migrated
+
+
+# --- NEW: NumPy frame processing ---
+# Works on the camera's BGR array end to end: shrink first (cheap, fewer
+# pixels to convert), then convert colour straight into a 4-channel RGBX
+# buffer that PIL can wrap without copying when it is time to encode.
+# Each worker thread reuses its own output buffers from shot to shot.
+class FrameProcessor:
+    def __init__(self, size=(800, 600), interpolation=None):
+        self.size = size
+        self.interpolation = interpolation  # None picks the best filter per frame
+        self.buffers = threading.local()
+        self.luts = {}
+
+    def _buffers(self):
+        buffers = self.buffers
+        if not hasattr(buffers, "resized"):
+            width, height = self.size
+            buffers.resized = np.empty((height, width, 3), dtype=np.uint8)
+            buffers.rgbx = np.empty((height, width, 4), dtype=np.uint8)
+        return buffers.resized, buffers.rgbx
+
+    def process(self, frame, gain=1.0):
+        # Returns this thread's RGBX buffer, valid until its next call
+        resized, rgbx = self._buffers()
+        height, width = frame.shape[:2]
+        if (width, height) == self.size:
+            source = frame
+        else:
+            # INTER_AREA averages pixels when shrinking, which avoids moire
+            shrinking = width > self.size[0] or height > self.size[1]
+            interpolation = self.interpolation
+            if interpolation is None:
+                interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+            source = cv2.resize(frame, self.size, dst=resized, interpolation=interpolation)
+
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGBA, dst=rgbx)
+        if gain != 1.0:
+            cv2.LUT(rgbx, self._lut(gain), dst=rgbx)
+        return rgbx
+
+    def _lut(self, gain):
+        gain = round(gain, 3)
+        lut = self.luts.get(gain)
+        if lut is None:
+            if len(self.luts) > 64:
+                self.luts.clear()
+            lut = np.clip(np.arange(256, dtype=np.float32) * gain + 0.5, 0, 255).astype(np.uint8)
+            self.luts[gain] = lut
+        return lut
+
+    @staticmethod
+    def exposure_gain(iso, aperture, shutter_speed_inv):
+        # Light reaching the sensor scales with ISO and exposure time and falls
+        # with the square of the f-number. ISO 100, f/2.8, 1/60 s is "normal".
+        gain = (iso / 100) * (60 / shutter_speed_inv) / ((max(aperture, 0.1) / 2.8) ** 2)
+        return min(max(gain, 1 / 16), 16.0)
+
+    @staticmethod
+    def to_image(rgbx):
+        # Zero-copy PIL view of the buffer, only used to hand it to the encoder
+        height, width = rgbx.shape[:2]
+        return Image.frombuffer("RGBX", (width, height), rgbx, "raw", "RGBX", 0, 1)
+
+
+# --- NEW: Encode profiles ---
+# How a photo is written: file format, encoder settings and whether it is
+# the usual annotated 800x600 photo or a raw archive of the whole frame.
+# Raw archives skip the resize, the overlay and the exposure simulation;
+# .npy has nowhere to put EXIF, so only the catalog knows its settings.
+class EncodeProfile:
+    # Encoders that take the zero-copy RGBX view as is
+    RGBX_FORMATS = ("JPEG", "WEBP")
+
+    def __init__(self, name, format, extension, full_resolution=False, **options):
+        self.name = name
+        self.format = format  # a Pillow format name, or "NPY"
+        self.extension = extension
+        self.full_resolution = full_resolution
+        self.options = options
+
+    def encode(self, image, exif=None):
+        buffer = io.BytesIO()
+        if self.format == "NPY":
+            np.save(buffer, np.asarray(image if image.mode == "RGB" else image.convert("RGB")))
+            return buffer.getvalue()
+        if image.mode == "RGBX" and self.format not in self.RGBX_FORMATS:
+            image = image.convert("RGB")
+        options = dict(self.options)
+        if exif is not None:
+            options["exif"] = exif
+        image.save(buffer, format=self.format, **options)
+        return buffer.getvalue()
+
+
+ENCODE_PROFILES = {
+    profile.name: profile
+    for profile in (
+        # Same pixels as Pillow's default JPEG, optimized Huffman tables make it smaller
+        EncodeProfile("jpeg", "JPEG", ".jpg", quality=75, optimize=True),
+        EncodeProfile("jpeg-high", "JPEG", ".jpg", quality=92, subsampling=0, optimize=True),
+        EncodeProfile("jpeg-web", "JPEG", ".jpg", quality=80, optimize=True, progressive=True),
+        EncodeProfile("webp", "WEBP", ".webp", quality=80, method=4),
+        EncodeProfile("png", "PNG", ".png", compress_level=6),
+        EncodeProfile("raw-png", "PNG", ".png", full_resolution=True, compress_level=1),
+        EncodeProfile("raw-npy", "NPY", ".npy", full_resolution=True),
+    )
+}
+DEFAULT_ENCODE_PROFILE = "jpeg"
+
+
+# --- NEW: Fonts, loaded once ---
+# Looks for a nice TrueType font along a search path (CAMERA_APP_FONT_PATH,
+# separated like PATH) and keeps every size it has loaded.
+class FontRegistry:
+    FONT_NAMES = ("arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+
+    def __init__(self, search_path=None):
+        if search_path is None:
+            search_path = os.environ.get("CAMERA_APP_FONT_PATH", "")
+        self.search_dirs = [d for d in search_path.split(os.pathsep) if d]
+        self.font_path = self._find_font()
+        self.fallback = self.font_path is None
+        self.fonts = {}
+
+    def _find_font(self):
+        candidates = [os.path.join(d, name) for d in self.search_dirs for name in self.FONT_NAMES]
+        # Bare names let FreeType look in the system font folders too
+        candidates.extend(self.FONT_NAMES)
+        for candidate in candidates:
+            try:
+                ImageFont.truetype(candidate, 12)
+                return candidate
+            except IOError:
+                continue
+        return None
+
+    def get(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if self.fallback:
+                font = ImageFont.load_default()
+            else:
+                font = ImageFont.truetype(self.font_path, size)
+            self.fonts[size] = font
+        return font
+
+
+# --- NEW: Pre-rendered annotation overlay ---
+# The text that never changes is drawn once into an RGBA layer. Per shot we
+# only render the filename and the settings block (which is cached until a
+# slider moves) and alpha-blend the layers into the frame array in place.
+class OverlayCompositor:
+    def __init__(self, fonts, size=(800, 600)):
+        self.fonts = fonts
+        self.size = size
+        self.lock = threading.Lock()  # FreeType faces are not thread-safe
+        self.settings_key = None
+        self.settings_layer = None
+
+        # Two separate layers, so the empty space between them is never blended
+        self.static_layers = []
+        for position, text, fill, font_size, anchor in (
+            ((size[0] // 2, size[1] // 2 - 20), "SIMULATED PHOTO", '#ecf0f1', 40, "mm"),
+            ((size[0] - 20, size[1] - 20), "Tanish's Camera App", '#7f8c8d', 18, "rs"),
+        ):
+            static = Image.new("RGBA", size, (0, 0, 0, 0))
+            ImageDraw.Draw(static).text(position, text, fill=fill, font=fonts.get(font_size), anchor=anchor)
+            self.static_layers.append(self._crop(static))
+
+    def _crop(self, layer, origin=(0, 0)):
+        # Keep only the part that has any ink in it, ready for blending:
+        # colour premultiplied by alpha, the inverse alpha, and where it goes
+        box = layer.getbbox()
+        if box is None:
+            return None
+        pixels = np.asarray(layer.crop(box), dtype=np.uint16)
+        alpha = pixels[:, :, 3:4]
+        return pixels[:, :, :3] * alpha, 255 - alpha, (origin[0] + box[0], origin[1] + box[1])
+
+    def _render_settings(self, iso, aperture, shutter_speed_inv, exposure_value):
+        key = (iso, aperture, shutter_speed_inv)
+        if key != self.settings_key:
+            layer = Image.new("RGBA", (400, 180), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(layer)
+            font_small = self.fonts.get(18)
+            draw.text((20, 70), f"ISO: {iso}", fill='#ecf0f1', font=font_small)
+            draw.text((20, 95), f"Aperture: f/{aperture}", fill='#ecf0f1', font=font_small)
+            draw.text((20, 120), f"Shutter: 1/{shutter_speed_inv}s", fill='#ecf0f1', font=font_small)
+            draw.text((20, 145), f"EV: {exposure_value:.2f}", fill='#ecf0f1', font=font_small)
+            self.settings_layer = self._crop(layer)
+            self.settings_key = key
+        return self.settings_layer
+
+    def _render_filename(self, filename):
+        font = self.fonts.get(24)
+        left, top, right, bottom = font.getbbox(filename)
+        layer = Image.new("RGBA", (right + 1, bottom + 1), (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((0, 0), filename, fill='#3498db', font=font)
+        return self._crop(layer, origin=(20, 20))
+
+    def layers(self, job):
+        # Everything to blend for this job; a recording renders this once
+        with self.lock:
+            return self.static_layers + [
+                self._render_settings(job.iso, job.aperture, job.shutter_speed_inv, job.exposure_value),
+                self._render_filename(job.filename),
+            ]
+
+    def apply(self, frame, job):
+        self.blend(frame, self.layers(job))
+
+    @staticmethod
+    def blend(frame, layers):
+        # frame is an RGB or RGBX uint8 array, changed in place
+        height, width = frame.shape[:2]
+        for layer in layers:
+            if layer is None:
+                continue
+            premultiplied, inverse_alpha, (x, y) = layer
+            h = min(premultiplied.shape[0], height - y)
+            w = min(premultiplied.shape[1], width - x)
+            if h <= 0 or w <= 0:
+                continue
+            region = frame[y:y + h, x:x + w, :3]
+            blended = region * inverse_alpha[:h, :w] + premultiplied[:h, :w]
+            region[...] = (blended + 127) // 255
+
+
+# --- NEW: Capture pipeline ---
+# A photo goes through grab -> process -> annotate -> encode -> write on a
+# small pool of worker threads, so the Tk main loop never waits for it.
+# Finished jobs land in a results queue that the UI polls with root.after.
+
+class CaptureJob:
+    # Shared counter so two shots in the same millisecond still get different names
+    _sequence = itertools.count(1)
+
+    def __init__(self, iso, aperture, shutter_speed_inv, now=None, simulate_exposure=False, profile=None):
+        self.now = now or datetime.datetime.now()
+        self.timestamp = (
+            self.now.strftime("%Y-%m-%d_%H-%M-%S")
+            + f"-{self.now.microsecond // 1000:03d}_{next(self._sequence) % 10000:04d}"
+        )
+        self.iso = iso
+        self.aperture = aperture
+        self.shutter_speed_inv = shutter_speed_inv
+        self.simulate_exposure = simulate_exposure
+        self.profile = ENCODE_PROFILES[profile or DEFAULT_ENCODE_PROFILE]
+
+        # Use 'math' to calculate exposure
+        shutter_speed = 1 / shutter_speed_inv
+        # Use max(aperture, 0.1) to avoid log(0) if aperture is 0
+        self.exposure_value = math.log2((max(aperture, 0.1)**2) / shutter_speed)
+
+        self.filename = f"IMG_{self.timestamp}{self.profile.extension}"
+        self.frame = None
+        self.array = None
+        self.image = None
+        self.encoded = None
+        self.file_path = None
+        self.thumb_path = None
+        self.hashes = (None, None)  # (ahash, dhash), for finding duplicates
+        self.timings = {}  # stage name -> milliseconds
+        self.messages = []  # log lines for the UI
+        self.error = None
+
+
+class CapturePipeline:
+    STAGES = ("grab", "process", "annotate", "encode", "write", "thumbnail", "hash", "catalog")
+
+    def __init__(self, session, store, thumbnails=None, catalog=None, overlay=None,
+                 processor=None, workers=2, queue_size=32, uploader=None):
+        self.session = session
+        self.store = store
+        self.uploader = uploader
+        self.thumbnails = thumbnails
+        self.catalog = catalog
+        self.overlay = overlay or OverlayCompositor(FontRegistry())
+        self.processor = processor or FrameProcessor()
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue()
+        self.workers = [
+            threading.Thread(target=self._worker, name=f"capture-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, job):
+        # Never block the caller: a full queue means we are already too far behind
+        try:
+            self.jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            metrics.inc("camera_capture_rejected_total")
+            return False
+
+    def poll_results(self):
+        # Hand back every finished job without waiting
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            job_start = time.perf_counter()
+            try:
+                with profiler.section():
+                    self._run_stages(job)
+                metrics.observe("camera_capture_seconds", time.perf_counter() - job_start)
+                metrics.inc("camera_photos_saved_total")
+            except Exception as e:
+                job.error = str(e)
+                metrics.inc("camera_capture_errors_total")
+            # Drop the big buffers before handing the job back to the UI
+            job.frame = job.array = job.image = job.encoded = None
+            self.results.put(job)
+
+    def _run_stages(self, job):
+        for stage in self.STAGES:
+            start = time.perf_counter()
+            getattr(self, f"_{stage}")(job)
+            elapsed = time.perf_counter() - start
+            job.timings[stage] = elapsed * 1000
+            metrics.observe(f"camera_stage_{stage}_seconds", elapsed)
+
+    def _grab(self, job):
+        # Burst jobs arrive with their frame already attached
+        if job.frame is not None:
+            return
+        if not self.session.running and not self.session.start():
+            raise RuntimeError(self.session.error)
+        grabbed = self.session.latest()
+        if grabbed is None:
+            raise RuntimeError("Could not read frame from webcam.")
+        job.frame = grabbed[2]
+
+    def _process(self, job):
+        if job.profile.full_resolution:
+            # Raw archive: the whole frame as the camera delivered it
+            job.array = cv2.cvtColor(job.frame, cv2.COLOR_BGR2RGB)
+            return
+        # Resize to our 800x600 standard size (so the text always fits) and
+        # convert OpenCV's BGR to RGB, all without leaving NumPy
+        gain = 1.0
+        if job.simulate_exposure:
+            gain = FrameProcessor.exposure_gain(job.iso, job.aperture, job.shutter_speed_inv)
+        job.array = self.processor.process(job.frame, gain)
+
+    def _annotate(self, job):
+        # Fonts and the fixed text are prepared once, see OverlayCompositor
+        if not job.profile.full_resolution:
+            self.overlay.apply(job.array, job)
+
+    def _encode(self, job):
+        # Capture settings go into the photo as EXIF, no separate text file
+        exif = build_exif(job.now, job.iso, job.aperture, job.shutter_speed_inv)
+        if job.profile.full_resolution:
+            job.image = Image.fromarray(job.array)
+        else:
+            job.image = FrameProcessor.to_image(job.array)
+        job.encoded = job.profile.encode(job.image, exif)
+
+    def _write(self, job):
+        job.file_path = self.store.path_for(job.filename)
+        atomic_write(job.file_path, job.encoded)
+
+    def _thumbnail(self, job):
+        # Fill the gallery cache now, while the image is still decoded
+        if self.thumbnails is not None:
+            job.thumb_path = self.thumbnails.put(job.file_path, job.image)
+
+    def _hash(self, job):
+        ahash, dhash = image_hashes(job.image)
+        job.hashes = (signed_hash(ahash), signed_hash(dhash))
+
+    def _catalog(self, job):
+        if self.catalog is not None:
+            self.catalog.add(
+                job.filename,
+                job.file_path,
+                taken_at=job.now.timestamp(),
+                iso=job.iso,
+                aperture=job.aperture,
+                shutter=job.shutter_speed_inv,
+                ev=round(job.exposure_value, 2),
+                width=job.image.width,
+                height=job.image.height,
+                thumb_path=job.thumb_path,
+                ahash=job.hashes[0],
+                dhash=job.hashes[1]
+            )
+        if self.uploader is not None:
+            self.uploader.upload(job.filename)
+
+
+# --- NEW: Burst / continuous capture ---
+# Pulls distinct frames from the session at a target rate and hands them
+# straight to the pipeline, so encoding overlaps with grabbing and the
+# device is never left waiting. Runs on its own thread.
+class BurstCapture:
+    def __init__(self, session, pipeline, iso, aperture, shutter_speed_inv,
+                 count=10, duration=None, fps=10, simulate_exposure=False, profile=None):
+        self.session = session
+        self.pipeline = pipeline
+        self.settings = (iso, aperture, shutter_speed_inv)
+        self.simulate_exposure = simulate_exposure
+        self.profile = profile
+        self.count = count
+        self.duration = duration  # seconds, overrides count when set
+        self.fps = fps
+        self.captured = 0
+        self.dropped = 0
+        self.achieved_fps = 0.0
+        self.error = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="burst", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        try:
+            if not self.session.running and not self.session.start():
+                raise RuntimeError(self.session.error)
+
+            interval = 1 / self.fps
+            start = time.perf_counter()
+            deadline = start + self.duration if self.duration else None
+            next_shot = start
+            last_sequence = 0
+            shots = 0
+
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        break
+                elif shots >= self.count:
+                    break
+
+                delay = next_shot - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_shot += interval
+                shots += 1
+
+                # Only ever use a frame we have not saved yet
+                grabbed = self.session.wait_for_frame(last_sequence, timeout=interval * 2)
+                if grabbed is None:
+                    self.dropped += 1
+                    metrics.inc("camera_burst_dropped_frames_total")
+                    continue
+                sequence, grabbed_at, frame = grabbed
+                last_sequence = sequence
+
+                job = CaptureJob(
+                    *self.settings,
+                    now=datetime.datetime.fromtimestamp(grabbed_at),
+                    simulate_exposure=self.simulate_exposure,
+                    profile=self.profile
+                )
+                job.frame = frame
+                if self.pipeline.submit(job):
+                    self.captured += 1
+                else:
+                    # Encoders are behind: drop instead of stalling the device
+                    self.dropped += 1
+                    metrics.inc("camera_burst_dropped_frames_total")
+
+                # Fell behind by more than a frame: skip the missed slots
+                now = time.perf_counter()
+                if now - next_shot > interval:
+                    missed = int((now - next_shot) / interval)
+                    if deadline is None:
+                        missed = min(missed, self.count - shots)
+                    self.dropped += missed
+                    metrics.inc("camera_burst_dropped_frames_total", missed)
+                    shots += missed
+                    next_shot += missed * interval
+
+            elapsed = time.perf_counter() - start
+            self.achieved_fps = self.captured / elapsed if elapsed > 0 else 0.0
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done.set()
+
+
+def pid_alive(pid):
+    # Whether some process with this pid still runs; unsure counts as alive
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill(pid, 0) would send Ctrl+C there, so ask for a handle instead
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+# --- NEW: Trash move journal ---
+# Every move to or from the recycle bin (and every permanent delete) is
+# written here and fsync'ed before the files are touched, and marked done
+# once the catalog has committed. Several processes can share a library
+# (the GUI and a `reconcile` run, say), so op ids start with the pid and
+# only operations whose process is gone count as interrupted; those get
+# finished by CameraCore.replay_journal(). Writes hold a lock file so one
+# process never truncates records another one just appended.
+class TrashJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        # The time part keeps ids unique when a restart gets the same pid
+        self.prefix = f"{os.getpid()}-{int(time.time() * 1000):x}"
+        self.ids = itertools.count(1)
+        self.open_ids = set()
+        self.lock_file = None
+        self.lock_depth = 0
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if self.lock_depth == 0 and fcntl is not None:
+                self.lock_file = open(self.path + ".lock", "a")
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if self.lock_depth == 0 and self.lock_file is not None:
+                    self.lock_file.close()  # closing releases the flock
+                    self.lock_file = None
+
+    def _append(self, record, durable):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def begin(self, action, moves, trashed=None):
+        # moves: [(source, target)], target is None for permanent deletes.
+        # trashed says where the targets are; deletes and restores imply it.
+        with self.locked():
+            op_id = f"{self.prefix}-{next(self.ids)}"
+            record = {"id": op_id, "action": action, "moves": moves}
+            if trashed is not None:
+                record["trashed"] = trashed
+            self._append(record, durable=True)
+            self.open_ids.add(op_id)
+        return op_id
+
+    def finish(self, op_id):
+        with self.locked():
+            self.open_ids.discard(op_id)
+            self._append({"id": op_id, "done": True}, durable=False)
+            self._truncate_if_idle()
+
+    def _truncate_if_idle(self):
+        # Nothing in flight here or in another process: start the next journal from empty
+        if not self.open_ids and not self.pending():
+            with open(self.path, "w"):
+                pass
+
+    def is_live(self, op_id):
+        if op_id in self.open_ids:
+            return True
+        pid = int(op_id.split("-", 1)[0])
+        # Our own pid on an op we didn't start is an earlier run that crashed
+        return pid != os.getpid() and pid_alive(pid)
+
+    def abandoned(self):
+        # Open operations whose process is gone; call under locked()
+        return [operation for operation in self.pending() if not self.is_live(operation["id"])]
+
+    def pending(self):
+        operations = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    if record.get("done"):
+                        operations.pop(record["id"], None)
+                    else:
+                        operations[record["id"]] = record
+        except FileNotFoundError:
+            pass
+        return list(operations.values())
+
+    def settle(self, op_ids):
+        # Marks replayed operations done, leaving live ones from other processes alone
+        with self.locked():
+            for op_id in op_ids:
+                self._append({"id": op_id, "done": True}, durable=False)
+            self._truncate_if_idle()
+
+
+# --- NEW: Live preview feed ---
+# Downscales the newest session frame on its own thread, at most `fps`
+# times a second, into a back buffer that is swapped with the front one.
+# Frames that arrive in between are never touched, and the UI only ever
+# sees the newest one (latest() returns None if it already showed it).
+class LivePreview:
+    def __init__(self, session, size=(400, 300), fps=15):
+        self.session = session
+        self.size = size
+        self.fps = fps
+        self.gain = 1.0  # set by the UI when exposure is simulated
+        self.paused = False  # hidden preview: no work at all
+        # Bilinear is ~10x cheaper than INTER_AREA and good enough on screen
+        self.processor = FrameProcessor(size, interpolation=cv2.INTER_LINEAR)
+        width, height = size
+        self.front = np.zeros((height, width, 4), dtype=np.uint8)
+        self.back = np.zeros((height, width, 4), dtype=np.uint8)
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="live-preview", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def _run(self):
+        interval = 1 / self.fps
+        last_sequence = 0
+        while self.running:
+            if self.paused:
+                time.sleep(interval)
+                continue
+            started = time.perf_counter()
+            grabbed = self.session.wait_for_frame(last_sequence, timeout=0.5)
+            if grabbed is None:
+                continue
+            sequence, _, frame = grabbed
+            last_sequence = sequence
+
+            with metrics.timer("camera_preview_frame_seconds"):
+                np.copyto(self.back, self.processor.process(frame, self.gain))
+            with self.lock:
+                self.front, self.back = self.back, self.front
+                self.sequence = sequence
+
+            # Cap the rate: whatever the camera delivers meanwhile is skipped
+            delay = interval - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def latest(self, shown_sequence, into):
+        # Calls into(rgbx) with the newest frame if it is newer than
+        # shown_sequence, under the lock so the buffer can't be swapped
+        # mid-copy. Returns the sequence that is now shown.
+        with self.lock:
+            if self.sequence <= shown_sequence:
+                return shown_sequence
+            into(self.front)
+            return self.sequence
+
+
+# --- NEW: Video recording ---
+# A feeder thread takes each new frame from the session (paced to the
+# target fps) and puts it on a small bounded queue; a writer thread resizes
+# it, burns in the overlay and hands it to cv2.VideoWriter. When the writer
+# falls behind the queue fills up and frames are dropped, the camera is
+# never held up. The file is written at the target fps whatever the camera
+# delivers: each frame goes in the slot its timestamp falls in, repeated
+# until the next frame's slot, so a slow camera or a dropped frame doesn't
+# make the video play back too fast. The file is written under a .tmp. name and renamed when
+# the recording is finished, then gets a poster-frame thumbnail and a
+# catalog row like any photo.
+class VideoRecorder:
+    CODECS = {"MJPG": ".avi", "mp4v": ".mp4"}
+
+    def __init__(self, session, store, overlay, thumbnails=None, catalog=None,
+                 iso=100, aperture=2.8, shutter_speed_inv=60, fps=30, codec="MJPG",
+                 simulate_exposure=False, queue_size=8, uploader=None):
+        if codec not in self.CODECS:
+            raise ValueError(f"Unknown codec {codec}, use one of: {', '.join(self.CODECS)}")
+        self.session = session
+        self.overlay = overlay
+        self.thumbnails = thumbnails
+        self.catalog = catalog
+        self.uploader = uploader
+        self.fps = fps
+        self.codec = codec
+        self.processor = FrameProcessor(overlay.size)
+        self.gain = FrameProcessor.exposure_gain(iso, aperture, shutter_speed_inv) if simulate_exposure else 1.0
+
+        # The job only carries the settings and the name for the overlay
+        self.job = CaptureJob(iso, aperture, shutter_speed_inv)
+        extension = self.CODECS[codec]
+        self.job.filename = f"VID_{self.job.timestamp}{extension}"
+        self.file_path = store.path_for(self.job.filename)
+        self.tmp_path = os.path.join(os.path.dirname(self.file_path), f"VID_{self.job.timestamp}.tmp{extension}")
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.received = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.written = 0  # frames in the file, duplicates included
+        self.achieved_fps = 0.0
+        self.duration = 0.0
+        self.error = None
+        self.stopping = threading.Event()
+        self.done = threading.Event()
+        self.writer = None
+        self.feeder_thread = threading.Thread(target=self._feed, name="video-feeder", daemon=True)
+        self.writer_thread = threading.Thread(target=self._write, name="video-writer", daemon=True)
+
+    def start(self):
+        if not self.session.running and not self.session.start():
+            raise RuntimeError(self.session.error)
+        fourcc = cv2.VideoWriter_fourcc(*self.codec)
+        self.writer = cv2.VideoWriter(self.tmp_path, fourcc, self.fps, self.overlay.size)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Could not open a {self.codec} video writer for {self.tmp_path}")
+        self.feeder_thread.start()
+        self.writer_thread.start()
+
+    def stop(self):
+        # Returns right away, `done` is set once the file is finished
+        self.stopping.set()
+
+    def _feed(self):
+        interval = 1 / self.fps
+        next_due = time.perf_counter()
+        last_sequence = 0
+        while not self.stopping.is_set():
+            grabbed = self.session.wait_for_frame(last_sequence, timeout=0.5)
+            if grabbed is None:
+                continue
+            last_sequence = grabbed[0]
+
+            # A source faster than the target fps just gets sampled
+            now = time.perf_counter()
+            if now < next_due - interval / 2:
+                continue
+            next_due = max(next_due + interval, now - interval)
+
+            self.received += 1
+            try:
+                self.frames.put_nowait(grabbed)
+            except queue.Full:
+                self.dropped += 1
+                metrics.inc("camera_video_frames_dropped_total")
+        self.frames.put(None)
+
+    def _write(self):
+        bgr = np.empty((self.overlay.size[1], self.overlay.size[0], 3), dtype=np.uint8)
+        layers = self.overlay.layers(self.job)
+        poster = None
+        first_at = last_at = None
+        while True:
+            grabbed = self.frames.get()
+            if grabbed is None:
+                break
+            if self.error:
+                continue  # keep draining so the feeder never blocks
+            _, grabbed_at, frame = grabbed
+            # Its slot was already filled by the previous frame: drop it
+            slot = round((grabbed_at - first_at) * self.fps) if first_at is not None else 0
+            copies = slot + 1 - self.written
+            if copies <= 0:
+                self.dropped += 1
+                metrics.inc("camera_video_frames_dropped_total")
+                continue
+            start = time.perf_counter()
+            try:
+                rgbx = self.processor.process(frame, self.gain)
+                OverlayCompositor.blend(rgbx, layers)
+                cv2.cvtColor(rgbx, cv2.COLOR_RGBA2BGR, dst=bgr)
+                for _ in range(copies):
+                    self.writer.write(bgr)
+            except Exception as e:
+                self.error = str(e)
+                self.stopping.set()
+                continue
+            if poster is None:
+                poster = FrameProcessor.to_image(rgbx).convert("RGB")
+            first_at = first_at or grabbed_at
+            last_at = grabbed_at
+            self.encoded += 1
+            self.written += copies
+            self.duplicated += copies - 1
+            metrics.inc("camera_video_frames_encoded_total")
+            metrics.observe("camera_video_frame_seconds", time.perf_counter() - start)
+
+        try:
+            self.writer.release()
+            if self.encoded and not self.error:
+                self.duration = last_at - first_at
+                self.achieved_fps = (self.encoded - 1) / self.duration if self.duration > 0 else 0.0
+                self._finish(poster)
+            elif os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done.set()
+
+    def _finish(self, poster):
+        os.replace(self.tmp_path, self.file_path)
+        fsync_dir(os.path.dirname(self.file_path))
+        thumb_path = self.thumbnails.put(self.file_path, poster) if self.thumbnails is not None else None
+        if self.catalog is not None:
+            self.catalog.add(
+                self.job.filename,
+                self.file_path,
+                taken_at=self.job.now.timestamp(),
+                iso=self.job.iso,
+                aperture=self.job.aperture,
+                shutter=self.job.shutter_speed_inv,
+                ev=round(self.job.exposure_value, 2),
+                width=poster.width,
+                height=poster.height,
+                thumb_path=thumb_path,
+                kind="video"
+            )
+        if self.uploader is not None:
+            self.uploader.upload(self.job.filename)
+
+
+# --- NEW: Batch trash operations ---
+# Moves or deletes many photos on a background thread. Files are renamed
+# with os.replace (a plain rename on the same filesystem) and the catalog
+# is updated with a single executemany/commit once the files are done.
+# Progress is read straight off `processed` / `total`; cancel() stops
+# after the current file and still commits what was already moved.
+class BatchOperation:
+    def __init__(self, core, action, paths):
+        self.core = core
+        self.action = action  # "delete", "restore" or "purge"
+        self.paths = list(paths)
+        self.total = len(self.paths)
+        self.processed = 0
+        self.completed = []  # original paths that were handled
+        self.errors = []  # (path, message)
+        self.error = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"batch-{action}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _run(self):
+        start = time.perf_counter()
+        moves = []
+        removed = []
+        op_id = None
+        try:
+            op_id = self.core.journal_begin(self.action, self.paths)
+            for path in self.paths:
+                if self.cancelled.is_set():
+                    break
+                try:
+                    if self.action == "purge":
+                        self.core._purge_file(path)
+                        removed.append(os.path.basename(path))
+                    else:
+                        trashed = self.action == "delete"
+                        new_path = self.core.store.path_for(os.path.basename(path), trashed, path)
+                        moves.append(self.core._move_file(path, new_path, trashed))
+                    self.completed.append(path)
+                except OSError as e:
+                    self.errors.append((path, str(e)))
+                self.processed += 1
+
+            # One commit for the whole batch
+            with self.core.catalog.transaction():
+                if moves:
+                    self.core.catalog.set_locations(moves)
+                if removed:
+                    self.core.catalog.remove_many(removed)
+            self.core.journal.finish(op_id)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            metrics.observe("camera_batch_seconds", time.perf_counter() - start)
+            metrics.inc("camera_batch_files_total", len(self.completed))
+            self.done.set()
+
+
+# --- NEW: Duplicate search ---
+# Brings the hash index up to date, then groups look-alike photos, on a
+# background thread. Progress is `processed` / `total` photos hashed, like
+# a batch; cancel() keeps every hash saved so far for next time.
+class DuplicateSearch:
+    def __init__(self, core, max_distance=6, trashed=False):
+        self.core = core
+        self.max_distance = max_distance
+        self.trashed = trashed
+        self.total = 0
+        self.processed = 0
+        self.groups = []  # [[catalog row, ...]], the one to keep first
+        self.errors = []  # (path, message)
+        self.error = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="duplicates", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _progress(self, processed, total):
+        self.processed = processed
+        self.total = total
+
+    def _run(self):
+        try:
+            _, self.errors = self.core.index_hashes(progress=self._progress, cancelled=self.cancelled)
+            if not self.cancelled.is_set():
+                self.groups = self.core.find_duplicates(self.max_distance, self.trashed)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done.set()
+
+
+# --- NEW: Storage backends ---
+# Somewhere to keep a second copy of every photo, under the same
+# YYYY/MM/DD/name keys. The local folders stay the working copy the app
+# reads from; a backend only ever gets put_file() and delete_many().
+class LocalBackend:
+    # Another folder: a second disk, a NAS mount, a synced folder...
+    def __init__(self, root):
+        self.root = root
+
+    def __str__(self):
+        return self.root
+
+    def put_file(self, key, local_path):
+        target = os.path.join(self.root, *key.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, target)
+
+    def delete_many(self, keys):
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.root, *key.split("/")))
+            except FileNotFoundError:
+                pass
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, *key.split("/")))
+
+
+class S3Backend:
+    # Any S3-compatible service; endpoint_url points it at MinIO, a moto
+    # server or similar instead of AWS. Credentials come the usual boto3 way.
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError(
+                "The 'boto3' library is required for S3 storage. "
+                "Please install it by running: pip install boto3"
+            )
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # boto3 clients are thread-safe, one is shared by all upload workers
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def put_file(self, key, local_path):
+        self.client.upload_file(local_path, self.bucket, self.prefix + key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        # One request per 1000 keys, the most S3 takes at once
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self.prefix + key} for key in keys[start:start + 1000]], "Quiet": True}
+            )
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+
+def make_backend(spec, endpoint_url=None):
+    # "s3://bucket/prefix", "file:///some/folder" or a plain folder path
+    if not spec:
+        return None
+    if spec.startswith("s3://"):
+        bucket, _, prefix = spec[len("s3://"):].partition("/")
+        return S3Backend(bucket, prefix, endpoint_url)
+    if spec.startswith("file://"):
+        spec = spec[len("file://"):]
+    return LocalBackend(spec)
+
+
+# --- NEW: Background uploads ---
+# upload()/delete() only put the name on an unbounded queue, so a capture
+# never waits for the network. A thread collects up to BATCH_SIZE items (or
+# whatever arrived within BATCH_WAIT seconds), uploads them on a small
+# pool, and marks the batch uploaded with one catalog commit. Anything not
+# uploaded yet is still `uploaded = 0` in the catalog and is picked up
+# again on the next start. Failed uploads wait in `retries` and the same
+# thread tries them again after RETRY_DELAY, doubling (up to
+# MAX_RETRY_DELAY) while the backend keeps failing.
+class Uploader:
+    BATCH_SIZE = 32
+    BATCH_WAIT = 1.0
+    RETRY_DELAY = 30.0
+    MAX_RETRY_DELAY = 600.0
+
+    def __init__(self, backend, catalog, workers=4, log=print):
+        self.backend = backend
+        self.catalog = catalog
+        self.log = log
+        self.items = queue.Queue()  # ("put", name) or ("delete", key); None stops
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self.thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+        self.retries = {}  # names in the order they failed; only the uploader thread uses it
+        self.retry_delay = self.RETRY_DELAY
+        self.retry_at = 0.0
+        self.uploaded = 0
+        self.failed = 0
+
+    def start(self):
+        # Whatever an earlier run didn't get to
+        for row in self.catalog.pending_uploads():
+            self.items.put(("put", row["name"]))
+        self.thread.start()
+
+    def upload(self, name):
+        self.items.put(("put", name))
+
+    def delete(self, key):
+        self.items.put(("delete", key))
+
+    def pending(self):
+        return self.items.qsize() + len(self.retries)
+
+    def _due_retries(self):
+        if not self.retries or time.monotonic() < self.retry_at:
+            return []
+        names = list(self.retries)[:self.BATCH_SIZE]
+        for name in names:
+            del self.retries[name]
+        return [("put", name) for name in names]
+
+    def _next_batch(self):
+        # Waits for new items, or until the retries are due
+        while True:
+            batch = self._due_retries()
+            if batch:
+                break
+            timeout = max(0.0, self.retry_at - time.monotonic()) if self.retries else None
+            try:
+                item = self.items.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is None:
+                return None
+            batch = [item]
+            break
+        deadline = time.perf_counter() + self.BATCH_WAIT
+        while len(batch) < self.BATCH_SIZE:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.items.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.items.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _put(self, name):
+        # Returns (name, None) once uploaded (or gone), (name, error) otherwise
+        try:
+            # The photo may have moved (or gone) since it was queued, or
+            # even while it was being uploaded: then look it up once more
+            for attempt in range(2):
+                location = self.catalog.location(name)
+                if location is None:
+                    return name, None
+                path = location[0]
+                try:
+                    with metrics.timer("camera_upload_seconds"):
+                        self.backend.put_file(storage_key(name, path), path)
+                    return name, None
+                except FileNotFoundError:
+                    if attempt:
+                        raise
+        except Exception as e:
+            return name, e
+
+    def _retry_later(self, failed, total):
+        self.failed += len(failed)
+        metrics.inc("camera_upload_errors_total", len(failed))
+        for name, _ in failed:
+            self.retries[name] = None
+        self.retry_at = time.monotonic() + self.retry_delay
+        # One line per batch; a missing file is mid-move (the catalog
+        # catches up), not worth a log line
+        errors = [error for _, error in failed if not isinstance(error, FileNotFoundError)]
+        if errors:
+            self.log(f"Error uploading {len(failed)} of {total} photos to {self.backend}, "
+                     f"retrying in {self.retry_delay:.0f}s: {errors[0]}")
+        self.retry_delay = min(self.retry_delay * 2, self.MAX_RETRY_DELAY)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            names = [value for op, value in batch if op == "put"]
+            keys = [value for op, value in batch if op == "delete"]
+            try:
+                results = list(self.pool.map(self._put, names))
+                done = [name for name, error in results if error is None]
+                failed = [(name, error) for name, error in results if error is not None]
+                self.catalog.mark_uploaded(done)
+                self.uploaded += len(done)
+                metrics.inc("camera_uploads_total", len(done))
+                if failed:
+                    self._retry_later(failed, len(names))
+                elif done:
+                    self.retry_delay = self.RETRY_DELAY
+                if keys:
+                    self.backend.delete_many(keys)
+            except Exception as e:
+                self.log(f"Error: upload batch failed: {e}")
+
+    def close(self, timeout=10.0):
+        # Uploads what is already queued (up to `timeout`), the rest waits
+        # in the catalog for the next start
+        self.items.put(None)
+        self.thread.join(timeout=timeout)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- NEW: Re-encoding a library ---
+# Runs in worker processes so decoding and encoding use every core. A photo
+# keeps its name, only the extension follows the profile, and its capture
+# settings from the catalog go into the new file as EXIF (so a raw .npy
+# archive gets them too), on top of whatever EXIF the file already had.
+# Raw archives are left alone unless asked for. With a new extension the
+# old file is removed once the new one is safely written, so an interrupted
+# run leaves one good copy of each photo for reconcile to pick up.
+def is_raw_archive(name, width=None, height=None):
+    # .npy is only ever written by raw-npy; a PNG larger than the annotated
+    # 800x600 photo can only be a raw-png capture of the whole frame
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".npy":
+        return True
+    return extension == ".png" and ((width or 0) > 800 or (height or 0) > 600)
+
+
+def reencode_file(path, profile_name, max_size=None, settings=None):
+    # settings: (taken_at, iso, aperture, shutter). Returns (new_path,
+    # old_bytes, new_bytes, width, height, cpu_seconds); new_path is None
+    # when the original was kept.
+    start = time.process_time()
+    profile = ENCODE_PROFILES[profile_name]
+    old_bytes = os.path.getsize(path)
+
+    img = open_image(path)
+    # Keep what the file has (orientation, camera make...), the catalog's
+    # capture settings win where both have a value
+    exif = img.getexif()
+    if settings is not None and None not in settings:
+        taken_at, iso, aperture, shutter = settings
+        captured = build_exif(datetime.datetime.fromtimestamp(taken_at), iso, aperture, shutter)
+        for tag, value in captured.items():
+            if tag != EXIF_IFD and not (tag == TAG_SOFTWARE and tag in exif):
+                exif[tag] = value
+        exif.get_ifd(EXIF_IFD).update(captured.get_ifd(EXIF_IFD))
+    if not len(exif):
+        exif = None
+    resized = bool(max_size) and max(img.size) > max_size
+    if resized:
+        # A big JPEG is decoded straight at 1/2..1/8 scale first
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    data = profile.encode(img, exif)
+
+    new_path = os.path.splitext(path)[0] + profile.extension
+    if new_path == path and not resized and len(data) >= old_bytes:
+        # Same format, same size and no smaller: not worth a generation loss
+        return None, old_bytes, old_bytes, img.width, img.height, time.process_time() - start
+    if new_path != path and os.path.exists(new_path):
+        raise FileExistsError(f"{new_path} already exists")
+    atomic_write(new_path, data)
+    if new_path != path:
+        os.remove(path)
+    return new_path, old_bytes, len(data), img.width, img.height, time.process_time() - start
+
+
+# --- NEW: UI-independent camera core ---
+# Everything the app does besides drawing windows: the camera session, the
+# capture pipeline, the catalog and the gallery/recycle bin file moves.
+# The Tk App and the command line are both thin clients of this class.
+# `log` may be called from any thread.
+class CameraCore:
+    def __init__(self, source="0", photo_dir="photos", recycle_bin_dir="recycle_bin",
+                 thumbnail_dir="thumbnails", log=print, storage=None, storage_endpoint_url=None):
+        self.source = source
+        self.photo_dir = photo_dir
+        self.recycle_bin_dir = recycle_bin_dir
+        self.log = log
+
+        for directory in (self.photo_dir, self.recycle_bin_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        # New photos go into YYYY/MM/DD folders under these two roots
+        self.store = PhotoStore(self.photo_dir, self.recycle_bin_dir)
+        self.uploader = None
+
+        self.thumbnails = ThumbnailCache(thumbnail_dir)
+        # Catalog of every photo, kept in the photo directory
+        self.catalog = PhotoCatalog(os.path.join(self.photo_dir, "catalog.db"))
+        # Finish any trash move a crash cut short before anything else runs
+        self.journal = TrashJournal(os.path.join(self.photo_dir, "trash_journal.jsonl"))
+        self.replay_journal()
+
+        # Optional copy of every photo somewhere else (a folder or S3),
+        # uploaded in the background
+        backend = make_backend(storage, storage_endpoint_url)
+        if backend is not None:
+            self.uploader = Uploader(backend, self.catalog, log=self.log)
+            self.uploader.start()
+
+        # Fonts are found once, the fixed overlay text is drawn once
+        self.fonts = FontRegistry()
+        if self.fonts.fallback:
+            self.log("Arial font not found. Using default font.")
+
+        # The camera stays open, a worker pool captures and saves in the background
+        self.session = CaptureSession(source)
+        self.overlay = OverlayCompositor(self.fonts)
+        self.pipeline = CapturePipeline(
+            self.session, self.store, self.thumbnails, self.catalog, self.overlay, uploader=self.uploader
+        )
+
+    def start(self):
+        if self.session.start():
+            self.log(f"Camera session started ({self.source}).")
+            return True
+        self.log(f"Error: {self.session.error}")
+        return False
+
+    def replay_journal(self):
+        # Rolls every interrupted operation forward: files still at their
+        # source are moved (or deleted), and the catalog follows the files.
+        # Operations of processes that are still running are theirs to finish.
+        with self.journal.locked():
+            pending = self.journal.abandoned()
+            if pending:
+                self._replay(pending)
+                self.journal.settle([operation["id"] for operation in pending])
+        if pending:
+            self.log(f"Finished {len(pending)} interrupted file operations.")
+        return len(pending)
+
+    def _replay(self, pending):
+        moves = []
+        removed = []
+        for operation in pending:
+            trashed = operation.get("trashed", operation["action"] == "delete")
+            for source, target in operation["moves"]:
+                name = os.path.basename(source)
+                try:
+                    if target is None:
+                        if os.path.exists(source):
+                            self._purge_file(source)
+                        removed.append(name)
+                    elif os.path.exists(source) and not os.path.exists(target):
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        moves.append(self._move_file(source, target, trashed))
+                    elif os.path.exists(target):
+                        moves.append((name, target, trashed, self.thumbnails.entry_for(target)))
+                except OSError as e:
+                    self.log(f"Error: could not finish moving {name}: {e}")
+        with self.catalog.transaction():
+            self.catalog.set_locations(moves)
+            self.catalog.remove_many(removed)
+
+    def journal_begin(self, action, paths):
+        if action == "purge":
+            moves = [(path, None) for path in paths]
+        else:
+            trashed = action == "delete"
+            moves = [(path, self.store.path_for(os.path.basename(path), trashed, path)) for path in paths]
+        return self.journal.begin(action, moves)
+
+    def remove_orphan(self, entry):
+        # Called by reconcile for every file that isn't a photo or video:
+        # leftovers of interrupted writes and failed captures go. Returns
+        # True for a temp file that is too new to judge yet.
+        name = entry.name
+        try:
+            if name.endswith(".tmp") or ".tmp." in name:
+                # Recent ones may belong to a capture being written right now
+                if entry.stat().st_mtime >= time.time() - 60:
+                    return True
+                os.remove(entry.path)
+                self.orphans_removed += 1
+            elif name.endswith("_METADATA.txt"):
+                # Only once its photo is gone, wherever the photo lives now
+                photo_name = name[:-len("_METADATA.txt")] + ".jpg"
+                folder = os.path.dirname(entry.path)
+                candidates = (
+                    os.path.join(folder, photo_name),
+                    os.path.join(folder, *shard_for(photo_name, entry.path), photo_name),
+                )
+                if (not any(os.path.exists(path) for path in candidates)
+                        and self.catalog.location(photo_name) is None):
+                    os.remove(entry.path)
+                    self.orphans_removed += 1
+        except OSError:
+            pass
+        return False
+
+    def migrate_exif(self):
+        # One-time: fold old _METADATA.txt files into EXIF
+        if self.catalog.get_meta("exif_migrated") != "1":
+            migrated = migrate_sidecars([self.photo_dir, self.recycle_bin_dir], self.thumbnails)
+            self.catalog.set_meta("exif_migrated", "1")
+            if migrated:
+                self.log(f"Moved metadata of {migrated} photos into EXIF.")
+
+    def maintenance(self, full=False):
+        self.migrate_exif()
+
+        # Pick up photos added or removed while the app was closed
+        # and clean up leftovers of interrupted writes along the way
+        self.orphans_removed = 0
+        added, updated, removed = self.catalog.reconcile(
+            self.photo_dir, self.recycle_bin_dir, self.thumbnails, full=full, on_other=self.remove_orphan
+        )
+        if added or updated or removed:
+            self.log(f"Catalog updated: {added} added, {updated} changed, {removed} removed.")
+
+        orphans = self.orphans_removed + self.thumbnails.remove_orphans(self.catalog.thumb_paths())
+        if orphans:
+            self.log(f"Removed {orphans} leftover files.")
+
+    def capture(self, iso, aperture, shutter_speed_inv, simulate_exposure=False, profile=None):
+        # False means the pipeline is full and the shot was not taken.
+        # profile names one of ENCODE_PROFILES, the default is a JPEG.
+        job = CaptureJob(iso, aperture, shutter_speed_inv, simulate_exposure=simulate_exposure, profile=profile)
+        return self.pipeline.submit(job)
+
+    def burst(self, iso, aperture, shutter_speed_inv, count=10, duration=None, fps=10,
+              simulate_exposure=False, profile=None):
+        burst = BurstCapture(
+            self.session, self.pipeline, iso, aperture, shutter_speed_inv,
+            count=count, duration=duration, fps=fps, simulate_exposure=simulate_exposure, profile=profile
+        )
+        burst.start()
+        return burst
+
+    def record(self, iso, aperture, shutter_speed_inv, fps=30, codec="MJPG", simulate_exposure=False):
+        # Runs until stop() is called on the returned recorder
+        recorder = VideoRecorder(
+            self.session, self.store, self.overlay, self.thumbnails, self.catalog,
+            iso=iso, aperture=aperture, shutter_speed_inv=shutter_speed_inv,
+            fps=fps, codec=codec, simulate_exposure=simulate_exposure, uploader=self.uploader
+        )
+        recorder.start()
+        return recorder
+
+    def preview(self, size=(400, 300), fps=15):
+        live_preview = LivePreview(self.session, size, fps)
+        live_preview.start()
+        return live_preview
+
+    def poll_results(self):
+        return self.pipeline.poll_results()
+
+    def count(self, trashed=False):
+        return self.catalog.count(trashed)
+
+    def page(self, trashed=False, offset=0, limit=200):
+        return [row["path"] for row in self.catalog.page(trashed, limit, offset)]
+
+    def _move_file(self, file_path, new_path, trashed):
+        # Moves the photo and its cached thumbnail, returns the catalog update
+        base_name = os.path.basename(file_path)
+        thumb_entry = self.thumbnails.entry_for(file_path)
+        with metrics.timer("camera_file_move_seconds"):
+            try:
+                os.replace(file_path, new_path)
+            except OSError as e:
+                # Folders on different filesystems: copy and delete instead
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(file_path, new_path)
+            # Where the thumbnail is (or will be once the gallery makes it)
+            new_thumb = self.thumbnails.moved(thumb_entry, new_path) or self.thumbnails.entry_for(new_path)
+        metrics.inc("camera_file_moves_total")
+        return base_name, new_path, trashed, new_thumb
+
+    def _move(self, file_path, trashed):
+        op_id = self.journal_begin("delete" if trashed else "restore", [file_path])
+        new_path = self.store.path_for(os.path.basename(file_path), trashed, file_path)
+        try:
+            name, new_path, trashed, new_thumb = self._move_file(file_path, new_path, trashed)
+        except OSError:
+            # Nothing was moved, so there is nothing to replay
+            self.journal.finish(op_id)
+            raise
+        self.catalog.set_location(name, new_path, trashed=trashed, thumb_path=new_thumb)
+        self.journal.finish(op_id)
+        return new_path
+
+    def delete_photo(self, file_path):
+        return self._move(file_path, trashed=True)
+
+    def restore_photo(self, file_path):
+        return self._move(file_path, trashed=False)
+
+    def _purge_file(self, file_path):
+        thumb_entry = self.thumbnails.entry_for(file_path)
+        key = storage_key(os.path.basename(file_path), file_path)
+        with metrics.timer("camera_file_delete_seconds"):
+            os.remove(file_path)
+        self.thumbnails.discard_entry(thumb_entry)
+        metrics.inc("camera_file_deletes_total")
+        if self.uploader is not None:
+            # Gone for good, so the remote copy goes too
+            self.uploader.delete(key)
+
+    def delete_permanently(self, file_path):
+        op_id = self.journal_begin("purge", [file_path])
+        try:
+            self._purge_file(file_path)
+        except OSError:
+            self.journal.finish(op_id)
+            raise
+        self.catalog.remove(os.path.basename(file_path))
+        self.journal.finish(op_id)
+
+    def batch(self, action, paths):
+        # Runs on a background thread, see BatchOperation
+        operation = BatchOperation(self, action, paths)
+        operation.start()
+        return operation
+
+    def delete_photos(self, paths):
+        return self.batch("delete", paths)
+
+    def restore_photos(self, paths):
+        return self.batch("restore", paths)
+
+    def delete_permanently_many(self, paths):
+        return self.batch("purge", paths)
+
+    def restore_all(self):
+        return self.batch("restore", self.catalog.paths(trashed=True))
+
+    def empty_recycle_bin(self):
+        return self.batch("purge", self.catalog.paths(trashed=True))
+
+    def migrate_layout(self, workers=8):
+        # Moves photos still lying flat in the photo and recycle bin folders
+        # into their YYYY/MM/DD folders, many at a time. Journaled like a
+        # batch, with one catalog commit per folder. Legacy sidecars are
+        # folded into EXIF first (that only looks in the flat folders), and
+        # any that stay behind move along with their photo.
+        self.migrate_exif()
+        moved = 0
+        errors = []
+        for trashed, root in self.store.roots.items():
+            self._move_stray_sidecars(root)
+            moves = [
+                (entry.path, self.store.path_for(entry.name, trashed, entry.path))
+                for entry in os.scandir(root)
+                if media_kind(entry.name) and ".tmp." not in entry.name and entry.is_file()
+            ]
+            if not moves:
+                continue
+
+            op_id = self.journal.begin("migrate", moves, trashed=trashed)
+
+            def move(paths):
+                try:
+                    update = self._move_file(paths[0], paths[1], trashed)
+                    sidecar = os.path.splitext(paths[0])[0] + "_METADATA.txt"
+                    if os.path.exists(sidecar):
+                        os.replace(sidecar, os.path.splitext(paths[1])[0] + "_METADATA.txt")
+                    return update
+                except OSError as e:
+                    errors.append((paths[0], str(e)))
+                    return None
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate") as pool:
+                done = [update for update in pool.map(move, moves) if update is not None]
+            self.catalog.set_locations(done)
+            self.journal.finish(op_id)
+            moved += len(done)
+        return moved, errors
+
+    def _move_stray_sidecars(self, root):
+        # Sidecars whose photo an interrupted migration already moved on
+        for entry in os.scandir(root):
+            if not entry.name.endswith("_METADATA.txt"):
+                continue
+            photo_name = entry.name[:-len("_METADATA.txt")] + ".jpg"
+            location = self.catalog.location(photo_name)
+            if location is not None and os.path.dirname(location[0]) != root:
+                try:
+                    os.replace(entry.path, os.path.splitext(location[0])[0] + "_METADATA.txt")
+                except OSError as e:
+                    self.log(f"Error: could not move {entry.name}: {e}")
+
+    HASH_CHUNK = 64  # photos per worker task
+
+    def index_hashes(self, workers=None, progress=None, cancelled=None):
+        # Perceptual hashes for every photo that has none yet: new since the
+        # last run, or changed on disk. Each chunk is saved as soon as it is
+        # done, so an interrupted run carries on where it stopped next time.
+        # progress(processed, total) is called from this thread.
+        # Returns (hashed, errors as (path, message)).
+        rows = self.catalog.unhashed()
+        chunks = [rows[i:i + self.HASH_CHUNK] for i in range(0, len(rows), self.HASH_CHUNK)]
+        hashed = processed = 0
+        errors = []
+        if progress is not None:
+            progress(0, len(rows))
+        for chunk, results in self._hash_chunks(chunks, workers or os.cpu_count() or 1):
+            done = []
+            for row, (path, ahash, dhash, error) in zip(chunk, results):
+                if error is None:
+                    done.append((row["name"], ahash, dhash))
+                else:
+                    errors.append((path, error))
+            self.catalog.set_hashes(done)
+            hashed += len(done)
+            processed += len(chunk)
+            if progress is not None:
+                progress(processed, len(rows))
+            if cancelled is not None and cancelled.is_set():
+                break
+        return hashed, errors
+
+    def _hash_chunks(self, chunks, workers):
+        # Yields (chunk, hash_files results) as they finish; a backlog this
+        # small isn't worth starting worker processes for
+        if len(chunks) <= 2:
+            for chunk in chunks:
+                yield chunk, hash_files([row["path"] for row in chunk])
+            return
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            futures = {pool.submit(hash_files, [row["path"] for row in chunk]): chunk for chunk in chunks}
+            try:
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [(row["path"], None, None, str(e)) for row in chunk]
+                    yield chunk, results
+            finally:
+                # Stopped early: drop the chunks that haven't started
+                for future in futures:
+                    future.cancel()
+
+    def find_duplicates(self, max_distance=6, trashed=False):
+        # Groups of look-alike photos among those already hashed
+        return group_duplicates(self.catalog.hashed(trashed), max_distance)
+
+    def search_duplicates(self, max_distance=6):
+        # Runs on a background thread, see DuplicateSearch
+        search = DuplicateSearch(self, max_distance)
+        search.start()
+        return search
+
+    def reencode(self, profile, max_size=None, workers=None, include_archives=False):
+        # Rewrites every photo in the gallery (not the recycle bin) with an
+        # encode profile and/or shrinks it to fit max_size, on a process pool.
+        # Raw archives are skipped unless include_archives is set.
+        # Returns a summary dict and the errors as (path, message).
+        rows = [row for row in self.catalog.page(False, self.catalog.count()) if row["kind"] == "photo"]
+        archives = 0
+        if not include_archives:
+            archives = len(rows)
+            rows = [row for row in rows if not is_raw_archive(row["name"], row["width"], row["height"])]
+            archives -= len(rows)
+        workers = workers or os.cpu_count() or 1
+        summary = {
+            "photos": len(rows), "archives_skipped": archives, "rewritten": 0, "old_bytes": 0, "new_bytes": 0,
+            "cpu_seconds": 0.0, "workers": workers,
+        }
+        errors = []
+        changes = []
+        start = time.perf_counter()
+        # Spawned, not forked: a fork would copy this process's threads and locks
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {}
+            for row in rows:
+                path = row["path"]
+                settings = (row["taken_at"], row["iso"], row["aperture"], row["shutter"])
+                # Thumbnails are keyed by mtime and size, so look it up before the file changes
+                future = pool.submit(reencode_file, path, profile, max_size, settings)
+                futures[future] = (path, self.thumbnails.entry_for(path))
+            for future in as_completed(futures):
+                path, thumb_entry = futures[future]
+                try:
+                    new_path, old_bytes, new_bytes, width, height, cpu_seconds = future.result()
+                except Exception as e:
+                    errors.append((path, str(e)))
+                    continue
+                summary["old_bytes"] += old_bytes
+                summary["new_bytes"] += new_bytes
+                summary["cpu_seconds"] += cpu_seconds
+                if new_path is None:
+                    continue
+                summary["rewritten"] += 1
+                new_thumb = self.thumbnails.moved(thumb_entry, new_path) or self.thumbnails.entry_for(new_path)
+                changes.append((
+                    os.path.basename(path), os.path.basename(new_path), new_path, width, height, new_thumb
+                ))
+                if len(changes) >= 256:
+                    self._reencoded(changes)
+                    changes = []
+        self._reencoded(changes)
+        summary["seconds"] = time.perf_counter() - start
+        return summary, errors
+
+    def _reencoded(self, changes):
+        self.catalog.set_files(changes)
+        if self.uploader is not None:
+            for name, new_name, path, _, _, _ in changes:
+                if new_name != name:
+                    self.uploader.delete(storage_key(name, path))
+                self.uploader.upload(new_name)
+
+    def close(self):
+        self.pipeline.shutdown()
+        self.session.stop()
+        if self.uploader is not None:
+            self.uploader.close()
+        self.catalog.close()
+
+
+# --- NEW: Virtualized thumbnail grid ---
+# Only the rows on screen (plus a little overscan) get real widgets and
+# PhotoImages. Cells are recycled while scrolling, and thumbnails are decoded
+# on a background pool while a placeholder is shown. Photo paths are
+# fetched from the catalog a page at a time, as rows scroll into view.
+class GalleryCell:
+    def __init__(self, gallery):
+        self.path = None
+        self.photo = None
+        self.frame = tk.Frame(
+            gallery.canvas, bg="#2c3e50", bd=2, relief="groove",
+            width=gallery.CELL_WIDTH - 10, height=gallery.CELL_HEIGHT - 10
+        )
+        self.frame.pack_propagate(False)
+
+        self.image_label = tk.Label(
+            self.frame,
+            image=gallery.placeholder,
+            bg='#2c3e50',
+            cursor="hand2" if gallery.on_open else ""
+        )
+        self.image_label.pack(pady=5)
+
+        name_row = tk.Frame(self.frame, bg="#2c3e50")
+        name_row.pack(pady=(0, 5))
+        self.selected = tk.BooleanVar(value=False)
+        self.check = tk.Checkbutton(
+            name_row, variable=self.selected, bg="#2c3e50", activebackground="#2c3e50",
+            selectcolor="#34495e", command=lambda: gallery.set_selected(self.path, self.selected.get())
+        )
+        self.check.pack(side="left")
+        self.name_label = tk.Label(name_row, bg='#2c3e50', fg='white', font=('Arial', 9))
+        self.name_label.pack(side="left")
+
+        btn_frame = tk.Frame(self.frame, bg="#2c3e50")
+        btn_frame.pack(pady=5)
+        self.buttons = []
+        for text, _ in gallery.actions:
+            button = ttk.Button(btn_frame, text=text)
+            button.pack(side="left", padx=5)
+            self.buttons.append(button)
+
+        for widget in (self.frame, self.image_label, name_row, self.check, self.name_label, btn_frame):
+            gallery.bind_wheel(widget)
+
+        self.window = gallery.canvas.create_window(0, 0, window=self.frame, anchor="nw")
+
+
+class VirtualGallery:
+    CELL_WIDTH = 240
+    CELL_HEIGHT = 290
+    OVERSCAN_ROWS = 1
+    DECODED_CACHE_SIZE = 256  # small PIL thumbnails kept for scrolling back
+    PAGE_SIZE = 200
+
+    def __init__(self, window, thumbnails, total, fetch_page, actions, on_open=None, batch_actions=(),
+                 label_for=None, trashed=False):
+        self.window = window
+        self.trashed = trashed  # shows the recycle bin rather than the library
+        self.thumbnails = thumbnails
+        self.paths = [None] * total  # filled in lazily by fetch_page(offset, limit)
+        self.fetch_page = fetch_page
+        self.actions = actions  # [(button text, callback(path, gallery))]
+        self.on_open = on_open
+        self.label_for = label_for or os.path.basename  # text under each thumbnail
+        self.selected = set()
+        self.busy = False  # a batch job is running on this gallery
+        self.columns = 1
+        self.cells = {}  # index in self.paths -> GalleryCell
+        self.free_cells = []
+        self.decoded = OrderedDict()
+        self.pending = set()
+        self.failed = set()
+        self.wanted = set()
+        self.ready = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="thumbs")
+        self.closed = False
+
+        # Selection toolbar: select all/none plus the batch actions
+        toolbar = tk.Frame(window, bg="#1c1c1c")
+        toolbar.pack(fill="x", padx=5, pady=5)
+        ttk.Button(toolbar, text="Select all", command=self.select_all).pack(side="left", padx=2)
+        ttk.Button(toolbar, text="Select none", command=self.clear_selection).pack(side="left", padx=2)
+        self.batch_buttons = []
+        for text, callback in batch_actions:
+            button = ttk.Button(toolbar, text=text, command=lambda cb=callback: cb(self.selected_paths(), self))
+            button.pack(side="left", padx=2)
+            self.batch_buttons.append(button)
+        self.selection_label = tk.Label(toolbar, bg="#1c1c1c", fg="white", font=('Arial', 9))
+        self.selection_label.pack(side="right", padx=5)
+        self.update_selection_label()
+
+        main_frame = tk.Frame(window, bg="#1c1c1c")
+        main_frame.pack(fill="both", expand=1)
+
+        self.canvas = tk.Canvas(main_frame, bg="#1c1c1c", highlightthickness=0, yscrollincrement=40)
+        self.canvas.pack(side="left", fill="both", expand=1)
+
+        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.on_scroll)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.configure(yscrollcommand=scrollbar.set)
 
-# --- NEW: Import the Pillow library ---
-# You must install this first: pip install Pillow
-try:
-    from PIL import Image, ImageDraw, ImageFont, ImageTk
-except ImportError:
-    print("Error: The 'Pillow' library is required to run this app.")
-    print("Please install it by running: pip install Pillow")
-    exit()
+        self.placeholder = ImageTk.PhotoImage(Image.new("RGB", (200, 150), "#34495e"))
 
-# --- NEW: Import the OpenCV library ---
-# You must install this first: pip install opencv-python
-try:
-    import cv2
-except ImportError:
-    print("Error: The 'opencv-python' library is required to run this app.")
-    print("Please install it by running: pip install opencv-python")
-    exit()
+        self.canvas.bind("<Configure>", lambda e: self.layout())
+        self.bind_wheel(self.canvas)
+        self.canvas.bind("<Destroy>", lambda e: self.close())
+        self.window.after(50, self.poll_ready)
+
+    def bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_wheel)
+        widget.bind("<Button-4>", self.on_wheel)
+        widget.bind("<Button-5>", self.on_wheel)
+
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-1, "units")
+        else:
+            self.canvas.yview_scroll(1, "units")
+        self.refresh()
+
+    def layout(self):
+        columns = max(1, self.canvas.winfo_width() // self.CELL_WIDTH)
+        if columns != self.columns:
+            # Every cell moves when the column count changes
+            self.columns = columns
+            for index in list(self.cells):
+                self.release(index)
+
+        rows = math.ceil(len(self.paths) / self.columns)
+        self.canvas.configure(scrollregion=(0, 0, self.columns * self.CELL_WIDTH, rows * self.CELL_HEIGHT))
+        self.refresh()
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), self.CELL_HEIGHT)
+        first_row = max(0, int(top // self.CELL_HEIGHT) - self.OVERSCAN_ROWS)
+        last_row = int((top + height) // self.CELL_HEIGHT) + self.OVERSCAN_ROWS
+        return range(first_row * self.columns, min(len(self.paths), (last_row + 1) * self.columns))
+
+    def load_paths(self, visible):
+        for index in visible:
+            if self.paths[index] is None:
+                page = self.fetch_page(index, self.PAGE_SIZE)[:len(self.paths) - index]
+                self.paths[index:index + len(page)] = page
+                # The catalog shrank under us: forget the rows that are gone
+                if not page:
+                    del self.paths[index:]
+                    return
+
+    def refresh(self):
+        self.load_paths(self.visible_range())
+        visible = self.visible_range()
+
+        for index in list(self.cells):
+            if index not in visible:
+                self.release(index)
+
+        for index in visible:
+            cell = self.cells.get(index)
+            if cell is None:
+                cell = self.free_cells.pop() if self.free_cells else GalleryCell(self)
+                self.cells[index] = cell
+            self.show(cell, index)
+
+        # Workers skip anything that scrolled away before they got to it
+        self.wanted = {self.paths[index] for index in visible}
+
+    def release(self, index):
+        cell = self.cells.pop(index)
+        self.canvas.itemconfigure(cell.window, state="hidden")
+        self.free_cells.append(cell)
+
+    def show(self, cell, index):
+        path = self.paths[index]
+        row, column = divmod(index, self.columns)
+        self.canvas.coords(cell.window, column * self.CELL_WIDTH + 5, row * self.CELL_HEIGHT + 5)
+        self.canvas.itemconfigure(cell.window, state="normal")
+
+        cell.selected.set(path in self.selected)
+        if cell.path == path:
+            return
+        cell.path = path
+        cell.name_label.config(text=self.label_for(path))
+        for button, (_, callback) in zip(cell.buttons, self.actions):
+            button.config(command=lambda p=path, cb=callback: cb(p, self))
+        if self.on_open:
+            cell.image_label.bind("<Button-1>", lambda e, p=path: self.on_open(p, self))
+
+        thumb = self.decoded.get(path)
+        if thumb is not None:
+            self.decoded.move_to_end(path)
+            self.set_image(cell, thumb)
+        else:
+            cell.photo = None
+            cell.image_label.config(image=self.placeholder)
+            self.request(path)
+
+    def set_image(self, cell, thumb):
+        cell.photo = ImageTk.PhotoImage(thumb)
+        cell.image_label.config(image=cell.photo)
+
+    def request(self, path):
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        future = self.pool.submit(self.decode, path)
+        future.add_done_callback(lambda f, p=path: self.ready.put((p, f)))
+
+    def decode(self, path):
+        if path not in self.wanted and self.wanted:
+            return None
+        return self.thumbnails.get(path)
+
+    def poll_ready(self):
+        if self.closed:
+            return
+        while True:
+            try:
+                path, future = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(path)
+            try:
+                thumb = future.result()
+            except Exception:
+                # Unreadable photo: keep the placeholder, don't retry
+                self.failed.add(path)
+                continue
+            if thumb is None:
+                continue
+
+            self.decoded[path] = thumb
+            if len(self.decoded) > self.DECODED_CACHE_SIZE:
+                self.decoded.popitem(last=False)
+            for cell in self.cells.values():
+                if cell.path == path:
+                    self.set_image(cell, thumb)
+
+        # A skipped path might have scrolled back into view meanwhile
+        for cell in self.cells.values():
+            if (cell.photo is None and cell.path not in self.pending
+                    and cell.path not in self.decoded and cell.path not in self.failed):
+                self.request(cell.path)
+
+        self.window.after(50, self.poll_ready)
+
+    def index_of(self, path):
+        try:
+            return self.paths.index(path)
+        except ValueError:
+            return None
+
+    def path_at(self, index):
+        # For stepping through photos from the viewer; loads the page if needed
+        if not 0 <= index < len(self.paths):
+            return None
+        self.load_paths([index])
+        return self.paths[index] if index < len(self.paths) else None
+
+    def set_selected(self, path, selected):
+        if path is None:
+            return
+        if selected:
+            self.selected.add(path)
+        else:
+            self.selected.discard(path)
+        self.update_selection_label()
+
+    def select_all(self):
+        # Pulls in the paths of rows that were never scrolled to
+        self.load_paths(range(len(self.paths)))
+        self.select_paths(path for path in self.paths if path is not None)
+
+    def select_paths(self, paths):
+        self.selected = set(paths)
+        self.refresh()
+        self.update_selection_label()
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.refresh()
+        self.update_selection_label()
+
+    def selected_paths(self):
+        # In gallery order, newest first
+        return [path for path in self.paths if path in self.selected]
+
+    def update_selection_label(self):
+        self.selection_label.config(text=f"{len(self.selected)} of {len(self.paths)} selected")
+
+    def set_busy(self, busy):
+        self.busy = busy
+        for button in self.batch_buttons:
+            button.config(state=tk.DISABLED if busy else tk.NORMAL)
+
+    def reset(self, total):
+        # Start over from the catalog, e.g. after a batch moved many photos
+        for index in list(self.cells):
+            self.cells[index].path = None
+            self.release(index)
+        self.paths = [None] * total
+        self.selected.clear()
+        self.canvas.yview_moveto(0)
+        self.update_selection_label()
+        self.layout()
+
+    def remove(self, path):
+        # Drop one photo and shift the cells after it back by one slot
+        removed = self.paths.index(path)
+        self.paths.pop(removed)
+        self.decoded.pop(path, None)
+        self.selected.discard(path)
+
+        cells = {}
+        for index, cell in self.cells.items():
+            if index == removed:
+                cell.path = None
+                self.canvas.itemconfigure(cell.window, state="hidden")
+                self.free_cells.append(cell)
+            else:
+                cells[index - 1 if index > removed else index] = cell
+        self.cells = cells
+        self.update_selection_label()
+        self.layout()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- NEW: Reusable full-size viewer ---
+# One window for every photo, with previous/next (buttons or arrow keys)
+# through the gallery it was opened from. A big photo is painted straight
+# away from a draft decode (or its cached thumbnail) and replaced by the
+# full quality render once a worker has made it. The neighbours are decoded in
+# the background, so stepping through photos usually hits the cache.
+class ImageViewer:
+    MAX_SIZE = (900, 700)
+    CACHE_MB = 64
+
+    def __init__(self, root, thumbnails, on_play=None):
+        self.root = root
+        self.thumbnails = thumbnails
+        self.on_play = on_play
+        self.cache = DecodedImageCache(self.CACHE_MB * 1024 * 1024)
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="viewer")
+        self.ready = queue.Queue()
+        self.pending = set()
+        self.window = None
+        self.gallery = None
+        self.path = None
+        self.direction = 1
+        self.photo = None
+
+    def build(self):
+        self.window = Toplevel(self.root)
+        self.window.configure(bg="#1c1c1c")
+        # Closing only hides the window, the cache stays warm
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+
+        self.image_label = tk.Label(self.window, bg='#1c1c1c', fg='red')
+        self.image_label.pack(padx=10, pady=10)
+
+        nav = tk.Frame(self.window, bg="#1c1c1c")
+        nav.pack(fill="x", padx=10, pady=(0, 10))
+        self.prev_button = ttk.Button(nav, text="◀ Previous", command=lambda: self.step(-1))
+        self.prev_button.pack(side="left")
+        self.next_button = ttk.Button(nav, text="Next ▶", command=lambda: self.step(1))
+        self.next_button.pack(side="right")
+        self.play_button = ttk.Button(nav, text="▶ Play", command=lambda: self.on_play(self.path))
+        self.name_label = tk.Label(nav, bg='#1c1c1c', fg='white', font=('Arial', 10))
+        self.name_label.pack(side="left", expand=True)
+
+        self.window.bind("<Left>", lambda e: self.step(-1))
+        self.window.bind("<Right>", lambda e: self.step(1))
+        self.window.bind("<Escape>", lambda e: self.window.withdraw())
+        self.window.after(30, self.poll_ready)
+
+    def show(self, path, gallery=None):
+        if self.window is None or not self.window.winfo_exists():
+            self.build()
+        self.window.deiconify()
+        self.window.lift()
+        self.window.focus_set()
+        self.gallery = gallery
+        self.display(path)
+
+    def step(self, offset):
+        if self.gallery is None:
+            return
+        index = self.gallery.index_of(self.path)
+        if index is None:
+            return
+        path = self.gallery.path_at(index + offset)
+        if path is not None:
+            self.direction = offset
+            self.display(path)
+
+    def display(self, path):
+        self.path = path
+        name = os.path.basename(path)
+        self.window.title(name)
+        self.name_label.config(text=name)
+        if media_kind(path) == "video" and self.on_play:
+            self.play_button.pack(side="right", padx=10)
+        else:
+            self.play_button.pack_forget()
+        self.update_buttons()
+
+        try:
+            key = DecodedImageCache.key(path)
+            full = self.cache.get(key)
+            if full is not None:
+                metrics.inc("camera_viewer_cache_hits_total")
+                self.paint(full)
+            else:
+                metrics.inc("camera_viewer_cache_misses_total")
+                with metrics.timer("camera_viewer_first_paint_seconds"):
+                    first, final = quick_decode(path, self.MAX_SIZE)
+                    if first is None:
+                        # No draft decode for this format: stretch the cached thumbnail
+                        thumb = self.thumbnails.get(path)
+                        first = thumb.resize(fit_size(thumb.size, self.MAX_SIZE), Image.Resampling.BILINEAR)
+                    self.paint(first)
+                if final:
+                    self.cache.put(key, first)
+                else:
+                    self.request(path, key)
+        except Exception as e:
+            self.photo = None
+            self.image_label.config(image="", text=f"Error opening image: {e}")
+            return
+        self.prefetch()
+
+    def paint(self, img):
+        self.photo = ImageTk.PhotoImage(img)
+        self.image_label.config(image=self.photo, text="")
+
+    def update_buttons(self):
+        index = self.gallery.index_of(self.path) if self.gallery is not None else None
+        has_prev = index is not None and index > 0
+        has_next = index is not None and index + 1 < len(self.gallery.paths)
+        self.prev_button.config(state=tk.NORMAL if has_prev else tk.DISABLED)
+        self.next_button.config(state=tk.NORMAL if has_next else tk.DISABLED)
+
+    def request(self, path, key):
+        if key in self.pending:
+            return
+        self.pending.add(key)
+        future = self.pool.submit(self.decode_full, path)
+        future.add_done_callback(lambda f, p=path, k=key: self.ready.put((p, k, f)))
+
+    def decode_full(self, path):
+        with metrics.timer("camera_viewer_full_decode_seconds"):
+            return decode_for_screen(path, self.MAX_SIZE)
+
+    def prefetch(self):
+        # Both neighbours, plus one more in the direction we are going
+        if self.gallery is None:
+            return
+        index = self.gallery.index_of(self.path)
+        if index is None:
+            return
+        for offset in (self.direction, -self.direction, 2 * self.direction):
+            neighbour = self.gallery.path_at(index + offset)
+            if neighbour is None:
+                continue
+            try:
+                key = DecodedImageCache.key(neighbour)
+            except OSError:
+                continue
+            if key not in self.cache:
+                self.request(neighbour, key)
+
+    def poll_ready(self):
+        if self.window is None or not self.window.winfo_exists():
+            return
+        while True:
+            try:
+                path, key, future = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(key)
+            try:
+                img = future.result()
+            except Exception:
+                continue  # the draft (or the error) stays up
+            self.cache.put(key, img)
+            if path == self.path:
+                self.paint(img)
+        self.window.after(30, self.poll_ready)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 
 class App:
-    def __init__(self, root):
+    PREVIEW_SIZE = (400, 300)
+    PREVIEW_FPS = 15
+
+    def __init__(self, root, source="0", **core_options):
         self.root = root
         self.root.title("Tanish's Camera App")
-        self.root.geometry("450x700")
+        self.root.geometry("880x820")
         self.root.configure(bg='#2c3e50')
 
         # --- Style ---
@@ -40,16 +3672,29 @@ class App:
         style.configure('TLabel', background='#2c3e50', foreground='#ecf0f1', font=('Arial', 10))
         style.configure('Horizontal.TScale', background='#2c3e50')
         
-        # --- Photo Directories ---
-        self.photo_dir = "photos"
-        self.recycle_bin_dir = "recycle_bin" # --- NEW: Recycle Bin Path ---
-        
-        if not os.path.exists(self.photo_dir):
-            os.makedirs(self.photo_dir)
-        if not os.path.exists(self.recycle_bin_dir): # --- NEW: Create Recycle Bin ---
-            os.makedirs(self.recycle_bin_dir)
+        # --- NEW: Capture, storage and the catalog live in the UI-free core ---
+        # Helper threads log through background_messages, the Tk loop prints them
+        self.background_messages = queue.Queue()
+        self.core = CameraCore(source, log=self.background_messages.put, **core_options)
+        self.photo_dir = self.core.photo_dir
+        self.recycle_bin_dir = self.core.recycle_bin_dir
             
         self.last_image_path = None # To store the path of the most recent photo
+
+        # --- NEW: Live preview, to the right of the controls ---
+        preview_frame = ttk.Frame(root, padding=(0, 20, 20, 20))
+        preview_frame.pack(side='right', fill='y')
+        ttk.Label(preview_frame, text="Live Preview", font=("Arial", 16, 'bold'), foreground='#3498db').pack(pady=10)
+        # One PhotoImage for the whole session, new frames are pasted into it
+        self.preview_image = ImageTk.PhotoImage("RGB", self.PREVIEW_SIZE)
+        tk.Label(preview_frame, image=self.preview_image, bg='#1c1c1c').pack()
+        self.preview_enabled = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            preview_frame, text="Show live preview", variable=self.preview_enabled
+        ).pack(anchor='w', pady=5)
+        self.preview = None
+        self.preview_sequence = 0
+        self.viewer = None
         
         # --- Main Frame ---
         main_frame = ttk.Frame(root, padding="20")
@@ -67,7 +3712,60 @@ class App:
         self.iso_slider = self.create_slider(settings_frame, "ISO", 100, 3200, 0)
         self.aperture_slider = self.create_slider(settings_frame, "Aperture (f/)", 1.8, 22.0, 1, is_float=True)
         self.shutter_slider = self.create_slider(settings_frame, "Shutter (1/s)", 1, 4000, 2)
-        
+
+        # --- NEW: Let the sliders brighten or darken the photo like a real camera ---
+        self.simulate_exposure = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            settings_frame,
+            text="Simulate exposure (ISO / aperture / shutter)",
+            variable=self.simulate_exposure
+        ).grid(row=3, column=0, columnspan=3, sticky='w', padx=10, pady=5)
+
+        # --- NEW: File format and quality for photos and bursts ---
+        ttk.Label(settings_frame, text="Save as").grid(row=4, column=0, sticky='w', padx=10, pady=5)
+        self.encode_profile = tk.StringVar(value=DEFAULT_ENCODE_PROFILE)
+        ttk.Combobox(
+            settings_frame, textvariable=self.encode_profile, values=list(ENCODE_PROFILES),
+            width=10, state="readonly"
+        ).grid(row=4, column=1, sticky='w', padx=10, pady=5)
+
+        # --- NEW: Burst settings ---
+        burst_frame = ttk.Frame(main_frame)
+        burst_frame.pack(pady=5, fill="x")
+
+        ttk.Label(burst_frame, text="Burst:").pack(side='left', padx=(10, 5))
+        self.burst_count = tk.IntVar(value=10)
+        ttk.Spinbox(burst_frame, from_=1, to=1000, width=5, textvariable=self.burst_count).pack(side='left')
+        ttk.Label(burst_frame, text="frames or").pack(side='left', padx=5)
+        self.burst_seconds = tk.IntVar(value=0)
+        ttk.Spinbox(burst_frame, from_=0, to=600, width=4, textvariable=self.burst_seconds).pack(side='left')
+        ttk.Label(burst_frame, text="s at").pack(side='left', padx=5)
+        self.burst_fps = tk.IntVar(value=10)
+        ttk.Spinbox(burst_frame, from_=1, to=60, width=4, textvariable=self.burst_fps).pack(side='left')
+        ttk.Label(burst_frame, text="fps").pack(side='left', padx=5)
+
+        self.burst_button = ttk.Button(burst_frame, text="Burst", command=self.start_burst, style='TButton')
+        self.burst_button.pack(side='right', padx=10)
+        self.burst = None
+
+        # --- NEW: Video recording ---
+        video_frame = ttk.Frame(main_frame)
+        video_frame.pack(pady=5, fill="x")
+
+        ttk.Label(video_frame, text="Video:").pack(side='left', padx=(10, 5))
+        self.video_fps = tk.IntVar(value=30)
+        ttk.Spinbox(video_frame, from_=1, to=60, width=4, textvariable=self.video_fps).pack(side='left')
+        ttk.Label(video_frame, text="fps").pack(side='left', padx=5)
+        self.video_codec = tk.StringVar(value="MJPG")
+        ttk.Combobox(
+            video_frame, textvariable=self.video_codec, values=list(VideoRecorder.CODECS),
+            width=6, state="readonly"
+        ).pack(side='left', padx=5)
+
+        self.record_button = ttk.Button(video_frame, text="⏺ Record", command=self.toggle_recording, style='TButton')
+        self.record_button.pack(side='right', padx=10)
+        self.recorder = None
+
         # --- Buttons Frame ---
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(pady=20, fill='x', side='bottom')
@@ -99,6 +3797,22 @@ class App:
         )
         self.recycle_bin_button.pack(side='left', fill='x', expand=True, padx=5) # Changed to 'left'
 
+        # --- NEW: Live stats panel ---
+        stats_frame = ttk.Frame(main_frame)
+        stats_frame.pack(pady=(5, 0), fill='x')
+        ttk.Label(stats_frame, text="Stats (p50 / p95 / p99 ms):", font=("Arial", 12, 'bold')).pack(anchor='w')
+        self.stats_label = ttk.Label(stats_frame, text="No data yet.", font=("Consolas", 9), justify='left')
+        self.stats_label.pack(anchor='w', padx=10)
+
+        stats_buttons = ttk.Frame(stats_frame)
+        stats_buttons.pack(fill='x', pady=(5, 0))
+        ttk.Button(stats_buttons, text="Export metrics", command=self.export_metrics).pack(side='left', padx=5)
+        self.profiling = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            stats_buttons, text="Profile (cProfile + tracemalloc)",
+            variable=self.profiling, command=self.toggle_profiling
+        ).pack(side='left', padx=5)
+
         # --- Log Area ---
         log_label = ttk.Label(main_frame, text="Log:", font=("Arial", 12, 'bold'))
         log_label.pack(pady=(10,0), anchor='w')
@@ -112,8 +3826,60 @@ class App:
             font=("Consolas", 9)
         )
         self.log_area.pack(pady=10, fill="both", expand=True)
+        # --- NEW: Log lines are batched and the widget keeps only the newest ones ---
+        self.pending_log = []
+        self.log_flush_scheduled = False
         self.log_message("App started. 'photos' directory is ready.")
 
+        # --- NEW: Open the camera once and keep it open ---
+        if self.core.start():
+            self.preview = self.core.preview(self.PREVIEW_SIZE, self.PREVIEW_FPS)
+            self.root.after(0, self.update_preview)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(50, self.poll_pipeline)
+        self.root.after(1000, self.update_stats)
+
+        # --- NEW: EXIF migration and catalog check, off the Tk thread ---
+        threading.Thread(target=self.run_maintenance, name="maintenance", daemon=True).start()
+
+    def run_maintenance(self):
+        try:
+            self.core.maintenance()
+        except Exception as e:
+            self.background_messages.put(f"Error updating catalog: {e}")
+
+    def on_close(self):
+        if self.viewer is not None:
+            self.viewer.close()
+        if self.preview is not None:
+            self.preview.stop()
+        if self.recorder is not None:
+            # Let the recording finish its file instead of leaving a .tmp behind
+            self.recorder.stop()
+            self.recorder.done.wait(timeout=5.0)
+        if profiler.running:
+            profiler.stop(os.path.abspath("profile.txt"))
+        self.core.close()
+        self.root.destroy()
+
+    # --- NEW: Show the newest preview frame, skipping any we already showed ---
+    def update_preview(self):
+        if self.preview is None:
+            return
+        if self.simulate_exposure.get():
+            self.preview.gain = FrameProcessor.exposure_gain(
+                self.iso_slider.get(), self.aperture_slider.get(), self.shutter_slider.get()
+            )
+        else:
+            self.preview.gain = 1.0
+        self.preview.paused = not self.preview_enabled.get()
+        if not self.preview.paused:
+            self.preview_sequence = self.preview.latest(
+                self.preview_sequence,
+                lambda rgbx: self.preview_image.paste(FrameProcessor.to_image(rgbx))
+            )
+        self.root.after(1000 // self.PREVIEW_FPS, self.update_preview)
+
     def create_slider(self, parent, text, from_, to, row, is_float=False):
         ttk.Label(parent, text=f"{text}:").grid(row=row, column=0, sticky='w', padx=10, pady=5)
         
@@ -141,116 +3907,180 @@ class App:
         parent.grid_columnconfigure(1, weight=1) # Make slider fill space
         return var
 
+    LOG_MAX_LINES = 500
+
     def log_message(self, message):
+        # Queue the line; all lines from this tick are inserted together
+        self.pending_log.append(f"{datetime.datetime.now().strftime('%H:%M:%S')}: {message}\n")
+        if not self.log_flush_scheduled:
+            self.log_flush_scheduled = True
+            self.root.after(100, self.flush_log)
+
+    def flush_log(self):
+        self.log_flush_scheduled = False
+        if not self.pending_log:
+            return
+        text = "".join(self.pending_log[-self.LOG_MAX_LINES:])
+        self.pending_log.clear()
+
         self.log_area.config(state=tk.NORMAL)
-        self.log_area.insert(tk.END, f"{datetime.datetime.now().strftime('%H:%M:%S')}: {message}\n")
+        self.log_area.insert(tk.END, text)
+        # Drop the oldest lines so inserts stay fast however long the app runs
+        lines = int(self.log_area.index('end-1c').split('.')[0])
+        if lines > self.LOG_MAX_LINES:
+            self.log_area.delete('1.0', f"{lines - self.LOG_MAX_LINES + 1}.0")
         self.log_area.config(state=tk.DISABLED)
         self.log_area.see(tk.END) # Auto-scroll
 
+    # --- NEW: Refresh the stats panel once a second ---
+    def update_stats(self):
+        rows = []
+        for label, name in (
+            ("capture", "camera_capture_seconds"),
+            ("encode", "camera_stage_encode_seconds"),
+            ("write", "camera_stage_write_seconds"),
+            ("thumbnail", "camera_thumbnail_decode_seconds"),
+            ("file move", "camera_file_move_seconds"),
+            ("video frm", "camera_video_frame_seconds"),
+            ("preview", "camera_preview_frame_seconds"),
+            ("viewer", "camera_viewer_first_paint_seconds"),
+        ):
+            summary = metrics.summary(name)
+            if summary is not None:
+                rows.append(f"{label:<10}{summary[0]:7.1f} {summary[1]:7.1f} {summary[2]:7.1f}")
+        counters = metrics.counters
+        rows.append(
+            f"saved {counters.get('camera_photos_saved_total', 0)}, "
+            f"errors {counters.get('camera_capture_errors_total', 0)}, "
+            f"dropped {counters.get('camera_burst_dropped_frames_total', 0)}, "
+            f"video frames {counters.get('camera_video_frames_encoded_total', 0)} "
+            f"({counters.get('camera_video_frames_dropped_total', 0)} dropped)"
+        )
+        self.stats_label.config(text="\n".join(rows))
+        self.root.after(1000, self.update_stats)
+
+    def export_metrics(self):
+        try:
+            path = os.path.abspath("metrics.prom")
+            metrics.write_prometheus(path)
+            self.log_message(f"Metrics written to {path}")
+        except Exception as e:
+            self.log_message(f"Error exporting metrics: {e}")
+
+    def toggle_profiling(self):
+        if self.profiling.get():
+            profiler.start()
+            self.log_message("Profiling started.")
+        else:
+            path = profiler.stop(os.path.abspath("profile.txt"))
+            self.log_message(f"Profile written to {path}")
+
     def take_picture(self):
         try:
-            # --- 1. Get current time from 'datetime' ---
-            now = datetime.datetime.now()
-            timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
-            
-            # --- 2. Get values from 'tkinter' sliders ---
-            iso = self.iso_slider.get()
-            aperture = round(self.aperture_slider.get(), 1)
-            shutter_speed_inv = self.shutter_slider.get()
-            
-            # --- 3. Use 'math' to calculate exposure ---
-            shutter_speed = 1 / shutter_speed_inv
-            # Use max(aperture, 0.1) to avoid log(0) if aperture is 0
-            exposure_value = math.log2((max(aperture, 0.1)**2) / shutter_speed)
-
-            # --- 4. Prepare the metadata content ---
-            file_content = f"""
-            Photo Metadata
-            --------------------
-            Timestamp: {now.strftime("%Y-%m-%d %H:%M:%S")}
-            ISO: {iso}
-            Aperture: f/{aperture}
-            Shutter Speed: 1/{shutter_speed_inv} s
-            Exposure Value (EV): {exposure_value:.2f}
-            """
-            
-            # --- 5. Save the .txt file ---
-            filename_txt = f"IMG_{timestamp}_METADATA.txt"
-            file_path_txt = os.path.join(self.photo_dir, filename_txt)
-            with open(file_path_txt, "w") as f:
-                f.write(file_content)
-            
-            self.log_message(f"Saved metadata: {filename_txt}")
+            # --- Read the 'tkinter' sliders here (Tk is only safe on this thread),
+            # everything else happens on the pipeline workers ---
+            if not self.core.capture(
+                iso=self.iso_slider.get(),
+                aperture=round(self.aperture_slider.get(), 1),
+                shutter_speed_inv=self.shutter_slider.get(),
+                simulate_exposure=self.simulate_exposure.get(),
+                profile=self.encode_profile.get()
+            ):
+                self.log_message("Busy: too many photos in progress, try again.")
 
-            # --- 6. NEW: Capture a REAL photo from the webcam ---
-            filename_jpg = f"IMG_{timestamp}.jpg"
-            file_path_jpg = os.path.join(self.photo_dir, filename_jpg)
-            
-            # Connect to the default webcam (usually 0)
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
-                self.log_message("Error: Could not open webcam.")
-                return
+        except Exception as e:
+            self.log_message(f"Error: {e}")
 
-            # Read one frame from the webcam
-            ret, frame = cap.read()
-            
-            # Release the webcam immediately
-            cap.release() 
-            
-            if not ret:
-                self.log_message("Error: Could not read frame from webcam.")
-                return
+    # --- NEW: Start a burst on its own thread ---
+    def start_burst(self):
+        if self.burst is not None:
+            self.log_message("A burst is already running.")
+            return
+        try:
+            seconds = self.burst_seconds.get()
+            self.burst = self.core.burst(
+                iso=self.iso_slider.get(),
+                aperture=round(self.aperture_slider.get(), 1),
+                shutter_speed_inv=self.shutter_slider.get(),
+                count=self.burst_count.get(),
+                duration=seconds if seconds > 0 else None,
+                fps=self.burst_fps.get(),
+                simulate_exposure=self.simulate_exposure.get(),
+                profile=self.encode_profile.get()
+            )
+        except (tk.TclError, ValueError) as e:
+            self.log_message(f"Error: invalid burst settings ({e})")
+            return
 
-            # --- 7. NEW: Convert webcam frame to Pillow Image ---
-            # OpenCV uses BGR color, Pillow uses RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # Create a Pillow image from the webcam frame
-            img = Image.fromarray(frame_rgb)
-            
-            # Resize the image to our 800x600 standard size
-            # This ensures the text fits, regardless of your webcam's resolution
-            img = img.resize((800, 600), Image.Resampling.LANCZOS)
+        self.burst_button.config(state=tk.DISABLED)
+        self.log_message("Burst started.")
 
-            # --- 8. Draw metadata text on the REAL photo ---
-            draw = ImageDraw.Draw(img)
+    # --- NEW: Start/stop a video recording ---
+    def toggle_recording(self):
+        if self.recorder is not None:
+            if not self.recorder.stopping.is_set():
+                self.recorder.stop()
+                self.record_button.config(state=tk.DISABLED)
+                self.log_message("Stopping recording...")
+            return
+        try:
+            self.recorder = self.core.record(
+                iso=self.iso_slider.get(),
+                aperture=round(self.aperture_slider.get(), 1),
+                shutter_speed_inv=self.shutter_slider.get(),
+                fps=self.video_fps.get(),
+                codec=self.video_codec.get(),
+                simulate_exposure=self.simulate_exposure.get()
+            )
+        except (tk.TclError, ValueError, RuntimeError) as e:
+            self.log_message(f"Error: could not start recording ({e})")
+            self.recorder = None
+            return
+        self.record_button.config(text="⏹ Stop")
+        self.log_message(f"Recording {self.recorder.job.filename}...")
 
-            # Try to load a nice font, fall back to default
-            try:
-                # You might need to change this path to a font on your system
-                font_path = "arial.ttf"
-                font_large = ImageFont.truetype(font_path, 40)
-                font_medium = ImageFont.truetype(font_path, 24)
-                font_small = ImageFont.truetype(font_path, 18)
-            except IOError:
-                self.log_message("Arial font not found. Using default font.")
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
+    # --- NEW: Pick up finished photos from the pipeline ---
+    def poll_pipeline(self):
+        while not self.background_messages.empty():
+            self.log_message(self.background_messages.get_nowait())
 
-            # Draw text on the image
-            draw.text((400, 280), "SIMULATED PHOTO", fill='#ecf0f1', font=font_large, anchor="mm")
-            
-            draw.text((20, 20), f"IMG_{timestamp}.jpg", fill='#3498db', font=font_medium)
-            
-            draw.text((20, 70), f"ISO: {iso}", fill='#ecf0f1', font=font_small)
-            draw.text((20, 95), f"Aperture: f/{aperture}", fill='#ecf0f1', font=font_small)
-            draw.text((20, 120), f"Shutter: 1/{shutter_speed_inv}s", fill='#ecf0f1', font=font_small)
-            draw.text((20, 145), f"EV: {exposure_value:.2f}", fill='#ecf0f1', font=font_small)
-            
-            # --- THIS LINE IS NOW FIXED ---
-            draw.text((780, 580), "Tanish's Camera App", fill='#7f8c8d', font=font_small, anchor="rs")
+        for job in self.core.poll_results():
+            for message in job.messages:
+                self.log_message(message)
 
-            # Save the image
-            img.save(file_path_jpg)
-            
-            self.log_message(f"Saved image: {filename_jpg}")
-            
-            # --- 9. Store this as the last image path ---
-            self.last_image_path = file_path_jpg
+            if job.error:
+                self.log_message(f"Error: {job.error}")
+                continue
 
-        except Exception as e:
-            self.log_message(f"Error: {e}")
+            stages = ", ".join(f"{stage} {ms:.1f} ms" for stage, ms in job.timings.items())
+            self.log_message(f"Saved image: {job.filename} ({stages})")
+            # Store this as the last image path
+            self.last_image_path = job.file_path
+
+        if self.burst is not None and self.burst.done.is_set():
+            if self.burst.error:
+                self.log_message(f"Burst error: {self.burst.error}")
+            else:
+                self.log_message(
+                    f"Burst finished: {self.burst.captured} frames at "
+                    f"{self.burst.achieved_fps:.1f} fps, {self.burst.dropped} dropped."
+                )
+            self.burst = None
+            self.burst_button.config(state=tk.NORMAL)
+
+        if self.recorder is not None and self.recorder.done.is_set():
+            recorder = self.recorder
+            if recorder.error:
+                self.log_message(f"Recording error: {recorder.error}")
+            else:
+                self.log_message(
+                    f"Saved video: {recorder.job.filename} ({recorder.encoded} frames, "
+                    f"{recorder.duration:.1f} s at {recorder.achieved_fps:.1f} fps, {recorder.dropped} dropped)"
+                )
+            self.recorder = None
+            self.record_button.config(text="⏺ Record", state=tk.NORMAL)
+
+        self.root.after(50, self.poll_pipeline)
 
     # --- NEW: Function to open the full gallery ---
     def open_gallery(self):
@@ -259,136 +4089,83 @@ class App:
         gallery_window.geometry("800x600")
         gallery_window.configure(bg="#1c1c1c")
 
-        # --- Create a scrollable area ---
-        main_frame = tk.Frame(gallery_window, bg="#1c1c1c")
-        main_frame.pack(fill="both", expand=1)
-
-        canvas = tk.Canvas(main_frame, bg="#1c1c1c")
-        canvas.pack(side="left", fill="both", expand=1)
-
-        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=canvas.yview)
-        scrollbar.pack(side="right", fill="y")
-
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        # This frame will contain all the thumbnails
-        scrollable_frame = tk.Frame(canvas, bg="#1c1c1c")
-
-        # Add the scrollable frame to the canvas
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-
-        # Update the scrollregion when the frame's size changes
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        # --- Load photos ---
+        # --- Load photos (newest first, straight from the catalog) ---
         try:
-            # Get all .jpg files, sort by most recent first
-            photo_files = [f for f in os.listdir(self.photo_dir) if f.endswith('.jpg')]
-            photo_files.sort(key=lambda x: os.path.getmtime(os.path.join(self.photo_dir, x)), reverse=True)
+            total = self.core.count(trashed=False)
 
-            if not photo_files:
-                tk.Label(scrollable_frame, text="No photos yet. Click 'Capture' first.", 
+            if not total:
+                tk.Label(gallery_window, text="No photos yet. Click 'Capture' first.", 
                          bg='#1c1c1c', fg='white', font=('Arial', 14)).pack(pady=20, padx=20)
                 return
 
-            # Keep a list of image references to prevent garbage collection
-            self.thumbnail_refs = [] 
-
-            for filename in photo_files:
-                file_path = os.path.join(self.photo_dir, filename)
-                
-                # --- Create Thumbnail ---
-                img = Image.open(file_path)
-                img.thumbnail((200, 200)) # Resize to max 200x200
-                img_tk = ImageTk.PhotoImage(img)
-                
-                # Store reference
-                self.thumbnail_refs.append(img_tk)
-
-                # --- Create a frame for each photo ---
-                thumb_frame = tk.Frame(scrollable_frame, bg="#2c3e50", bd=2, relief="groove")
-                thumb_frame.pack(pady=10, padx=10, fill="x")
-
-                # Create a clickable label
-                # Use lambda to pass the specific file_path to the command
-                img_label = tk.Label(
-                    thumb_frame, 
-                    image=img_tk, 
-                    bg='#2c3e50',
-                    cursor="hand2"
-                )
-                img_label.pack(pady=5)
-                img_label.bind("<Button-1>", lambda e, p=file_path: self.show_full_image(p))
-
-                # Add filename label
-                name_label = tk.Label(
-                    thumb_frame, 
-                    text=filename, 
-                    bg='#2c3e50', 
-                    fg='white', 
-                    font=('Arial', 9)
-                )
-                name_label.pack(pady=(0, 5))
-
-                # --- NEW: Delete Button ---
-                delete_button = ttk.Button(
-                    thumb_frame,
-                    text="Delete",
-                    command=lambda p=file_path, f=thumb_frame: self.delete_photo(p, f)
-                )
-                delete_button.pack(pady=5)
+            # --- Only the visible thumbnails are ever decoded and turned into widgets ---
+            VirtualGallery(
+                gallery_window,
+                self.core.thumbnails,
+                total,
+                lambda offset, limit: self.core.page(False, offset, limit),
+                actions=[("Delete", self.delete_photo)],
+                on_open=self.show_full_image,
+                batch_actions=[("Delete selected", self.delete_selected), ("Find duplicates", self.find_duplicates)]
+            )
 
         except Exception as e:
-            tk.Label(scrollable_frame, text=f"Error loading gallery: {e}", 
+            tk.Label(gallery_window, text=f"Error loading gallery: {e}", 
                      bg='#1c1c1c', fg='red').pack(pady=20, padx=20)
 
     # --- NEW: Function to show a single full-size image ---
-    def show_full_image(self, file_path):
-        image_window = Toplevel(self.root)
-        image_window.title(os.path.basename(file_path))
-        image_window.configure(bg="#1c1c1c")
+    def show_full_image(self, file_path, gallery=None):
+        # --- NEW: One viewer window, reused for every photo ---
+        if self.viewer is None:
+            self.viewer = ImageViewer(self.root, self.core.thumbnails, on_play=self.play_video)
+        self.viewer.show(file_path, gallery)
 
-        try:
-            img = Image.open(file_path)
-            
-            # Optional: Resize if too large for screen, maintaining aspect ratio
-            max_size = (900, 700)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            img_tk = ImageTk.PhotoImage(img)
-            
-            img_label = tk.Label(image_window, image=img_tk, bg='#1c1c1c')
-            
-            # Keep a reference!
-            img_label.image = img_tk 
-            
-            img_label.pack(padx=10, pady=10)
-        
-        except Exception as e:
-            tk.Label(image_window, text=f"Error opening image: {e}", 
-                     bg='#1c1c1c', fg='red').pack(pady=20, padx=20)
+    # --- NEW: Play a recording in its own window ---
+    def play_video(self, file_path):
+        video_window = Toplevel(self.root)
+        video_window.title(os.path.basename(file_path))
+        video_window.configure(bg="#1c1c1c")
+        video_label = tk.Label(video_window, bg='#1c1c1c')
+        video_label.pack(padx=10, pady=10)
+
+        capture = cv2.VideoCapture(file_path)
+        if not capture.isOpened():
+            video_label.config(text=f"Error opening video: {file_path}", fg='red')
+            return
+        delay = max(1, int(1000 / (capture.get(cv2.CAP_PROP_FPS) or 30)))
+
+        def next_frame():
+            if not video_window.winfo_exists():
+                capture.release()
+                return
+            ret, frame = capture.read()
+            if not ret:
+                # Loop back to the start
+                capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = capture.read()
+                if not ret:
+                    capture.release()
+                    return
+            photo = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+            video_label.config(image=photo)
+            video_label.image = photo  # Keep a reference!
+            video_window.after(delay, next_frame)
+
+        video_window.bind("<Destroy>", lambda e: capture.release() if e.widget is video_window else None)
+        next_frame()
 
     # --- NEW: Function to delete a photo (move to recycle bin) ---
-    def delete_photo(self, file_path, thumb_frame):
+    def delete_photo(self, file_path, gallery):
         try:
             base_name = os.path.basename(file_path)
-            txt_name = base_name.replace('.jpg', '_METADATA.txt')
-            txt_path = os.path.join(self.photo_dir, txt_name)
 
-            # Move .jpg to recycle bin
-            shutil.move(file_path, os.path.join(self.recycle_bin_dir, base_name))
-            
-            # Move .txt to recycle bin (if it exists)
-            if os.path.exists(txt_path):
-                shutil.move(txt_path, os.path.join(self.recycle_bin_dir, txt_name))
+            # Move .jpg to recycle bin (the core keeps the catalog in step)
+            self.core.delete_photo(file_path)
             
             self.log_message(f"Moved to recycle bin: {base_name}")
             
             # Remove the thumbnail from the gallery window
-            thumb_frame.destroy()
+            gallery.remove(file_path)
             
         except Exception as e:
             self.log_message(f"Error deleting {file_path}: {e}")
@@ -400,115 +4177,481 @@ class App:
         recycle_window.geometry("800x600")
         recycle_window.configure(bg="#1c1c1c")
 
-        # --- Create a scrollable area (same as gallery) ---
-        main_frame = tk.Frame(recycle_window, bg="#1c1c1c")
-        main_frame.pack(fill="both", expand=1)
-        canvas = tk.Canvas(main_frame, bg="#1c1c1c")
-        canvas.pack(side="left", fill="both", expand=1)
-        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=canvas.yview)
-        scrollbar.pack(side="right", fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        scrollable_frame = tk.Frame(canvas, bg="#1c1c1c")
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
         # --- Load photos from recycle bin ---
         try:
-            photo_files = [f for f in os.listdir(self.recycle_bin_dir) if f.endswith('.jpg')]
-            photo_files.sort(key=lambda x: os.path.getmtime(os.path.join(self.recycle_bin_dir, x)), reverse=True)
+            total = self.core.count(trashed=True)
 
-            if not photo_files:
-                tk.Label(scrollable_frame, text="Recycle Bin is empty.", 
+            if not total:
+                tk.Label(recycle_window, text="Recycle Bin is empty.", 
                          bg='#1c1c1c', fg='white', font=('Arial', 14)).pack(pady=20, padx=20)
                 return
 
-            self.recycle_thumbnail_refs = [] # Separate list for recycle bin
-
-            for filename in photo_files:
-                file_path = os.path.join(self.recycle_bin_dir, filename)
-                
-                img = Image.open(file_path)
-                img.thumbnail((200, 200))
-                img_tk = ImageTk.PhotoImage(img)
-                self.recycle_thumbnail_refs.append(img_tk)
-
-                thumb_frame = tk.Frame(scrollable_frame, bg="#2c3e50", bd=2, relief="groove")
-                thumb_frame.pack(pady=10, padx=10, fill="x")
-
-                img_label = tk.Label(thumb_frame, image=img_tk, bg='#2c3e50')
-                img_label.pack(pady=5)
-
-                name_label = tk.Label(thumb_frame, text=filename, bg='#2c3e50', fg='white', font=('Arial', 9))
-                name_label.pack(pady=(0, 5))
-
-                # --- Button Frame for Restore/Delete ---
-                btn_frame = tk.Frame(thumb_frame, bg="#2c3e50")
-                btn_frame.pack(pady=5)
-
-                # --- Restore Button ---
-                restore_button = ttk.Button(
-                    btn_frame,
-                    text="Restore",
-                    command=lambda p=file_path, f=thumb_frame: self.restore_photo(p, f)
-                )
-                restore_button.pack(side="left", padx=5)
-                
-                # --- Delete Permanently Button ---
-                delete_perm_button = ttk.Button(
-                    btn_frame,
-                    text="Delete Permanently",
-                    command=lambda p=file_path, f=thumb_frame: self.delete_permanently(p, f)
-                )
-                delete_perm_button.pack(side="left", padx=5)
+            # --- Same virtualized grid as the gallery, with Restore/Delete buttons ---
+            VirtualGallery(
+                recycle_window,
+                self.core.thumbnails,
+                total,
+                lambda offset, limit: self.core.page(True, offset, limit),
+                actions=[("Restore", self.restore_photo), ("Delete Permanently", self.delete_permanently)],
+                batch_actions=[
+                    ("Restore selected", self.restore_selected),
+                    ("Delete selected", self.delete_selected_permanently),
+                    ("Restore all", self.restore_all),
+                    ("Empty recycle bin", self.empty_recycle_bin),
+                ],
+                trashed=True
+            )
 
         except Exception as e:
-            tk.Label(scrollable_frame, text=f"Error loading recycle bin: {e}", 
+            tk.Label(recycle_window, text=f"Error loading recycle bin: {e}", 
                      bg='#1c1c1c', fg='red').pack(pady=20, padx=20)
 
     # --- NEW: Function to restore a photo ---
-    def restore_photo(self, file_path, thumb_frame):
+    def restore_photo(self, file_path, gallery):
         try:
             base_name = os.path.basename(file_path)
-            txt_name = base_name.replace('.jpg', '_METADATA.txt')
-            txt_path = os.path.join(self.recycle_bin_dir, txt_name)
 
             # Move .jpg back to photos
-            shutil.move(file_path, os.path.join(self.photo_dir, base_name))
-            
-            # Move .txt back to photos (if it exists)
-            if os.path.exists(txt_path):
-                shutil.move(txt_path, os.path.join(self.photo_dir, txt_name))
+            self.core.restore_photo(file_path)
             
             self.log_message(f"Restored: {base_name}")
-            thumb_frame.destroy()
+            gallery.remove(file_path)
             
         except Exception as e:
             self.log_message(f"Error restoring {file_path}: {e}")
 
     # --- NEW: Function to delete permanently ---
-    def delete_permanently(self, file_path, thumb_frame):
+    def delete_permanently(self, file_path, gallery):
         try:
             base_name = os.path.basename(file_path)
-            txt_name = base_name.replace('.jpg', '_METADATA.txt')
-            txt_path = os.path.join(self.recycle_bin_dir, txt_name)
 
-            # Delete .jpg
-            os.remove(file_path)
-            
-            # Delete .txt (if it exists)
-            if os.path.exists(txt_path):
-                os.remove(txt_path)
+            # Delete .jpg and its cached thumbnail
+            self.core.delete_permanently(file_path)
             
             self.log_message(f"Permanently deleted: {base_name}")
-            thumb_frame.destroy()
+            gallery.remove(file_path)
             
         except Exception as e:
             self.log_message(f"Error permanently deleting {file_path}: {e}")
 
-if __name__ == "__main__":
+    # --- NEW: Batch operations on many photos at once ---
+    def delete_selected(self, paths, gallery):
+        if paths:
+            self.run_batch(self.core.delete_photos(paths), gallery, "Moved to recycle bin")
+
+    def restore_selected(self, paths, gallery):
+        if paths:
+            self.run_batch(self.core.restore_photos(paths), gallery, "Restored")
+
+    def delete_selected_permanently(self, paths, gallery):
+        if paths and messagebox.askyesno(
+                "Delete permanently", f"Permanently delete {len(paths)} photos?", parent=gallery.window):
+            self.run_batch(self.core.delete_permanently_many(paths), gallery, "Permanently deleted")
+
+    def restore_all(self, paths, gallery):
+        self.run_batch(self.core.restore_all(), gallery, "Restored")
+
+    def empty_recycle_bin(self, paths, gallery):
+        if messagebox.askyesno(
+                "Empty recycle bin", "Permanently delete everything in the recycle bin?", parent=gallery.window):
+            self.run_batch(self.core.empty_recycle_bin(), gallery, "Permanently deleted")
+
+    def show_progress(self, operation, parent, title, on_done):
+        # Progress window for a background job with processed/total, cancel() and done
+        progress_window = Toplevel(parent)
+        progress_window.title(title)
+        progress_window.configure(bg="#1c1c1c")
+        progress_window.transient(parent)
+
+        label = tk.Label(progress_window, bg="#1c1c1c", fg="white", font=('Arial', 10))
+        label.pack(padx=20, pady=(15, 5))
+        bar = ttk.Progressbar(progress_window, length=300)
+        bar.pack(padx=20, pady=5)
+        ttk.Button(progress_window, text="Cancel", command=operation.cancel).pack(pady=(5, 15))
+        progress_window.protocol("WM_DELETE_WINDOW", operation.cancel)
+
+        def poll():
+            # The total can grow once the job has looked at the catalog
+            bar.config(maximum=max(1, operation.total), value=operation.processed)
+            label.config(text=f"{operation.processed} of {operation.total} photos")
+            if not operation.done.is_set():
+                progress_window.after(100, poll)
+                return
+            progress_window.destroy()
+            on_done()
+
+        poll()
+
+    def run_batch(self, operation, gallery, verb, reload=None):
+        # One background job with a progress window; the gallery reloads when
+        # it is done, through reload(operation) if given
+        gallery.set_busy(True)
+
+        def finished():
+            if operation.error:
+                self.log_message(f"Error: {operation.error}")
+            self.log_message(f"{verb}: {len(operation.completed)} of {operation.total} photos.")
+            for path, error in operation.errors[:10]:
+                self.log_message(f"Error with {os.path.basename(path)}: {error}")
+            if len(operation.errors) > 10:
+                self.log_message(f"... and {len(operation.errors) - 10} more errors.")
+
+            if not gallery.closed:
+                gallery.set_busy(False)
+                if reload is not None:
+                    reload(operation)
+                else:
+                    # Whatever the batch did, the gallery re-counts its own view
+                    gallery.reset(self.core.count(trashed=gallery.trashed))
+
+        self.show_progress(operation, gallery.window, verb, finished)
+
+    # --- NEW: Look-alike photos, grouped, with all but one of each pre-selected ---
+    def find_duplicates(self, paths, gallery):
+        search = self.core.search_duplicates()
+        gallery.set_busy(True)
+
+        def finished():
+            if not gallery.closed:
+                gallery.set_busy(False)
+            if search.error:
+                self.log_message(f"Error: {search.error}")
+                return
+            for path, error in search.errors[:10]:
+                self.log_message(f"Error hashing {os.path.basename(path)}: {error}")
+            if search.cancelled.is_set():
+                self.log_message("Duplicate search cancelled, the photos hashed so far are kept.")
+                return
+            self.log_message(f"Found {len(search.groups)} groups of look-alike photos.")
+            self.open_duplicates(search.groups)
+
+        self.show_progress(search, gallery.window, "Finding duplicates", finished)
+
+    def open_duplicates(self, groups):
+        duplicates_window = Toplevel(self.root)
+        duplicates_window.title("Duplicates")
+        duplicates_window.geometry("800x600")
+        duplicates_window.configure(bg="#1c1c1c")
+        if not groups:
+            tk.Label(duplicates_window, text="No duplicates found.",
+                     bg='#1c1c1c', fg='white', font=('Arial', 14)).pack(pady=20, padx=20)
+            return
+
+        # Group by group, in one flat list for the grid
+        paths = []
+        labels = {}
+
+        def load(groups):
+            paths.clear()
+            labels.clear()
+            extras = []
+            for number, group in enumerate(groups, 1):
+                for position, row in enumerate(group):
+                    paths.append(row["path"])
+                    labels[row["path"]] = f"Group {number}" + (": keep" if position == 0 else "")
+                extras.extend(row["path"] for row in group[1:])
+            return extras
+
+        def reload(operation):
+            moved = set(operation.completed)
+            remaining = [[row for row in group if row["path"] not in moved] for group in groups]
+            groups[:] = [group for group in remaining if len(group) > 1]
+            extras = load(groups)
+            gallery.reset(len(paths))
+            gallery.select_paths(extras)
+
+        def move_selected(selected, gallery):
+            if selected:
+                self.run_batch(self.core.delete_photos(selected), gallery, "Moved to recycle bin", reload)
+
+        extras = load(groups)
+        gallery = VirtualGallery(
+            duplicates_window,
+            self.core.thumbnails,
+            len(paths),
+            lambda offset, limit: paths[offset:offset + limit],
+            actions=[],
+            on_open=self.show_full_image,
+            batch_actions=[("Move selected to recycle bin", move_selected)],
+            label_for=lambda path: labels.get(path, os.path.basename(path))
+        )
+        gallery.select_paths(extras)
+
+# --- NEW: Command line ---
+# python -m cameraa_app                      -> the Tk app
+# python -m cameraa_app capture --iso 400 --aperture 2.8 --shutter 250 --count 100
+# python -m cameraa_app record --seconds 10 --codec MJPG
+# python -m cameraa_app capture --encode raw-npy       -> full-resolution archive
+# python -m cameraa_app reencode --encode webp --max-size 1600
+# python -m cameraa_app duplicates --max-distance 6 --trash
+# python -m cameraa_app reconcile / migrate-exif / migrate-layout
+# python -m cameraa_app --storage s3://bucket/photos capture   -> also upload
+def make_core(args, **kwargs):
+    return CameraCore(
+        args.source, args.photo_dir, args.recycle_bin_dir, args.thumbnail_dir,
+        storage=args.storage, storage_endpoint_url=args.s3_endpoint_url, **kwargs
+    )
+
+
+def run_capture(args):
+    core = make_core(args)
+    if not core.start():
+        core.close()
+        return 1
+    if args.profile:
+        profiler.start()
+
+    if args.count == 1 and not args.seconds:
+        submitted = 1 if core.capture(
+            args.iso, args.aperture, args.shutter, args.simulate_exposure, profile=args.encode
+        ) else 0
+        burst = None
+    else:
+        burst = core.burst(
+            args.iso, args.aperture, args.shutter,
+            count=args.count, duration=args.seconds or None, fps=args.fps,
+            simulate_exposure=args.simulate_exposure, profile=args.encode
+        )
+        burst.done.wait()
+        submitted = burst.captured
+
+    # Wait for the pipeline to save everything that was taken
+    saved = failed = 0
+    while saved + failed < submitted:
+        for job in core.poll_results():
+            if job.error:
+                failed += 1
+                print(f"Error: {job.error}")
+            else:
+                saved += 1
+                stages = ", ".join(f"{stage} {ms:.1f} ms" for stage, ms in job.timings.items())
+                print(f"Saved image: {job.file_path} ({stages})")
+        time.sleep(0.01)
+
+    if burst is not None:
+        if burst.error:
+            print(f"Burst error: {burst.error}")
+        print(f"Burst finished: {burst.captured} frames at {burst.achieved_fps:.1f} fps, {burst.dropped} dropped.")
+    core.close()
+    if args.profile:
+        print(f"Profile written to {profiler.stop(args.profile)}")
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+    return 0 if saved and not failed else 1
+
+
+def run_record(args):
+    core = make_core(args)
+    if not core.start():
+        core.close()
+        return 1
+    try:
+        recorder = core.record(
+            args.iso, args.aperture, args.shutter, fps=args.fps, codec=args.codec,
+            simulate_exposure=args.simulate_exposure
+        )
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        core.close()
+        return 1
+
+    print(f"Recording {recorder.file_path} for {args.seconds:g} s...")
+    try:
+        time.sleep(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    recorder.stop()
+    recorder.done.wait()
+    core.close()
+
+    if recorder.error:
+        print(f"Recording error: {recorder.error}")
+        return 1
+    print(
+        f"Saved video: {recorder.file_path} ({recorder.encoded} frames encoded, {recorder.duplicated} repeated, "
+        f"{recorder.dropped} dropped, {recorder.duration:.1f} s at {recorder.achieved_fps:.1f} fps)"
+    )
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+    return 0 if recorder.encoded else 1
+
+
+def run_maintenance(args):
+    core = make_core(args)
+    try:
+        if args.command == "migrate-exif":
+            # Run the migration again even if it was already marked as done
+            core.catalog.set_meta("exif_migrated", "0")
+        core.maintenance(full=getattr(args, "full", False))
+    finally:
+        core.close()
+    return 0
+
+
+def run_migrate_layout(args):
+    core = make_core(args)
+    try:
+        start = time.perf_counter()
+        moved, errors = core.migrate_layout(args.workers)
+        for path, error in errors:
+            print(f"Error moving {path}: {error}")
+        print(f"Moved {moved} files into YYYY/MM/DD folders in {time.perf_counter() - start:.1f} s.")
+    finally:
+        core.close()
+    return 1 if errors else 0
+
+
+def run_reencode(args):
+    core = make_core(args)
+    try:
+        summary, errors = core.reencode(args.encode, args.max_size, args.workers, args.include_archives)
+    finally:
+        core.close()
+    for path, error in errors:
+        print(f"Error re-encoding {path}: {error}")
+
+    old_mb = summary["old_bytes"] / 1e6
+    saved_mb = (summary["old_bytes"] - summary["new_bytes"]) / 1e6
+    seconds = max(summary["seconds"], 1e-9)
+    cpu_seconds = max(summary["cpu_seconds"], 1e-9)
+    print(
+        f"Re-encoded {summary['rewritten']} of {summary['photos']} photos as {args.encode} "
+        f"in {summary['seconds']:.1f} s on {summary['workers']} processes."
+    )
+    if summary["archives_skipped"]:
+        print(f"Skipped {summary['archives_skipped']} raw archives (use --include-archives to convert them).")
+    print(f"Saved {saved_mb:.1f} MB of {old_mb:.1f} MB ({saved_mb / old_mb if old_mb else 0:.0%}).")
+    print(
+        f"Throughput: {summary['photos'] / seconds:.1f} photos/s overall, "
+        f"{summary['photos'] / cpu_seconds:.1f} photos/s and {old_mb / cpu_seconds:.1f} MB/s per core."
+    )
+    return 1 if errors else 0
+
+
+def run_duplicates(args):
+    core = make_core(args)
+    try:
+        start = time.perf_counter()
+        hashed, errors = core.index_hashes(args.workers)
+        for path, error in errors:
+            print(f"Error hashing {path}: {error}")
+        print(f"Hashed {hashed} new or changed photos in {time.perf_counter() - start:.1f} s.")
+
+        groups = core.find_duplicates(args.max_distance)
+        extras = []
+        for group in groups:
+            print(f"{len(group)} alike, keeping {group[0]['path']}")
+            for row in group[1:]:
+                print(f"    {row['path']}")
+                extras.append(row["path"])
+        print(f"{len(groups)} groups, {len(extras)} photos could go to the recycle bin.")
+
+        if args.trash and extras:
+            operation = core.delete_photos(extras)
+            operation.done.wait()
+            for path, error in operation.errors:
+                print(f"Error moving {path}: {error}")
+            errors += operation.errors
+            print(f"Moved {len(operation.completed)} photos to the recycle bin.")
+    finally:
+        core.close()
+    return 1 if errors else 0
+
+
+def run_gui(args):
+    if tk is None:
+        print("Error: tkinter is not available, use the 'capture' command instead.")
+        return 1
     root = tk.Tk()
-    app = App(root)
+    app = App(
+        root, source=args.source, photo_dir=args.photo_dir, recycle_bin_dir=args.recycle_bin_dir,
+        thumbnail_dir=args.thumbnail_dir, storage=args.storage, storage_endpoint_url=args.s3_endpoint_url
+    )
     root.mainloop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cameraa_app", description="Tanish's Camera App")
+    # Pick the frame source with --source or CAMERA_SOURCE: a webcam index,
+    # "synthetic", an image folder or a video file
+    parser.add_argument("--source", default=os.environ.get("CAMERA_SOURCE", "0"))
+    # Folders, and where copies go, can also be set with CAMERA_* variables
+    parser.add_argument("--photo-dir", default=os.environ.get("CAMERA_PHOTO_DIR", "photos"))
+    parser.add_argument("--recycle-bin-dir", default=os.environ.get("CAMERA_RECYCLE_BIN_DIR", "recycle_bin"))
+    parser.add_argument("--thumbnail-dir", default=os.environ.get("CAMERA_THUMBNAIL_DIR", "thumbnails"))
+    parser.add_argument("--storage", default=os.environ.get("CAMERA_STORAGE"),
+                        help="also upload photos here: a folder or s3://bucket/prefix")
+    parser.add_argument("--s3-endpoint-url", default=os.environ.get("CAMERA_S3_ENDPOINT_URL"),
+                        help="S3-compatible server to use instead of AWS")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("gui", help="open the camera window (default)")
+
+    capture = commands.add_parser("capture", help="take photos without a window")
+    capture.add_argument("--iso", type=int, default=100)
+    capture.add_argument("--aperture", type=float, default=2.8)
+    capture.add_argument("--shutter", type=int, default=250, help="shutter speed as 1/N s")
+    capture.add_argument("--count", type=int, default=1)
+    capture.add_argument("--seconds", type=float, default=0, help="capture for this long instead of --count")
+    capture.add_argument("--fps", type=float, default=10)
+    capture.add_argument("--simulate-exposure", action="store_true")
+    capture.add_argument("--encode", choices=list(ENCODE_PROFILES), default=DEFAULT_ENCODE_PROFILE,
+                         help="file format and quality; raw-* keep the full frame")
+    capture.add_argument("--metrics-file", help="write Prometheus metrics here when done")
+    capture.add_argument("--profile", help="run under cProfile + tracemalloc and write the report here")
+
+    record = commands.add_parser("record", help="record a video without a window")
+    record.add_argument("--iso", type=int, default=100)
+    record.add_argument("--aperture", type=float, default=2.8)
+    record.add_argument("--shutter", type=int, default=250, help="shutter speed as 1/N s")
+    record.add_argument("--seconds", type=float, default=10)
+    record.add_argument("--fps", type=float, default=30)
+    record.add_argument("--codec", choices=list(VideoRecorder.CODECS), default="MJPG")
+    record.add_argument("--simulate-exposure", action="store_true")
+    record.add_argument("--metrics-file", help="write Prometheus metrics here when done")
+
+    migrate_layout = commands.add_parser("migrate-layout", help="move flat photo folders into YYYY/MM/DD folders")
+    migrate_layout.add_argument("--workers", type=int, default=8)
+
+    reencode = commands.add_parser("reencode", help="re-encode or shrink every photo in the gallery")
+    reencode.add_argument(
+        "--encode", choices=[name for name, profile in ENCODE_PROFILES.items() if not profile.full_resolution],
+        default=DEFAULT_ENCODE_PROFILE
+    )
+    reencode.add_argument("--max-size", type=int, help="shrink photos so neither side is larger than this")
+    reencode.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    reencode.add_argument("--include-archives", action="store_true",
+                          help="also convert raw-png/raw-npy archives (lossy for most profiles)")
+
+    duplicates = commands.add_parser("duplicates", help="hash new photos and list look-alike groups")
+    duplicates.add_argument("--max-distance", type=int, default=6,
+                            help="how many of the 64 hash bits may differ")
+    duplicates.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    duplicates.add_argument("--trash", action="store_true",
+                            help="move all but the biggest photo of each group to the recycle bin")
+
+    reconcile = commands.add_parser("reconcile", help="bring the catalog in line with the photo folders")
+    reconcile.add_argument("--full", action="store_true", help="also check known photos for edits")
+    commands.add_parser("migrate-exif", help="fold old _METADATA.txt files into EXIF")
+
+    args = parser.parse_args(argv)
+    if args.command == "capture":
+        return run_capture(args)
+    if args.command == "record":
+        return run_record(args)
+    if args.command in ("reconcile", "migrate-exif"):
+        return run_maintenance(args)
+    if args.command == "migrate-layout":
+        return run_migrate_layout(args)
+    if args.command == "reencode":
+        return run_reencode(args)
+    if args.command == "duplicates":
+        return run_duplicates(args)
+    return run_gui(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
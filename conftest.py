@@ -0,0 +1,56 @@
+"""Shared helpers for the tests. No camera or display is needed: photos
+are made with Pillow and the cores never start a capture session.
+"""
+import datetime
+import os
+import subprocess
+import sys
+import time
+
+from PIL import Image
+
+from cameraa_app import CameraCore
+
+TAKEN_AT = datetime.datetime(2024, 5, 6, 7, 8, 9, 123000)
+
+
+def save_photo(directory, name, exif=None):
+    path = os.path.join(directory, name)
+    Image.new("RGB", (64, 48), (90, 120, 150)).save(path, exif=exif or Image.Exif())
+    return path
+
+
+def make_core(root, **kwargs):
+    return CameraCore(
+        photo_dir=os.path.join(root, "photos"),
+        recycle_bin_dir=os.path.join(root, "recycle_bin"),
+        thumbnail_dir=os.path.join(root, "thumbnails"),
+        log=lambda message: None,
+        **kwargs
+    )
+
+
+def wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_sidecar(photo_path, taken_at=TAKEN_AT, iso=400, aperture=2.8, shutter=250):
+    # The text file the app used to write next to every photo
+    with open(photo_path[:-len(".jpg")] + "_METADATA.txt", "w") as f:
+        f.write(
+            "\n    Photo Metadata\n    --------------------\n"
+            f"    Timestamp: {taken_at:%Y-%m-%d %H:%M:%S}\n"
+            f"    ISO: {iso}\n    Aperture: f/{aperture}\n    Shutter Speed: 1/{shutter} s\n"
+            "    Exposure Value (EV): 10.94\n"
+        )
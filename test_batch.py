@@ -0,0 +1,103 @@
+"""Tests for batch trash operations: progress, cancelling half way and
+what the gallery shows once a batch is done.
+"""
+import os
+from types import SimpleNamespace
+
+from cameraa_app import App, BatchOperation
+from conftest import make_core, save_photo
+
+
+def make_library(root, count):
+    core = make_core(root)
+    for i in range(count):
+        save_photo(core.photo_dir, f"IMG_2024-05-06_07-08-{i:02d}-000.jpg")
+    core.maintenance()
+    return core
+
+
+def test_batch_moves_everything_and_reports_progress(tmp_path):
+    core = make_library(str(tmp_path), 5)
+    try:
+        operation = core.delete_photos(core.page(False, 0, 5))
+        assert operation.done.wait(10)
+        assert operation.error is None and operation.errors == []
+        assert (operation.processed, operation.total, len(operation.completed)) == (5, 5, 5)
+        assert (core.count(False), core.count(True)) == (0, 5)
+        assert all(os.path.exists(path) for path in core.page(True, 0, 5))
+
+        operation = core.empty_recycle_bin()
+        assert operation.done.wait(10)
+        assert (core.count(False), core.count(True)) == (0, 0)
+        assert core.journal.pending() == []
+    finally:
+        core.close()
+
+
+def test_cancelled_batch_keeps_catalog_and_files_in_step(tmp_path):
+    core = make_library(str(tmp_path), 6)
+    paths = core.page(False, 0, 6)
+    operation = BatchOperation(core, "delete", paths)
+    move_file = core._move_file
+
+    def move_then_cancel(*args):
+        # The user hits Cancel while the second photo is being moved
+        result = move_file(*args)
+        if len(operation.completed) == 1:
+            operation.cancel()
+        return result
+
+    core._move_file = move_then_cancel
+    try:
+        operation.start()
+        assert operation.done.wait(10)
+        assert (operation.processed, operation.total) == (2, 6)
+        assert operation.completed == paths[:2]
+        assert (core.count(False), core.count(True)) == (4, 2)
+        for path in paths[:2]:
+            assert not os.path.exists(path)
+            assert os.path.exists(core.catalog.location(os.path.basename(path))[0])
+        assert all(os.path.exists(path) for path in paths[2:])
+        assert core.journal.pending() == []
+    finally:
+        core.close()
+
+
+class FakeGallery:
+    def __init__(self, trashed):
+        self.trashed = trashed
+        self.window = None
+        self.closed = False
+        self.totals = []
+
+    def set_busy(self, busy):
+        pass
+
+    def reset(self, total):
+        self.totals.append(total)
+
+
+def run_batch(core, operation, gallery):
+    # App.run_batch without a window: the progress dialog finishes at once
+    def show_progress(operation, window, verb, finished):
+        operation.done.wait(10)
+        finished()
+
+    app = SimpleNamespace(core=core, log_message=lambda message: None, show_progress=show_progress)
+    App.run_batch(app, operation, gallery, "Done")
+
+
+def test_galleries_recount_their_own_view_after_a_batch(tmp_path):
+    core = make_library(str(tmp_path), 5)
+    try:
+        library, recycle_bin = FakeGallery(trashed=False), FakeGallery(trashed=True)
+        run_batch(core, core.delete_photos(core.page(False, 0, 2)), library)
+        assert library.totals == [3]
+
+        run_batch(core, core.restore_photos(core.page(True, 0, 1)), recycle_bin)
+        assert recycle_bin.totals == [1]
+
+        run_batch(core, core.delete_permanently_many(core.page(True, 0, 1)), recycle_bin)
+        assert recycle_bin.totals == [1, 0]
+    finally:
+        core.close()
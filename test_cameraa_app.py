@@ -0,0 +1,288 @@
+"""Tests for the storage side of cameraa_app: remote backends and uploads,
+re-encoding and duplicate grouping. Run with: python -m pytest -q
+
+The S3 tests run against a local moto server and are skipped when moto or
+boto3 isn't installed.
+"""
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from cameraa_app import (
+    S3Backend, Uploader, build_exif, group_duplicates, read_exif_metadata, reencode_file, signed_hash, storage_key,
+)
+from conftest import TAKEN_AT, make_core, save_photo, wait_for, write_sidecar
+
+
+# --- S3 uploads against a moto server ---
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    pytest.importorskip("boto3")
+    server_module = pytest.importorskip("moto.server")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def bucket(s3_endpoint, request):
+    name = request.node.name.replace("_", "-").lower()[:60]
+    S3Backend(name, endpoint_url=s3_endpoint).client.create_bucket(Bucket=name)
+    return name
+
+
+def test_s3_backend_put_exists_delete(tmp_path, s3_endpoint, bucket):
+    backend = S3Backend(bucket, "library", endpoint_url=s3_endpoint)
+    path = save_photo(str(tmp_path), "IMG_2024-05-06_07-08-09-123.jpg")
+    key = storage_key(os.path.basename(path), path)
+    assert key == "2024/05/06/IMG_2024-05-06_07-08-09-123.jpg"
+
+    backend.put_file(key, path)
+    assert backend.exists(key)
+    head = backend.client.head_object(Bucket=bucket, Key="library/" + key)
+    assert head["ContentLength"] == os.path.getsize(path)
+
+    backend.delete_many([key, "2024/05/06/never-uploaded.jpg"])
+    assert not backend.exists(key)
+
+
+def test_uploads_resume_and_purge_deletes_remote(tmp_path, s3_endpoint, bucket):
+    root = str(tmp_path)
+    names = [f"IMG_2024-05-06_07-08-{second:02d}-000.jpg" for second in range(5)]
+
+    # A library whose photos were never uploaded: every row is `uploaded = 0`
+    core = make_core(root)
+    for name in names:
+        save_photo(core.photo_dir, name)
+    core.maintenance()
+    assert len(core.catalog.pending_uploads()) == len(names)
+    core.close()
+
+    # The next start with storage configured picks them all up
+    core = make_core(root, storage=f"s3://{bucket}/backup", storage_endpoint_url=s3_endpoint)
+    try:
+        backend = core.uploader.backend
+        assert wait_for(lambda: not core.catalog.pending_uploads())
+        for name in names:
+            path = core.catalog.location(name)[0]
+            assert backend.exists(storage_key(name, path))
+
+        # Trash keeps the remote copy, a permanent delete removes it
+        trashed = core.delete_photo(core.catalog.location(names[0])[0])
+        assert backend.exists(storage_key(names[0], trashed))
+        core.delete_permanently(trashed)
+        purged = core.catalog.location(names[1])[0]
+        core.delete_permanently(purged)
+        assert wait_for(lambda: not backend.exists(storage_key(names[0])))
+        assert wait_for(lambda: not backend.exists(storage_key(names[1], purged)))
+        assert backend.exists(storage_key(names[2], core.catalog.location(names[2])[0]))
+    finally:
+        core.close()
+
+
+def test_failed_upload_stays_pending(tmp_path):
+    root = str(tmp_path)
+    core = make_core(root)
+    save_photo(core.photo_dir, "IMG_2024-05-06_07-08-09-000.jpg")
+    core.maintenance()
+    core.close()
+
+    # A backend folder that can't be created: the row waits for the next start
+    blocker = os.path.join(root, "not-a-folder")
+    with open(blocker, "w"):
+        pass
+    core = make_core(root, storage=blocker)
+    try:
+        assert wait_for(lambda: core.uploader.failed > 0)
+        assert len(core.catalog.pending_uploads()) == 1
+    finally:
+        core.close()
+
+
+class FlakyBackend:
+    # Fails every upload until `fail` runs out
+    def __init__(self, fail):
+        self.fail = fail
+        self.keys = []
+
+    def put_file(self, key, local_path):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("backend unavailable")
+        self.keys.append(key)
+
+    def delete_many(self, keys):
+        pass
+
+
+def test_failed_uploads_are_retried_by_the_uploader_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(Uploader, "RETRY_DELAY", 0.05)
+    monkeypatch.setattr(Uploader, "BATCH_WAIT", 0.05)
+    core = make_core(str(tmp_path))
+    names = [f"IMG_2024-05-06_07-08-{second:02d}-000.jpg" for second in range(3)]
+    for name in names:
+        save_photo(core.photo_dir, name)
+    core.maintenance()
+
+    logs = []
+    backend = FlakyBackend(fail=6)  # two whole batches
+    uploader = Uploader(backend, core.catalog, workers=2, log=logs.append)
+    threads = threading.active_count()
+    uploader.start()
+    try:
+        assert wait_for(lambda: len(backend.keys) == len(names))
+        assert wait_for(lambda: not core.catalog.pending_uploads())
+        # No thread per failure, and one line per failing batch
+        assert threading.active_count() <= threads + 3
+        assert uploader.failed == 6
+        assert len(logs) == 2
+        assert logs[0].startswith("Error uploading 3 of 3 photos")
+        assert uploader.retry_delay == Uploader.RETRY_DELAY
+    finally:
+        uploader.close()
+        core.close()
+
+
+# --- Re-encoding ---
+
+TAG_ORIENTATION, TAG_MAKE = 0x0112, 0x010F
+
+
+def camera_exif():
+    exif = build_exif(TAKEN_AT, 800, 2.8, 250)
+    exif[TAG_ORIENTATION] = 6
+    exif[TAG_MAKE] = "SomeCam"
+    return exif
+
+
+@pytest.mark.parametrize("profile", ["jpeg-web", "webp", "png"])
+def test_reencode_keeps_original_exif_without_catalog_settings(tmp_path, profile):
+    path = save_photo(str(tmp_path), "photo.jpg", exif=camera_exif())
+    new_path = reencode_file(path, profile, max_size=32, settings=(TAKEN_AT.timestamp(), None, None, None))[0]
+
+    with Image.open(new_path) as img:
+        exif = img.getexif()
+        assert img.size == (32, 24)
+    assert exif[TAG_ORIENTATION] == 6
+    assert exif[TAG_MAKE] == "SomeCam"
+    assert read_exif_metadata(new_path)["iso"] == 800
+
+
+def test_reencode_merges_catalog_settings_into_original_exif(tmp_path):
+    path = save_photo(str(tmp_path), "photo.jpg", exif=camera_exif())
+    new_path = reencode_file(path, "webp", settings=(TAKEN_AT.timestamp(), 1600, 4.0, 60))[0]
+
+    with Image.open(new_path) as img:
+        exif = img.getexif()
+    assert exif[TAG_ORIENTATION] == 6
+    assert exif[TAG_MAKE] == "SomeCam"
+    metadata = read_exif_metadata(new_path)
+    assert (metadata["iso"], metadata["aperture"], metadata["shutter"]) == (1600, 4.0, 60)
+
+
+def test_reencode_skips_raw_archives_unless_asked(tmp_path):
+    root = str(tmp_path)
+    core = make_core(root)
+    photo = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-09-000.jpg", exif=camera_exif())
+    archive = os.path.join(core.photo_dir, "IMG_2024-05-06_07-08-10-000.png")
+    Image.new("RGB", (1280, 720)).save(archive, exif=camera_exif())
+    np.save(os.path.join(core.photo_dir, "IMG_2024-05-06_07-08-11-000.npy"), np.zeros((720, 1280, 3), np.uint8))
+    core.maintenance()
+    try:
+        summary, errors = core.reencode("webp", workers=1)
+        assert errors == []
+        assert (summary["photos"], summary["archives_skipped"], summary["rewritten"]) == (1, 2, 1)
+        assert not os.path.exists(photo) and os.path.exists(archive)
+
+        summary, errors = core.reencode("webp", workers=1, include_archives=True)
+        assert errors == []
+        assert (summary["photos"], summary["archives_skipped"]) == (3, 0)
+        assert sorted(os.path.splitext(row["name"])[1] for row in core.catalog.page(False, 10)) == [".webp"] * 3
+    finally:
+        core.close()
+
+
+# --- Duplicate grouping ---
+
+def hash_row(ahash, dhash, index):
+    return {"ahash": signed_hash(ahash), "dhash": signed_hash(dhash), "size": index, "taken_at": index}
+
+
+def test_group_duplicates_joins_a_long_burst():
+    # Thousands of shots under the same chunk keys, each a few bits off
+    ahash, dhash = 0x0123456789ABCDEF, 0xFEDCBA9876543210
+    rows = [
+        hash_row(ahash ^ (1 << (i % 64)) ^ (1 << (i * 7 % 64)), dhash ^ (1 << (i * 3 % 64)), i)
+        for i in range(5000)
+    ]
+    rows.append(hash_row(~ahash & (2 ** 64 - 1), dhash, 5000))  # same dHash, different picture
+    groups = group_duplicates(rows)
+    assert len(groups) == 1
+    assert len(groups[0]) == 5000
+    assert groups[0][0]["size"] == 4999  # biggest file first
+
+
+def test_group_duplicates_follows_chains_and_keeps_strangers_apart():
+    base = 0x0F0F0F0F0F0F0F0F
+    # 0 -> 1 -> 2 are each 6 bits apart, 0 and 2 are 12 apart
+    chain = [base, base ^ 0x3F, base ^ 0xFFF]
+    rows = [hash_row(value, value, i) for i, value in enumerate(chain)]
+    rows.append(hash_row(base ^ 0xFFFF << 32, base, 3))
+    groups = group_duplicates(rows, max_distance=6)
+    assert [sorted(row["taken_at"] for row in group) for group in groups] == [[0, 1, 2]]
+
+
+# --- Date-sharded layout ---
+
+def test_migrate_layout_keeps_legacy_sidecars(tmp_path):
+    root = str(tmp_path)
+    core = make_core(root)
+    migrated = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-09.jpg")
+    write_sidecar(migrated, iso=800)
+    partial = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-10.jpg")
+    with open(partial[:-len(".jpg")] + "_METADATA.txt", "w") as f:
+        f.write("ISO: 100\n")
+    try:
+        moved, errors = core.migrate_layout()
+        assert (moved, errors) == (2, [])
+        core.maintenance()
+
+        # Folded into EXIF before the move...
+        path, _ = core.catalog.location(os.path.basename(migrated))
+        assert path == os.path.join(core.photo_dir, "2024", "05", "06", os.path.basename(migrated))
+        assert read_exif_metadata(path)["iso"] == 800
+        assert core.catalog.page(False, 10)[-1]["iso"] == 800
+        # ...or moved along with its photo, and not taken for an orphan
+        path, _ = core.catalog.location(os.path.basename(partial))
+        assert os.path.exists(path[:-len(".jpg")] + "_METADATA.txt")
+        assert not os.path.exists(partial[:-len(".jpg")] + "_METADATA.txt")
+    finally:
+        core.close()
+
+
+def test_sidecar_left_behind_by_an_interrupted_migration(tmp_path):
+    core = make_core(str(tmp_path))
+    try:
+        core.catalog.set_meta("exif_migrated", "1")
+        name = "IMG_2024-05-06_07-08-09.jpg"
+        photo = save_photo(core.store.path_for(name)[:-len(name)], name)
+        sidecar = os.path.join(core.photo_dir, "IMG_2024-05-06_07-08-09_METADATA.txt")
+        with open(sidecar, "w") as f:
+            f.write("ISO: 100\n")
+        core.maintenance()
+        assert os.path.exists(sidecar)
+
+        core.migrate_layout()
+        assert not os.path.exists(sidecar)
+        assert os.path.exists(photo[:-len(".jpg")] + "_METADATA.txt")
+    finally:
+        core.close()
@@ -0,0 +1,125 @@
+"""Tests for the long-lived capture session and the synthetic frame source."""
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+
+from cameraa_app import CaptureJob, CaptureSession, SyntheticSource, make_frame_source
+from conftest import make_core, wait_for
+
+
+class CountingSource(SyntheticSource):
+    # A SyntheticSource that counts how often it is opened and released
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.released = False
+
+    def isOpened(self):
+        CountingSource.opened += 1
+        time.sleep(0.05)  # a slow device makes racing starts likely
+        return True
+
+    def release(self):
+        self.released = True
+
+
+class ClosedSource(SyntheticSource):
+    def isOpened(self):
+        return False
+
+
+def test_synthetic_source_paces_and_moves():
+    source = SyntheticSource(64, 48, fps=50)
+    start = time.perf_counter()
+    frames = [source.read()[1] for _ in range(11)]
+    assert time.perf_counter() - start >= 0.18
+    assert frames[0].shape == (48, 64, 3) and frames[0].dtype == np.uint8
+    assert not np.array_equal(frames[0], frames[1])  # the bar moved
+    assert isinstance(make_frame_source("synthetic"), SyntheticSource)
+
+
+def test_session_keeps_the_newest_frames():
+    session = CaptureSession(SyntheticSource(64, 48, fps=100), buffer_size=4)
+    assert session.start()
+    try:
+        first = session.latest()
+        assert first is not None
+        newer = session.wait_for_frame(first[0])
+        assert newer[0] > first[0] and newer[1] >= first[1]
+        time.sleep(0.1)
+        assert len(session.frames) == 4
+        assert [item[0] for item in session.frames] == list(range(session.frames[0][0], session.frames[0][0] + 4))
+    finally:
+        session.stop()
+    assert not session.running and session.latest(timeout=0.1) is None
+
+
+def test_concurrent_starts_open_the_device_once():
+    CountingSource.opened = 0
+    source = CountingSource(64, 48, fps=100)
+    session = CaptureSession(source)
+    barrier = threading.Barrier(8)
+    results = []
+    grabbers = sum(thread.name == "frame-grabber" for thread in threading.enumerate())
+
+    def start():
+        barrier.wait()
+        results.append(session.start())
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert results == [True] * 8
+        assert CountingSource.opened == 1
+        assert sum(thread.name == "frame-grabber" for thread in threading.enumerate()) == grabbers + 1
+    finally:
+        session.stop()
+    assert source.released and session.thread is None
+
+
+def test_session_reports_a_source_that_does_not_open():
+    session = CaptureSession(ClosedSource(64, 48))
+    assert not session.start()
+    assert "Could not open frame source" in session.error
+    assert not session.running and session.source is None
+
+
+def test_jobs_in_the_same_millisecond_get_different_names():
+    now = datetime.datetime(2024, 5, 6, 7, 8, 9, 123000)
+    names = []
+
+    def make_jobs():
+        names.extend(CaptureJob(100, 2.8, 60, now=now).filename for _ in range(500))
+
+    threads = [threading.Thread(target=make_jobs) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == len(names) == 2000
+
+
+def test_concurrent_bursts_and_shots_keep_every_photo(tmp_path):
+    core = make_core(str(tmp_path), source=SyntheticSource(320, 240, fps=100))
+    assert core.start()
+    try:
+        bursts = [core.burst(100, 2.8, 60, count=10, fps=50) for _ in range(2)]
+        shots = sum(bool(core.capture(100, 2.8, 60)) for _ in range(5))
+        assert all(burst.done.wait(timeout=10) for burst in bursts)
+        expected = shots + sum(burst.captured for burst in bursts)
+
+        jobs = []
+        assert wait_for(lambda: jobs.extend(core.poll_results()) or len(jobs) == expected)
+        assert [job.error for job in jobs] == [None] * expected
+        assert len({job.file_path for job in jobs}) == expected
+        assert all(os.path.exists(job.file_path) for job in jobs)
+        assert core.catalog.count(False) == expected
+    finally:
+        core.close()
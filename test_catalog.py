@@ -0,0 +1,94 @@
+"""Tests for the SQLite photo catalog and its incremental reconcile."""
+import os
+
+import pytest
+from PIL import Image
+
+import cameraa_app
+from cameraa_app import PhotoCatalog
+from conftest import save_photo
+
+
+@pytest.fixture
+def library(tmp_path):
+    photo_dir, recycle_bin_dir = str(tmp_path / "photos"), str(tmp_path / "recycle_bin")
+    os.makedirs(photo_dir)
+    os.makedirs(recycle_bin_dir)
+    catalog = PhotoCatalog(str(tmp_path / "catalog.db"))
+    yield catalog, photo_dir, recycle_bin_dir
+    catalog.close()
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    # Every photo reconcile opens to read its metadata
+    paths = []
+    read_exif_metadata = cameraa_app.read_exif_metadata
+
+    def counting(path):
+        paths.append(path)
+        return read_exif_metadata(path)
+
+    monkeypatch.setattr(cameraa_app, "read_exif_metadata", counting)
+    return paths
+
+
+def test_reconcile_follows_added_removed_and_trashed_photos(library, reads):
+    catalog, photo_dir, recycle_bin_dir = library
+    paths = [save_photo(photo_dir, f"IMG_2024-05-06_07-08-{second:02d}.jpg") for second in range(3)]
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (3, 0, 0)
+    assert len(reads) == 3
+
+    # Nothing changed: nothing is read again
+    reads.clear()
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (0, 0, 0)
+    assert reads == []
+
+    os.remove(paths[0])
+    trashed = os.path.join(recycle_bin_dir, os.path.basename(paths[1]))
+    os.replace(paths[1], trashed)
+    new = save_photo(photo_dir, "IMG_2024-05-06_07-08-10.jpg")
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (1, 1, 1)
+    assert sorted(reads) == sorted([trashed, new])
+    assert catalog.location(os.path.basename(paths[0])) is None
+    assert catalog.location(os.path.basename(trashed)) == (trashed, True)
+    assert (catalog.count(), catalog.count(trashed=True)) == (2, 1)
+
+
+def test_reconcile_finds_photos_edited_in_place_only_when_full(library, reads):
+    catalog, photo_dir, recycle_bin_dir = library
+    path = save_photo(photo_dir, "IMG_2024-05-06_07-08-09.jpg")
+    catalog.reconcile(photo_dir, recycle_bin_dir)
+
+    Image.new("RGB", (640, 480), (1, 2, 3)).save(path)
+    reads.clear()
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (0, 0, 0)
+    assert reads == []
+    assert catalog.reconcile(photo_dir, recycle_bin_dir, full=True) == (0, 1, 0)
+    assert reads == [path]
+    assert catalog.page(False, 1)[0]["size"] == os.path.getsize(path)
+
+
+def test_reconcile_skips_unchanged_day_folders(library, monkeypatch):
+    catalog, photo_dir, recycle_bin_dir = library
+    day = os.path.join(photo_dir, "2024", "05", "06")
+    os.makedirs(day)
+    save_photo(day, "IMG_2024-05-06_07-08-09.jpg")
+    catalog.reconcile(photo_dir, recycle_bin_dir)
+
+    listed = []
+    scandir = os.scandir
+
+    def counting(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting)
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (0, 0, 0)
+    assert day not in listed
+    assert catalog.count() == 1
+
+    # A new photo changes the folder's mtime, so it is listed again
+    save_photo(day, "IMG_2024-05-06_07-08-10.jpg")
+    assert catalog.reconcile(photo_dir, recycle_bin_dir) == (1, 0, 0)
+    assert day in listed
@@ -0,0 +1,63 @@
+"""Tests for capture settings stored as EXIF: written with build_exif and
+embed_exif, read back from the file header by read_exif_metadata.
+"""
+import os
+
+import pytest
+from PIL import Image
+
+from cameraa_app import build_exif, embed_exif, migrate_sidecars, read_exif_metadata
+from conftest import TAKEN_AT, save_photo, write_sidecar
+
+
+def test_exif_round_trip_jpeg(tmp_path):
+    path = save_photo(str(tmp_path), "photo.jpg")
+    embed_exif(path, build_exif(TAKEN_AT, 800, 2.8, 250))
+
+    metadata = read_exif_metadata(path)
+    assert metadata["taken_at"] == pytest.approx(TAKEN_AT.timestamp(), abs=0.001)
+    assert metadata["iso"] == 800
+    assert metadata["aperture"] == 2.8
+    assert metadata["shutter"] == 250
+    assert "ev" in metadata
+    assert (metadata["width"], metadata["height"]) == (64, 48)
+    with Image.open(path) as img:
+        assert img.size == (64, 48)
+
+    # Embedding again swaps the block instead of adding a second one
+    embed_exif(path, build_exif(TAKEN_AT, 100, 4.0, 60))
+    with open(path, "rb") as f:
+        assert f.read().count(b"Exif\x00\x00") == 1
+    assert read_exif_metadata(path)["iso"] == 100
+
+
+@pytest.mark.parametrize("extension", [".png", ".webp"])
+def test_exif_round_trip_other_formats(tmp_path, extension):
+    path = save_photo(str(tmp_path), "photo" + extension, exif=build_exif(TAKEN_AT, 400, 5.6, 125))
+    metadata = read_exif_metadata(path)
+    assert metadata["iso"] == 400
+    assert metadata["aperture"] == 5.6
+    assert metadata["shutter"] == 125
+    assert (metadata["width"], metadata["height"]) == (64, 48)
+
+
+def test_embed_exif_rejects_non_jpeg(tmp_path):
+    path = save_photo(str(tmp_path), "photo.png")
+    with pytest.raises(ValueError):
+        embed_exif(path, build_exif(TAKEN_AT, 400, 2.8, 250))
+
+
+def test_migrate_sidecars_moves_settings_into_exif(tmp_path):
+    photo = save_photo(str(tmp_path), "IMG_2024-05-06_07-08-09.jpg")
+    write_sidecar(photo)
+    incomplete = save_photo(str(tmp_path), "IMG_2024-05-06_07-08-10.jpg")
+    with open(incomplete[:-len(".jpg")] + "_METADATA.txt", "w") as f:
+        f.write("ISO: 100\n")
+
+    assert migrate_sidecars([str(tmp_path)]) == 1
+    metadata = read_exif_metadata(photo)
+    assert (metadata["iso"], metadata["aperture"], metadata["shutter"]) == (400, 2.8, 250)
+    assert metadata["taken_at"] == TAKEN_AT.replace(microsecond=0).timestamp()
+    assert not os.path.exists(photo[:-len(".jpg")] + "_METADATA.txt")
+    # Not enough to go on: the sidecar stays for the catalog to read
+    assert os.path.exists(incomplete[:-len(".jpg")] + "_METADATA.txt")
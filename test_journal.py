@@ -0,0 +1,77 @@
+"""Tests for the trash journal: interrupted operations are rolled forward
+on the next start, and only once their process is gone.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import dead_pid, make_core, save_photo
+
+
+def write_journal(core, records):
+    with open(core.journal.path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def test_replay_journal_finishes_interrupted_moves(tmp_path):
+    root = str(tmp_path)
+    core = make_core(root)
+    moved = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-09-000.jpg")
+    purged = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-10-000.jpg")
+    kept = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-11-000.jpg")
+    core.maintenance()
+    moved_target = core.store.path_for(os.path.basename(moved), True)
+    core.close()
+
+    # A crashed process trashed one photo and purged another; the
+    # delete of a third never got as far as the journal
+    pid = dead_pid()
+    write_journal(core, [
+        {"id": f"{pid}-0-1", "action": "delete", "moves": [[moved, moved_target]]},
+        {"id": f"{pid}-0-2", "action": "purge", "moves": [[purged, None]]},
+        {"id": f"{pid}-0-3", "action": "delete", "moves": [[kept, kept + ".x"]]},
+        {"id": f"{pid}-0-3", "done": True},
+    ])
+
+    core = make_core(root)
+    try:
+        assert not os.path.exists(moved) and os.path.exists(moved_target)
+        assert core.catalog.location(os.path.basename(moved)) == (moved_target, True)
+        assert not os.path.exists(purged)
+        assert core.catalog.location(os.path.basename(purged)) is None
+        assert os.path.exists(kept)
+        assert core.journal.pending() == []
+        assert core.replay_journal() == 0
+    finally:
+        core.close()
+
+
+def test_replay_journal_leaves_live_processes_alone(tmp_path):
+    root = str(tmp_path)
+    core = make_core(root)
+    path = save_photo(core.photo_dir, "IMG_2024-05-06_07-08-09-000.jpg")
+    target = core.store.path_for(os.path.basename(path), True)
+    core.close()
+
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        write_journal(core, [{"id": f"{live.pid}-0-1", "action": "delete", "moves": [[path, target]]}])
+        core = make_core(root)
+        assert os.path.exists(path) and not os.path.exists(target)
+
+        # Our own operations finishing must not drop the other process' record
+        op_id = core.journal.begin("delete", [])
+        core.journal.finish(op_id)
+        assert [operation["id"] for operation in core.journal.pending()] == [f"{live.pid}-0-1"]
+    finally:
+        live.kill()
+        live.wait()
+
+    try:
+        assert core.replay_journal() == 1
+        assert os.path.exists(target) and not os.path.exists(path)
+        assert core.journal.pending() == []
+    finally:
+        core.close()
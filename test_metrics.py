@@ -0,0 +1,92 @@
+"""Tests for the metrics and the on-demand profiler."""
+import threading
+
+import cameraa_app
+from cameraa_app import Profiler
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+def test_profiler_sections_on_two_threads_at_once(tmp_path):
+    profiler = Profiler()
+    profiler.start()
+    both_inside = threading.Barrier(2, timeout=10)
+    errors = []
+
+    def work():
+        try:
+            with profiler.section():
+                both_inside.wait()
+                busy_work()
+                both_inside.wait()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = profiler.stop(str(tmp_path / "profile.txt"))
+
+    assert errors == []
+    with open(report) as f:
+        text = f.read()
+    assert "busy_work" in text
+    assert "tracemalloc" in text
+
+
+def test_profiler_section_runs_when_profiling_is_taken(tmp_path, monkeypatch):
+    class TakenProfile:
+        # What cProfile does from 3.12 when another profiler is active
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+        def disable(self):
+            pass
+
+    monkeypatch.setattr(cameraa_app.cProfile, "Profile", TakenProfile)
+    profiler = Profiler()
+    profiler.start()
+    with profiler.section():
+        result = busy_work()
+    assert result == busy_work()
+    assert profiler.stop(str(tmp_path / "profile.txt"))
+
+
+def test_prometheus_text_exports_counters_and_histograms(tmp_path):
+    metrics = cameraa_app.Metrics()
+    metrics.inc("camera_photos_saved_total")
+    metrics.inc("camera_photos_saved_total", 2)
+    for seconds in (0.0004, 0.0005, 0.003, 0.2, 45.0):
+        metrics.observe("camera_capture_seconds", seconds)
+
+    lines = metrics.prometheus_text().splitlines()
+    assert "# TYPE camera_photos_saved_total counter" in lines
+    assert "camera_photos_saved_total 3" in lines
+    assert "# TYPE camera_capture_seconds histogram" in lines
+    buckets = {
+        line.split('"')[1]: int(line.split()[-1])
+        for line in lines if line.startswith("camera_capture_seconds_bucket")
+    }
+    # Cumulative, upper bounds inclusive, everything slower than 30 s only in +Inf
+    assert buckets["0.0005"] == 2
+    assert buckets["0.005"] == 3
+    assert buckets["0.25"] == 4
+    assert buckets["30.0"] == 4
+    assert buckets["+Inf"] == 5
+    assert list(buckets.values()) == sorted(buckets.values())
+    assert "camera_capture_seconds_count 5" in lines
+    assert "camera_capture_seconds_sum 45.203900" in lines
+
+    # The stats panel still gets recent percentiles in milliseconds
+    p50, p95, p99 = metrics.summary("camera_capture_seconds")
+    assert p50 == 3.0 and p99 == 45000.0
+    assert metrics.summary("camera_unknown_seconds") is None
+
+    path = str(tmp_path / "metrics.prom")
+    metrics.write_prometheus(path)
+    with open(path) as f:
+        assert f.read() == metrics.prometheus_text()
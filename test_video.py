@@ -0,0 +1,34 @@
+"""Tests for VideoRecorder: the file plays back at the recording's real speed."""
+import time
+
+import cv2
+import pytest
+
+from cameraa_app import SyntheticSource
+from conftest import make_core
+
+
+@pytest.mark.parametrize("camera_fps", [10, 60])
+def test_video_holds_the_target_fps(tmp_path, camera_fps):
+    core = make_core(str(tmp_path), source=SyntheticSource(640, 480, fps=camera_fps))
+    assert core.start()
+    try:
+        recorder = core.record(100, 2.8, 60, fps=30)
+        time.sleep(1.5)
+        recorder.stop()
+        assert recorder.done.wait(timeout=10)
+    finally:
+        core.close()
+    assert recorder.error is None
+
+    video = cv2.VideoCapture(recorder.file_path)
+    frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    assert video.get(cv2.CAP_PROP_FPS) == pytest.approx(30)
+    video.release()
+    # One frame per 1/30 s of what was recorded, however fast the camera was
+    assert frames == recorder.written
+    assert abs(frames - (recorder.duration * 30 + 1)) <= 1
+    if camera_fps < 30:
+        assert recorder.duplicated >= frames // 2
+    else:
+        assert recorder.duplicated <= 1